@@ -152,6 +152,10 @@ def create_app(config_name='development'):
     cors.init_app(app)
     migrate.init_app(app, db)
     bcrypt.init_app(app)
+
+    # Services are built once per worker process and shared by requests
+    from app.services.registry import service_registry
+    service_registry.init_app(app)
     
     # Register blueprints
    
@@ -160,12 +164,14 @@ def create_app(config_name='development'):
     from app.api.chat import chat_bp
     from app.api.weather import weather_bp
     from app.api.grievances import grievances_bp
+    from app.api.metrics import metrics_bp
     
     app.register_blueprint(chat_bp, url_prefix='/api/chat')
     app.register_blueprint(weather_bp, url_prefix='/api/weather')
     app.register_blueprint(grievances_bp, url_prefix='/api/grievances')
     app.register_blueprint(health_bp,url_prefix='/api')
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
 
     
     # Health check route
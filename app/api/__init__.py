@@ -4,5 +4,6 @@ from app.api.chat import chat_bp
 from app.api.grievances import grievances_bp
 from app.api.blog import blog_bp
 from app.api.policies import policies_bp
+from app.api.metrics import metrics_bp
 
-__all__ = ['auth_bp', 'weather_bp', 'chat_bp', 'grievances_bp', 'blog_bp', 'policies_bp']
+__all__ = ['auth_bp', 'weather_bp', 'chat_bp', 'grievances_bp', 'blog_bp', 'policies_bp', 'metrics_bp']
@@ -4,6 +4,7 @@ from app.extensions import db
 from app.models.user import User
 from app.utils.validators import validate_email, validate_password
 from app.tasks.email_tasks import send_welcome_email
+from app.utils.cache import cache
 import logging
 from app.extensions import db
 
@@ -54,7 +55,7 @@ def register():
         db.session.commit()
         
         # Send welcome email asynchronously
-        send_welcome_email.delay(user.email, user.name)
+        send_welcome_email.delay(user.email, user.name, user.preferred_language)
         
         # Create access token
         access_token = user.get_token()
@@ -142,6 +143,9 @@ def update_profile():
         
         db.session.commit()
         
+        # Cached responses were built from the old language and location
+        cache.invalidate_tags(f"user:{user_id}")
+        
         logger.info(f"Profile updated for user: {user.email}")
         
         return jsonify({
@@ -10,7 +10,7 @@ logger = logging.getLogger(__name__)
 
 @blog_bp.route('/', methods=['GET'])
 @jwt_required()
-@cache_response(timeout=3600)  # Cache for 1 hour
+@cache_response(timeout=3600, tags=['blog'])  # Cache for 1 hour
 def get_blog_posts():
     try:
         user_id = get_jwt_identity()
@@ -24,6 +24,8 @@ def get_blog_posts():
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 10, type=int), 50)
         
+        # Posts are written per language and filtered on it, so unlike policies and alerts
+        # the list is already in the reader's language and needs no translate_records pass
         query = BlogPost.query.filter_by(language=language, is_published=True)
         
         if category:
@@ -1,12 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.extensions import db
 from app.models.user import User
 from app.models.chat import ChatSession
-from app.services import AIService
-from app.services.translation_service import TranslationService
-from app.services.audio_service import AudioService
+from app.services.chat_history import chat_history
+from app.services.chat_job_service import chat_jobs
+from app.services.language_id import resolve_languages
+from app.services.registry import get_service
+from app.services.tts_cache import tts_cache
+from app.utils.audio_stream import BINARY_STREAM_FORMATS, iter_binary_audio, iter_multipart_audio
+from app.utils.concurrency import LLMBusyError
 from datetime import datetime
+from urllib.parse import quote
+import base64
+import itertools
 import uuid #Universally Unique Identifier
 import logging #-  logs generate karne ke liye use hota hai.
 
@@ -14,6 +21,102 @@ import logging #-  logs generate karne ke liye use hota hai.
 chat_bp = Blueprint('chat', __name__)
 logger = logging.getLogger(__name__)
 
+def _busy_response(error: LLMBusyError):
+    """429 with backpressure hints when the LLM queue is saturated"""
+    response = jsonify({
+        'error': 'Advisor is busy, please retry shortly',
+        'retry_after': error.retry_after,
+        'queue_position': error.queue_position
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+def _flag(value) -> bool:
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def _clip_url(clip) -> str:
+    return f"/api/chat/audio/{clip['key']}"
+
+# Proxies reject oversized response headers (nginx's proxy_buffer_size is 4-8 KB), so a
+# reply's text only ever appears there as a short preview
+HEADER_TEXT_LIMIT = 256
+
+def _header_text(text: str, limit: int = HEADER_TEXT_LIMIT) -> str:
+    """URL-quoted text cut to at most limit bytes without splitting a character"""
+    encoded = quote(text or '')
+    while len(encoded) > limit:
+        text = text[:len(text) * limit // len(encoded)]
+        encoded = quote(text)
+    return encoded
+
+def _stream_audio(user_id, metadata: dict, clips, mode: str):
+    """Send the reply audio as it is synthesized, sentence by sentence"""
+    headers = {'X-Accel-Buffering': 'no', 'Cache-Control': 'no-store'}
+    
+    # Binary mode: the first sentence decides the stream format
+    if mode == 'binary':
+        first_clip = next(clips, None)
+        if first_clip is None:
+            return jsonify(dict(metadata, error='Could not synthesize audio')), 500
+        # Chained Ogg streams stop playing after the first clip; send Opus as separate parts
+        if first_clip['format'] not in BINARY_STREAM_FORMATS:
+            mode, clips = 'multipart', itertools.chain([first_clip], clips)
+    
+    if mode == 'multipart':
+        boundary = uuid.uuid4().hex
+        return Response(
+            iter_multipart_audio(metadata, clips, boundary, _clip_url),
+            mimetype=f"multipart/mixed; boundary={boundary}",
+            headers=headers
+        )
+    
+    # The full text is kept as a completed job clients fetch from /api/chat/jobs/<id>;
+    # headers only carry a preview
+    headers.update({
+        'X-Session-Id': metadata['session_id'],
+        'X-Language': metadata['language'],
+        'X-Source': metadata['source'],
+        'X-Text-Message': _header_text(metadata['text_message']),
+        'X-Text-Response': _header_text(metadata['text_response'])
+    })
+    try:
+        reply_id = chat_jobs.create(user_id, 'audio_reply', **metadata)
+        chat_jobs.update(reply_id, status='completed', stage='completed')
+        headers['X-Reply-Id'] = reply_id
+    except Exception as e:
+        logger.error(f"Audio reply store error: {str(e)}")
+    
+    return Response(iter_binary_audio(first_clip, clips), mimetype=first_clip['mimetype'], headers=headers)
+
+def _submit_chat_job(user, kind: str, language: str, session_id: str, message: str = None,
+                     audio_bytes: bytes = None, noise_profile: str = None):
+    """Queue the chat pipeline on Celery and answer 202 with the job ID"""
+    from app.tasks.chat_tasks import build_chat_pipeline
+    
+    job_id = chat_jobs.create(user.id, kind, session_id=session_id, language=language)
+    if audio_bytes is not None:
+        chat_jobs.store_audio(job_id, audio_bytes)
+    
+    build_chat_pipeline({
+        'job_id': job_id,
+        'kind': kind,
+        'user_id': user.id,
+        'user_location': user.location,
+        'session_id': session_id,
+        'language': language,
+        'message': message,
+        'noise_profile': noise_profile
+    }).apply_async()
+    
+    response = jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'session_id': session_id,
+        'status_url': f"/api/chat/jobs/{job_id}"
+    })
+    response.headers['Retry-After'] = str(chat_jobs.retry_after)
+    return response, 202
+
 @chat_bp.route('/', methods=['POST'])
 @jwt_required()  #authenticated user hi access kar sake.
 
@@ -33,6 +136,12 @@ def text_chat():
         if not message:
             return jsonify({'error': 'Message is required'}), 400
         
+        # The script the message is written in beats the client-supplied language
+        message_language, language = resolve_languages(message, language)
+        
+        if _flag(data.get('async')):
+            return _submit_chat_job(user, 'text', language, session_id, message=message)
+        
         # Get or create chat session
         chat_session = ChatSession.query.filter_by(
             user_id=user_id, 
@@ -48,24 +157,26 @@ def text_chat():
             db.session.add(chat_session)
         
         # Process message through AI service
-        ai_service = AIService()
-        translation_service = TranslationService()
+        ai_service = get_service('ai')
+        translation_service = get_service('translation')
         
         # Translate to English if needed
-        if language != 'en':
-            english_message = translation_service.translate(message, 'en', language)
+        if message_language != 'en':
+            english_message = translation_service.translate(message, 'en', message_language)
         else:
             english_message = message
         
-        # Get AI response
-        ai_response = ai_service.get_response(
+        # Get AI response (history is trimmed to the prompt token budget)
+        ai_result = ai_service.get_response_with_usage(
             english_message, 
             context={
+                'user_id': user_id,
                 'user_location': user.location,
                 'language': language,
-                'chat_history': chat_session.get_messages()[-5:]  # Last 5 messages for context
+                'chat_history': chat_history.recent(chat_session, ai_service.prompt_builder.max_history)
             }
         )
+        ai_response = ai_result['response']
         
         # Translate response back if needed
         if language != 'en':
@@ -74,16 +185,23 @@ def text_chat():
             translated_response = ai_response
         
         # Save to chat session
-        chat_session.add_message(message, translated_response)
+        exchange = chat_session.add_message(message, translated_response)
         db.session.commit()
+        chat_history.append(chat_session, exchange)
         
         return jsonify({
             'response': translated_response,
             'session_id': session_id,
             'language': language,
+            'source': ai_result['source'],
+            'prompt_tokens': ai_result['prompt_tokens'],
             'timestamp': datetime.utcnow().isoformat()
         }), 200
         
+    except LLMBusyError as e:
+        db.session.rollback()
+        return _busy_response(e)
+        
     except Exception as e:
         logger.error(f"Text chat error: {str(e)}")
         db.session.rollback()
@@ -105,37 +223,43 @@ def audio_chat():
         audio_file = request.files['audio']
         language = request.form.get('language', user.preferred_language)
         session_id = request.form.get('session_id', f"session_{user_id}_{uuid.uuid4().hex[:8]}")
+        # Background noise is learned per phone when the client identifies it, else per session
+        noise_profile = request.form.get('device_id') or session_id
+        
+        if _flag(request.form.get('async')):
+            return _submit_chat_job(user, 'audio', language, session_id,
+                                    audio_bytes=audio_file.read(), noise_profile=noise_profile)
         
         # Initialize services
-        audio_service = AudioService()
-        ai_service = AIService()
-        translation_service = TranslationService()
+        audio_service = get_service('audio')
+        ai_service = get_service('ai')
+        translation_service = get_service('translation')
         
         # Convert audio to text
-        text_message = audio_service.speech_to_text(audio_file, language)
+        transcript = audio_service.transcribe(audio_file, language, noise_profile)
         
-        if not text_message:
+        if not transcript:
             return jsonify({'error': 'Could not process audio'}), 400
+        text_message = transcript['text']
         
         # Process through AI (similar to text chat)
-        if language != 'en':
-            english_message = translation_service.translate(text_message, 'en', language)
+        message_language, language = resolve_languages(text_message, language)
+        if message_language != 'en':
+            english_message = translation_service.translate(text_message, 'en', message_language)
         else:
             english_message = text_message
         
-        ai_response = ai_service.get_response(
+        ai_result = ai_service.get_response_with_usage(
             english_message,
-            context={'user_location': user.location, 'language': language}
+            context={'user_id': user_id, 'user_location': user.location, 'language': language}
         )
+        ai_response = ai_result['response']
         
         if language != 'en':
             translated_response = translation_service.translate(ai_response, language, 'en')
         else:
             translated_response = ai_response
         
-        # Convert response to audio
-        audio_response = audio_service.text_to_speech(translated_response, language)
-        
         # Save chat session
         chat_session = ChatSession.query.filter_by(
             user_id=user_id, 
@@ -150,22 +274,80 @@ def audio_chat():
             )
             db.session.add(chat_session)
         
-        chat_session.add_message(text_message, translated_response)
+        exchange = chat_session.add_message(text_message, translated_response)
         db.session.commit()
+        chat_history.append(chat_session, exchange)
         
-        return jsonify({
+        result = {
             'text_message': text_message,
+            'transcript_segments': transcript['segments'],
             'text_response': translated_response,
-            'audio_response': audio_response,
             'session_id': session_id,
-            'language': language
-        }), 200
+            'language': language,
+            'source': ai_result['source'],
+            'prompt_tokens': ai_result['prompt_tokens']
+        }
+        
+        # binary / multipart start sending audio before the whole reply is synthesized
+        response_mode = request.form.get('response_mode', 'json')
+        if response_mode in ('binary', 'multipart'):
+            return _stream_audio(user_id, result, audio_service.iter_clips(translated_response, language), response_mode)
+        
+        # Convert response to audio; clients fetch the cached clip by URL
+        clip = audio_service.synthesize_clip(translated_response, language)
+        result['audio_url'] = _clip_url(clip) if clip else None
+        result['audio_format'] = clip['format'] if clip else None
+        
+        # Older clients can still ask for the clip inline as base64
+        if clip and _flag(request.form.get('inline_audio')):
+            with open(clip['path'], 'rb') as audio:
+                result['audio_response'] = base64.b64encode(audio.read()).decode('ascii')
+        
+        return jsonify(result), 200
+        
+    except LLMBusyError as e:
+        db.session.rollback()
+        return _busy_response(e)
         
     except Exception as e:
         logger.error(f"Audio chat error: {str(e)}")
         db.session.rollback()
         return jsonify({'error': 'Audio chat service error'}), 500
 
+@chat_bp.route('/audio/<key>', methods=['GET'])
+def get_audio_clip(key):
+    """Synthesized reply audio; clips are content-addressed so they never change"""
+    clip = tts_cache.get(key)
+    if not clip:
+        return jsonify({'error': 'Audio not found'}), 404
+    
+    # conditional=True answers Range requests with 206 so players can seek and resume
+    return send_file(clip['path'], mimetype=clip['mimetype'], conditional=True, max_age=365 * 24 * 3600)
+
+@chat_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_chat_job(job_id):
+    """Job status with partial results; ?wait=N holds the request up to CHAT_JOB_MAX_WAIT seconds for the next change"""
+    try:
+        user_id = get_jwt_identity()
+        wait = request.args.get('wait', 0, type=float)
+        since = request.args.get('since', type=int)
+        
+        job = chat_jobs.wait(job_id, since=since, timeout=wait) if wait > 0 else chat_jobs.get(job_id)
+        
+        if not job or str(job.get('user_id')) != str(user_id):
+            return jsonify({'error': 'Job not found'}), 404
+        
+        response = jsonify(job)
+        if not chat_jobs.is_finished(job):
+            # Tell clients when to poll again rather than holding the worker
+            response.headers['Retry-After'] = str(chat_jobs.retry_after)
+        return response, 200
+        
+    except Exception as e:
+        logger.error(f"Chat job status error: {str(e)}")
+        return jsonify({'error': 'Failed to fetch chat job'}), 500
+
 @chat_bp.route('/sessions', methods=['GET'])
 @jwt_required()
 def get_chat_sessions():
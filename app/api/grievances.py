@@ -7,7 +7,8 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.extensions import db
 from app.models.user import User
 from app.models.grievance import Grievance
-from app.tasks.email_tasks import send_grievance_notification
+from app.services.notification_outbox import notification_outbox
+from app.tasks.email_tasks import request_outbox_dispatch
 from app.utils.validators import validate_grievance_data
 import logging
 
@@ -41,10 +42,16 @@ def submit_grievance():
         )
         
         db.session.add(grievance)
+        db.session.flush()
+        
+        # Notify government officials; the outbox row commits or rolls back with the grievance
+        notice = notification_outbox.enqueue_grievance(grievance, user.location)
+        immediate = notice.kind == 'grievance'
         db.session.commit()
         
-        # Send notification to government officials
-        send_grievance_notification.delay(grievance.id, user.location)
+        # Digests go out from the periodic dispatch once their window closes
+        if immediate:
+            request_outbox_dispatch()
         
         logger.info(f"New grievance submitted: {grievance.id} by user {user.email}")
         
@@ -0,0 +1,55 @@
+from flask import Blueprint, Response, request, jsonify
+from app.utils.metrics import metrics
+from functools import wraps
+import hmac
+import logging
+import os
+
+metrics_bp = Blueprint('metrics', __name__)
+logger = logging.getLogger(__name__)
+
+
+def metrics_token_required(f):
+    """Require `Authorization: Bearer <METRICS_TOKEN>`; without a configured token the endpoints do not exist"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = os.environ.get('METRICS_TOKEN')
+        if not token:
+            # Per-user spend must never be public because a deploy forgot the token
+            return jsonify({'error': 'Not found'}), 404
+
+        supplied = request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if not hmac.compare_digest(supplied, token):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@metrics_bp.route('', methods=['GET'])
+@metrics_token_required
+def prometheus_metrics():
+    """LLM and translation latency, token and cost metrics in Prometheus text format"""
+    try:
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    except Exception as e:
+        logger.error(f"Metrics export error: {str(e)}")
+        return jsonify({'error': 'Metrics unavailable'}), 503
+
+
+@metrics_bp.route('/costs', methods=['GET'])
+@metrics_token_required
+def cost_rollup():
+    """Estimated LLM spend per user or per district"""
+    try:
+        group = request.args.get('group', 'user')
+        if group not in ('user', 'district'):
+            return jsonify({'error': 'group must be user or district'}), 400
+
+        limit = min(request.args.get('limit', 20, type=int), 500)
+
+        return jsonify({'group': group, 'costs': metrics.cost_rollup(group, limit)}), 200
+
+    except Exception as e:
+        logger.error(f"Cost rollup error: {str(e)}")
+        return jsonify({'error': 'Metrics unavailable'}), 503
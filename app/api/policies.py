@@ -1,16 +1,18 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.user import User
-from app.services.policy_service import PolicyService
+from app.services.registry import get_service
 from app.utils.decorators import cache_response
 import logging
 
 policies_bp = Blueprint('policies', __name__)
 logger = logging.getLogger(__name__)
 
+POLICY_TEXT_FIELDS = ['title', 'description', 'beneficiaries', 'key_features', 'application_process']
+
 @policies_bp.route('/', methods=['GET'])
 @jwt_required()
-@cache_response(timeout=3600)  # Cache for 1 hour
+@cache_response(timeout=3600, tags=['policies'])  # Cache for 1 hour
 def get_policies():
     try:
         user_id = get_jwt_identity()
@@ -22,13 +24,17 @@ def get_policies():
         language = request.args.get('language', user.preferred_language)
         category = request.args.get('category')
         
-        policy_service = PolicyService()
+        policy_service = get_service('policy')
         policies = policy_service.get_policies(
             language=language,
             category=category,
             state='kerala'
         )
         
+        # Localize every remaining English field in one translation round trip
+        if language != 'en':
+            policies = get_service('translation').translate_records(policies, POLICY_TEXT_FIELDS, language, 'en')
+        
         return jsonify({'policies': policies}), 200
         
     except Exception as e:
@@ -37,7 +43,7 @@ def get_policies():
 
 @policies_bp.route('/seed-costs', methods=['GET'])
 @jwt_required()
-@cache_response(timeout=1800)  # Cache for 30 minutes
+@cache_response(timeout=1800, tags=['seed_costs'])  # Cache for 30 minutes
 def get_seed_costs():
     try:
         user_id = get_jwt_identity()
@@ -48,7 +54,7 @@ def get_seed_costs():
         
         crop_type = request.args.get('crop_type')
         
-        policy_service = PolicyService()
+        policy_service = get_service('policy')
         seed_costs = policy_service.get_seed_costs(
             location=user.location,
             crop_type=crop_type
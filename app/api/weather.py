@@ -5,7 +5,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.user import User
-from app.services.weather_service import WeatherService
+from app.services.registry import get_service
 from app.utils.decorators import cache_response
 import logging
 from app.extensions import db
@@ -15,7 +15,7 @@ logger = logging.getLogger(__name__)
 
 @weather_bp.route('/', methods=['GET'])
 @jwt_required()
-@cache_response(timeout=1800)  # Cache for 30 minutes
+@cache_response(timeout=1800, tags=['weather'])  # Cache for 30 minutes
 def get_weather():
     try:
         user_id = get_jwt_identity()
@@ -25,7 +25,7 @@ def get_weather():
             return jsonify({'error': 'User not found'}), 404
         
         location = request.args.get('location', user.location)
-        weather_service = WeatherService()
+        weather_service = get_service('weather')
         
         current_weather = weather_service.get_current_weather(location)
         forecast = weather_service.get_forecast(location, days=5)
@@ -53,10 +53,14 @@ def get_weather_alerts():
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        weather_service = WeatherService()
+        language = request.args.get('language', user.preferred_language)
+        weather_service = get_service('weather')
         alerts = weather_service.get_weather_alerts(user.location)
         
-        return jsonify({'alerts': alerts}), 200
+        if language != 'en':
+            alerts = get_service('translation').translate_records(alerts, ['message', 'farming_advice'], language, 'en')
+        
+        return jsonify({'alerts': alerts, 'language': language}), 200
         
     except Exception as e:
         logger.error(f"Weather alerts error: {str(e)}")
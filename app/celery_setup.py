@@ -1,3 +1,12 @@
 from celery import Celery
+import os
 
-celery = Celery(__name__, broker='redis://localhost:6379/0')
\ No newline at end of file
+celery = Celery(__name__, broker='redis://localhost:6379/0')
+
+# Safety net for outbox writes whose immediate dispatch trigger was lost
+celery.conf.beat_schedule = {
+    'dispatch-notification-outbox': {
+        'task': 'app.tasks.email_tasks.dispatch_notification_outbox',
+        'schedule': float(os.environ.get('OUTBOX_POLL_SECONDS', 60))
+    }
+}
\ No newline at end of file
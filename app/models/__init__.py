@@ -2,5 +2,6 @@ from app.models.user import User
 from app.models.grievance import Grievance
 from app.models.chat import ChatSession
 from app.models.blog import BlogPost
+from app.models.notification import NotificationOutbox
 
-__all__ = ['User', 'Grievance', 'ChatSession', 'BlogPost']
\ No newline at end of file
+__all__ = ['User', 'Grievance', 'ChatSession', 'BlogPost', 'NotificationOutbox']
\ No newline at end of file
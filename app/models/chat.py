@@ -17,18 +17,28 @@ class ChatSession(db.Model):
     user = db.relationship('User', backref=db.backref('chat_sessions', lazy=True, order_by='ChatSession.created_at.desc()'))
     
     def add_message(self, user_message, bot_response):
-        messages = json.loads(self.messages or '[]')
-        messages.append({
+        exchange = {
             'timestamp': datetime.utcnow().isoformat(),
             'user_message': user_message,
             'bot_response': bot_response
-        })
-        self.messages = json.dumps(messages)
+        }
+        # Splice into the stored JSON array rather than decoding and re-encoding the whole conversation
+        stored = (self.messages or '[]').rstrip()
+        if stored == '[]':
+            self.messages = f"[{json.dumps(exchange)}]"
+        else:
+            self.messages = f"{stored[:-1]}, {json.dumps(exchange)}]"
         self.updated_at = datetime.utcnow()
+        return exchange
     
     def get_messages(self):
         return json.loads(self.messages or '[]')
     
+    def get_recent_messages(self, limit=10):
+        if not self.messages:
+            return []
+        return json.loads(self.messages)[-limit:]
+    
     def to_dict(self):
         return {
             'id': self.id,
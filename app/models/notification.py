@@ -0,0 +1,40 @@
+from app.extensions import db
+from datetime import datetime
+import json
+
+class NotificationOutbox(db.Model):
+    __tablename__ = 'notification_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    dedup_key = db.Column(db.String(100), nullable=False, index=True)
+    payload = db.Column(db.Text)
+    status = db.Column(db.String(20), default='pending')
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    # The dispatcher only ever looks for due rows: pending ones, and 'sending' ones whose lease expired
+    __table_args__ = (db.Index('ix_notification_outbox_pending', 'status', 'available_at'),)
+
+    def get_payload(self):
+        return json.loads(self.payload or '{}')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'dedup_key': self.dedup_key,
+            'payload': self.get_payload(),
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'available_at': self.available_at.isoformat(),
+            'created_at': self.created_at.isoformat(),
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id}: {self.dedup_key} ({self.status})>'
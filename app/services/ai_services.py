@@ -1,71 +1,139 @@
 import openai
 import os
+import time
 from typing import Dict, List, Optional
 import logging
+from app.services.intent_router import intent_router
+from app.services.prompt_builder import PromptBuilder
+from app.services.retrieval_service import knowledge_base
+from app.utils.concurrency import llm_limiter, LLMBusyError
+from app.utils.http import build_http_session
+from app.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 class AIService:
     def __init__(self):
         openai.api_key = os.environ.get('OPENAI_API_KEY')
+        # One keep-alive pool for all threads/greenlets instead of a session per thread
+        openai.requestssession = build_http_session(retries=0)
         self.model = "gpt-3.5-turbo"
+        self.request_timeout = int(os.environ.get('AI_REQUEST_TIMEOUT', 20))
+        self.prompt_builder = PromptBuilder(self.model)
     
     def get_response(self, message: str, context: Dict = None) -> str:
         """Generate AI response for agricultural queries"""
+        return self.get_response_with_usage(message, context)['response']
+    
+    def get_response_with_usage(self, message: str, context: Dict = None) -> Dict:
+        """Generate AI response along with the token usage and estimated cost of the call"""
+        context = context or {}
+        prompt_tokens = 0
+        completion_tokens = 0
+        latency = None
+        knowledge = {'answer': None, 'passages': []}
         try:
-            # Build system prompt with agricultural context
-            system_prompt = self._build_system_prompt(context)
+            # Weather, market price and scheme questions are answered from our own services
+            routed = intent_router.route(message, context)
+            if routed:
+                return self._record(context, {
+                    'response': routed['response'],
+                    'source': 'intent',
+                    'intent': routed['intent'],
+                    'prompt_tokens': 0
+                })
+            
+            # Serve directly from our own articles when they clearly answer the question
+            knowledge = knowledge_base.lookup(message)
+            if knowledge['answer']:
+                return self._record(context, {
+                    'response': knowledge['answer'],
+                    'source': 'knowledge_base',
+                    'prompt_tokens': 0
+                })
+            
+            # Cached system prompt, article grounding and as much history as fits the token budget
+            prompt = self.prompt_builder.build(message, dict(context, grounding=knowledge['passages']))
+            prompt_tokens = prompt['prompt_tokens']
+            logger.info(f"AI prompt: {prompt_tokens} tokens, {prompt['history_used']} history exchanges")
             
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
-            ]
+            # Queue for one of the cluster-wide provider slots; raises LLMBusyError under overload
+            with llm_limiter.slot(user_id=context.get('user_id'), priority=context.get('priority', 'interactive')):
+                started = time.perf_counter()
+                try:
+                    response = openai.ChatCompletion.create(
+                        model=self.model,
+                        messages=prompt['messages'],
+                        max_tokens=500,
+                        temperature=0.7,
+                        top_p=1.0,
+                        frequency_penalty=0.0,
+                        presence_penalty=0.0,
+                        request_timeout=self.request_timeout
+                    )
+                finally:
+                    latency = time.perf_counter() - started
             
-            # Add chat history if available
-            if context and 'chat_history' in context:
-                for msg in context['chat_history'][-3:]:  # Last 3 exchanges
-                    messages.insert(-1, {"role": "user", "content": msg['user_message']})
-                    messages.insert(-1, {"role": "assistant", "content": msg['bot_response']})
+            # Prefer the provider's own count over our estimate
+            prompt_tokens, completion_tokens = self._usage_tokens(response, prompt_tokens)
             
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=500,
-                temperature=0.7,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
-            )
+            return self._record(context, {
+                'response': response.choices[0].message.content.strip(),
+                'source': 'llm',
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens
+            }, latency=latency)
             
-            return response.choices[0].message.content.strip()
+        except LLMBusyError as e:
+            # Article passages are still a useful answer when the model is saturated
+            if knowledge['passages']:
+                best = knowledge['passages'][0]
+                return self._record(context, {
+                    'response': f"{best['text']}\n\n(Source: {best['title']})",
+                    'source': 'knowledge_base',
+                    'prompt_tokens': prompt_tokens
+                }, error_type=type(e).__name__)
+            self._record(context, {'source': 'llm'}, error_type=type(e).__name__)
+            raise
             
         except Exception as e:
             logger.error(f"AI service error: {str(e)}")
-            return self._get_fallback_response(message)
-    
-    def _build_system_prompt(self, context: Dict = None) -> str:
-        """Build system prompt with agricultural context"""
-        base_prompt = """You are an AI agricultural advisor specifically designed to help farmers in Kerala, India. 
-        You provide expert advice on:
-        - Crop management and farming techniques
-        - Weather-based farming decisions
-        - Pest and disease control
-        - Soil health and fertilizer recommendations
-        - Government schemes and subsidies
-        - Market prices and trends
-        - Sustainable and organic farming practices
-        
-        Always provide practical, actionable advice suitable for small to medium-scale farmers.
-        Keep responses concise but informative."""
-        
-        if context:
-            if context.get('user_location'):
-                base_prompt += f"\n\nUser location: {context['user_location']}"
             
-            if context.get('language') == 'ml':
-                base_prompt += "\n\nNote: This response will be translated to Malayalam, so use simple, clear language."
-        
-        return base_prompt
+            if knowledge['passages']:
+                best = knowledge['passages'][0]
+                return self._record(context, {
+                    'response': f"{best['text']}\n\n(Source: {best['title']})",
+                    'source': 'knowledge_base',
+                    'prompt_tokens': prompt_tokens
+                }, latency=latency, error_type=type(e).__name__)
+            
+            return self._record(context, {
+                'response': self._get_fallback_response(message),
+                'source': 'fallback',
+                'prompt_tokens': prompt_tokens
+            }, latency=latency, error_type=type(e).__name__)
+    
+    def _record(self, context: Dict, result: Dict, latency: float = None, error_type: str = None) -> Dict:
+        """Record the call in metrics and attach its estimated cost"""
+        result['cost'] = metrics.record_llm_call(
+            self.model,
+            result['source'],
+            latency=latency,
+            prompt_tokens=result.get('prompt_tokens', 0),
+            completion_tokens=result.get('completion_tokens', 0),
+            error_type=error_type,
+            user_id=context.get('user_id'),
+            district=context.get('district') or context.get('user_location')
+        )
+        return result
+    
+    def _usage_tokens(self, response, estimated_prompt_tokens: int):
+        """Prompt and completion tokens reported by the API, if present"""
+        try:
+            usage = response.usage
+            return int(usage.prompt_tokens), int(usage.completion_tokens)
+        except (AttributeError, TypeError, ValueError):
+            return estimated_prompt_tokens, 0
     
     def _get_fallback_response(self, message: str) -> str:
         """Provide fallback response when AI service is unavailable"""
@@ -0,0 +1,125 @@
+from app.redis_setup import redis_client
+from app.utils.batching import run_blocking
+from typing import Dict, List, Optional, Tuple
+import audioop
+import hashlib
+import io
+import logging
+import os
+import time
+import speech_recognition as sr
+
+logger = logging.getLogger(__name__)
+
+# What the recognizer gets: 16 kHz, 16-bit, mono
+TARGET_RATE = 16000
+SAMPLE_WIDTH = 2
+FRAME_MS = 30
+
+
+class AudioPreprocessor:
+    """Normalise uploads for speech recognition and cut them down to the speech"""
+
+    def __init__(self):
+        self.redis = redis_client
+        self.min_silence_ms = int(os.environ.get('STT_MIN_SILENCE_MS', 700))
+        self.padding_ms = int(os.environ.get('STT_SPEECH_PADDING_MS', 200))
+        self.min_speech_ms = int(os.environ.get('STT_MIN_SPEECH_MS', 150))
+        self.max_segment_ms = int(os.environ.get('STT_MAX_SEGMENT_SECONDS', 30)) * 1000
+        self.noise_ttl = int(os.environ.get('STT_NOISE_PROFILE_TTL', 7 * 24 * 3600))
+        self.speech_ratio = 3.0  # speech must be this many times louder than the noise floor
+        self.min_threshold = 150  # RMS floor so digital silence does not make every click speech
+        self.retry_backoff = 30
+        self._redis_paused_until = 0.0
+
+    def process(self, audio_bytes: bytes, profile: str = None) -> List[Dict]:
+        """Speech segments as {'start', 'end', 'audio'} in seconds and sr.AudioData"""
+        # Decoding, resampling and the frame loops are CPU-bound; under gevent they run off
+        # the hub. The noise profile lookup stays here because it talks to Redis
+        raw, energies = run_blocking(self._frame_energies, audio_bytes)
+        if not energies:
+            return []
+
+        threshold = max(self._noise_floor(energies, profile) * self.speech_ratio, self.min_threshold)
+        segments = run_blocking(self._segments, raw, energies, threshold)
+
+        speech_seconds = sum(segment['end'] - segment['start'] for segment in segments)
+        logger.debug(f"Kept {speech_seconds:.1f}s of speech from {len(raw) / (TARGET_RATE * SAMPLE_WIDTH):.1f}s upload")
+        return segments
+
+    def _frame_energies(self, audio_bytes: bytes) -> Tuple[bytes, List[int]]:
+        raw = self.load(audio_bytes)
+        frame_bytes = TARGET_RATE * SAMPLE_WIDTH * FRAME_MS // 1000
+        return raw, [audioop.rms(raw[i:i + frame_bytes], SAMPLE_WIDTH) for i in range(0, len(raw), frame_bytes)]
+
+    def _segments(self, raw: bytes, energies: List[int], threshold: float) -> List[Dict]:
+        frame_bytes = TARGET_RATE * SAMPLE_WIDTH * FRAME_MS // 1000
+        segments = []
+        for start, end in self._speech_regions(energies, threshold):
+            chunk = raw[start * frame_bytes:end * frame_bytes]
+            segments.append({
+                'start': start * FRAME_MS / 1000,
+                'end': min(end * frame_bytes, len(raw)) / (TARGET_RATE * SAMPLE_WIDTH),
+                'audio': sr.AudioData(chunk, TARGET_RATE, SAMPLE_WIDTH)
+            })
+        return segments
+
+    def load(self, audio_bytes: bytes) -> bytes:
+        """Decode WAV/AIFF/FLAC and return mono 16 kHz 16-bit PCM"""
+        # AudioFile downmixes to mono while reading; get_raw_data resamples and re-quantises
+        with sr.AudioFile(io.BytesIO(audio_bytes)) as source:
+            audio = sr.Recognizer().record(source)
+        return audio.get_raw_data(convert_rate=TARGET_RATE, convert_width=SAMPLE_WIDTH)
+
+    def _speech_regions(self, energies: List[int], threshold: float) -> List[tuple]:
+        """(start, end) frame ranges of speech, merged across short pauses and padded"""
+        min_gap = self.min_silence_ms // FRAME_MS
+        padding = self.padding_ms // FRAME_MS
+        max_frames = self.max_segment_ms // FRAME_MS
+
+        regions = []
+        for index, energy in enumerate(energies):
+            if energy < threshold:
+                continue
+            if regions and index - regions[-1][1] <= min_gap:
+                regions[-1][1] = index + 1
+            else:
+                regions.append([index, index + 1])
+
+        result = []
+        for start, end in regions:
+            if (end - start) * FRAME_MS < self.min_speech_ms:
+                continue
+            start, end = max(start - padding, 0), min(end + padding, len(energies))
+            # Long monologues are cut into pieces the recognizer accepts
+            for piece_start in range(start, end, max_frames):
+                result.append((piece_start, min(piece_start + max_frames, end)))
+        return result
+
+    def _noise_floor(self, energies: List[int], profile: Optional[str]) -> float:
+        """Quiet-frame energy, smoothed with what was last heard from this device or session"""
+        quiet = sorted(energies)[:max(len(energies) // 10, 1)]
+        measured = sum(quiet) / len(quiet)
+        if not profile or not self._redis_available():
+            return measured
+
+        key = f"audio:noise:{hashlib.sha1(profile.encode('utf-8')).hexdigest()}"
+        try:
+            cached = self.redis.get(key)
+            # A short clip with no pause is all speech, so its quietest frames say little
+            if cached is not None:
+                reliable = len(energies) * FRAME_MS >= 2000
+                measured = 0.7 * float(cached) + 0.3 * measured if reliable else float(cached)
+            self.redis.setex(key, self.noise_ttl, f"{measured:.1f}")
+        except Exception as e:
+            self._redis_paused_until = time.monotonic() + self.retry_backoff
+            logger.error(f"Noise profile Redis error: {str(e)}")
+
+        return measured
+
+    def _redis_available(self) -> bool:
+        return bool(self.redis) and time.monotonic() >= self._redis_paused_until
+
+
+# Global audio preprocessor instance
+audio_preprocessor = AudioPreprocessor()
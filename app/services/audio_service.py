@@ -1,65 +1,95 @@
 import speech_recognition as sr
-import pyttsx3
 from pydub import AudioSegment
 import io
 import base64
 import tempfile
 import os
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+from app.services.audio_preprocessing import audio_preprocessor
+from app.services.speech_backends import get_speech_backend
+from app.services.translation_backends import split_sentences
+from app.services.tts_cache import tts_cache
+from app.services.tts_pool import TTSEnginePool
+from app.utils.batching import run_blocking, thread_pool_executor
+from app.utils.metrics import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Placeholder for a segment the recognizer errored on; the rest of the recording still counts
+SEGMENT_FAILED = object()
+
+
+def _default_spool_dir() -> str:
+    # /dev/shm is RAM-backed on Linux hosts and containers
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+@contextmanager
+def spool_file(suffix: str):
+    """Scratch path on the audio spool, removed however the block exits"""
+    spool_dir = os.environ.get('AUDIO_SPOOL_DIR') or _default_spool_dir()
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix='tts-', dir=spool_dir)
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
 class AudioService:
     def __init__(self):
-        self.recognizer = sr.Recognizer()
-        self.tts_engine = pyttsx3.init()
-        self._configure_tts()
+        # STT_BACKEND picks Google (network) or Vosk (offline models for kiosks)
+        self.speech_backend = get_speech_backend()
+        # Engines are created once per worker; AudioService itself is shared via the registry
+        self.tts_pool = TTSEnginePool()
+        # Segments of one recording are recognized concurrently, bounded per worker
+        self.max_parallel = int(os.environ.get('STT_MAX_PARALLEL', 4))
+        self._stt_executor = None
+        self._executor_lock = threading.Lock()
     
-    def _configure_tts(self):
-        """Configure text-to-speech engine"""
-        try:
-            # Set properties
-            self.tts_engine.setProperty('rate', 150)  # Speed of speech
-            self.tts_engine.setProperty('volume', 0.8)  # Volume level
-            
-            # Try to set voice for Malayalam if available
-            voices = self.tts_engine.getProperty('voices')
-            for voice in voices:
-                if 'malayalam' in voice.name.lower() or 'ml' in voice.id.lower():
-                    self.tts_engine.setProperty('voice', voice.id)
-                    break
-                    
-        except Exception as e:
-            logger.error(f"TTS configuration error: {str(e)}")
+    def speech_to_text(self, audio, language: str = 'en', noise_profile: str = None) -> Optional[str]:
+        """Convert audio (bytes, file-like object or upload) to text"""
+        transcript = self.transcribe(audio, language, noise_profile)
+        return transcript['text'] if transcript else None
     
-    def speech_to_text(self, audio_file, language: str = 'en') -> Optional[str]:
-        """Convert audio file to text"""
+    def transcribe(self, audio, language: str = 'en', noise_profile: str = None,
+                   on_partial: Callable[[str], None] = None) -> Optional[Dict]:
+        """Transcript with per-segment timestamps; on_partial gets the text recognized so far, in order"""
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                audio_file.save(temp_file.name)
-                
-                # Load and process audio
-                with sr.AudioFile(temp_file.name) as source:
-                    # Adjust for ambient noise
-                    self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                    audio = self.recognizer.record(source)
-                
-                # Set language code
-                lang_code = self._get_language_code(language)
-                
-                # Recognize speech
-                text = self.recognizer.recognize_google(audio, language=lang_code)
-                
-                # Clean up temp file
-                os.unlink(temp_file.name)
-                
-                return text.strip()
+            # Mono 16 kHz speech only; the noise floor is remembered per device/session
+            segments = audio_preprocessor.process(self._read_audio(audio), noise_profile)
+            if not segments:
+                logger.warning("No speech detected in audio")
+                return None
+            
+            labels = {'backend': self.speech_backend.name, 'mode': 'parallel' if len(segments) > 1 else 'single'}
+            with metrics.timer('stt_seconds', labels):
+                texts = self._recognize_segments(segments, language, on_partial)
+            
+            if all(text is SEGMENT_FAILED for text in texts):
+                logger.error("Speech recognition failed for every segment")
+                return None
+            
+            # Failed segments stay in the timeline, marked, so clients can show the gap
+            timed = []
+            for segment, text in zip(segments, texts):
+                item = {'start': round(segment['start'], 2), 'end': round(segment['end'], 2), 'text': text}
+                if text is SEGMENT_FAILED:
+                    timed.append(dict(item, text='', failed=True))
+                elif text:
+                    timed.append(item)
+            if not any(item['text'] for item in timed):
+                logger.warning("Could not understand audio")
+                return None
+            return {'text': ' '.join(item['text'] for item in timed if item['text']), 'segments': timed}
                 
-        except sr.UnknownValueError:
-            logger.warning("Could not understand audio")
-            return None
         except sr.RequestError as e:
             logger.error(f"Speech recognition error: {str(e)}")
             return None
@@ -69,68 +99,115 @@ class AudioService:
     
     def text_to_speech(self, text: str, language: str = 'en') -> Optional[str]:
         """Convert text to audio and return as base64"""
+        audio_bytes = self.synthesize(text, language)
+        if audio_bytes is None:
+            return None
+        return base64.b64encode(audio_bytes).decode('ascii')
+    
+    def synthesize_clip(self, text: str, language: str = 'en') -> Optional[Dict]:
+        """Compressed clip for text from the TTS cache, synthesizing it on a miss"""
         try:
             if not text or not text.strip():
                 return None
             
-            # Create temporary file for audio output
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                temp_path = temp_file.name
+            key = tts_cache.key(text, language, self.tts_pool.voice_for(language), self.tts_pool.rate)
+            clip = tts_cache.get(key)
+            if clip:
+                return clip
             
-            # Configure voice for language
-            self._set_voice_for_language(language)
-            
-            # Generate speech
-            self.tts_engine.save_to_file(text, temp_path)
-            self.tts_engine.runAndWait()
-            
-            # Convert to base64
-            with open(temp_path, 'rb') as audio_file:
-                audio_data = base64.b64encode(audio_file.read()).decode('utf-8')
-            
-            # Clean up temp file
-            os.unlink(temp_path)
-            
-            return audio_data
+            audio_bytes = self.synthesize(text, language)
+            if audio_bytes is None:
+                return None
+            return tts_cache.put(key, audio_bytes)
             
         except Exception as e:
-            logger.error(f"Text-to-speech error: {str(e)}")
+            logger.error(f"TTS cache error: {str(e)}")
             return None
     
-    def _get_language_code(self, language: str) -> str:
-        """Get Google Speech API language code"""
-        language_codes = {
-            'en': 'en-US',
-            'ml': 'ml-IN',
-            'hi': 'hi-IN',
-            'ta': 'ta-IN',
-            'te': 'te-IN'
-        }
-        return language_codes.get(language, 'en-US')
+    def _recognize_segments(self, segments, language: str, on_partial=None):
+        """Recognize segments concurrently; results come back in speech order"""
+        # One unintelligible or failed pause-split piece is not fatal for the rest of the recording
+        recognize = self._recognize_segment
+        if len(segments) == 1:
+            return [recognize(segments[0]['audio'], language)]
+        
+        futures = [self._executor().submit(recognize, segment['audio'], language) for segment in segments]
+        texts = [None] * len(futures)
+        index_of = {future: index for index, future in enumerate(futures)}
+        published = 0
+        
+        try:
+            for future in as_completed(futures):
+                texts[index_of[future]] = future.result()
+                
+                # Only publish an unbroken prefix, so partial text never reorders or changes
+                ready = published
+                while ready < len(texts) and texts[ready] is not None:
+                    ready += 1
+                if on_partial and ready > published and ready < len(texts):
+                    on_partial(' '.join(text for text in texts[:ready] if text and text is not SEGMENT_FAILED))
+                published = ready
+        except Exception:
+            # Don't spend recognizer quota on segments of a recording that already failed
+            for future in futures:
+                future.cancel()
+            raise
+        
+        return texts
     
-    def _set_voice_for_language(self, language: str):
-        """Set TTS voice for specific language"""
+    def _recognize_segment(self, audio, language: str):
+        """Text for one segment ('' when nothing intelligible was said), or SEGMENT_FAILED"""
         try:
-            voices = self.tts_engine.getProperty('voices')
-            
-            # Language-specific voice selection
-            voice_keywords = {
-                'ml': ['malayalam', 'ml'],
-                'hi': ['hindi', 'hi'],
-                'ta': ['tamil', 'ta'],
-                'te': ['telugu', 'te']
-            }
-            
-            if language in voice_keywords:
-                for voice in voices:
-                    for keyword in voice_keywords[language]:
-                        if keyword in voice.name.lower() or keyword in voice.id.lower():
-                            self.tts_engine.setProperty('voice', voice.id)
-                            return
+            return self.speech_backend.recognize(audio, language) or ''
+        except sr.RequestError as e:
+            logger.error(f"Speech recognition error: {str(e)}")
+            return SEGMENT_FAILED
+    
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._stt_executor is None:
+            with self._executor_lock:
+                if self._stt_executor is None:
+                    # Native threads under gevent too, or the segments would run one by one on the hub
+                    self._stt_executor = thread_pool_executor(self.max_parallel, 'stt')
+        return self._stt_executor
+    
+    def iter_clips(self, text: str, language: str = 'en') -> Iterator[Dict]:
+        """Cached clips sentence by sentence, synthesized only as they are consumed"""
+        for sentence in split_sentences(text or '')[::2]:
+            if sentence.strip():
+                clip = self.synthesize_clip(sentence.strip(), language)
+                if clip:
+                    yield clip
+    
+    def synthesize(self, text: str, language: str = 'en') -> Optional[bytes]:
+        """Convert text to WAV bytes"""
+        try:
+            if not text or not text.strip():
+                return None
             
-            # Default to first available voice
-            if voices:
-                self.tts_engine.setProperty('voice', voices[0].id)
+            # pyttsx3 can only write to a path, so the WAV passes through the tmpfs spool
+            with spool_file('.wav') as path:
+                # Generate speech on a pooled engine; pyttsx3 engines are not thread-safe
+                with self.tts_pool.engine(language) as engine:
+                    # runAndWait blocks in espeak's C synthesis loop; keep it off the gevent hub
+                    run_blocking(self._speak, engine, text, path)
                 
+                with open(path, 'rb') as audio_file:
+                    return audio_file.read()
+            
         except Exception as e:
-            logger.error(f"Voice setting error: {str(e)}")
+            logger.error(f"Text-to-speech error: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _speak(engine, text: str, path: str):
+        engine.save_to_file(text, path)
+        engine.runAndWait()
+    
+    @staticmethod
+    def _read_audio(audio) -> bytes:
+        """Raw bytes from bytes, memoryview, a file-like object or a Werkzeug FileStorage"""
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            return bytes(audio)
+        stream = getattr(audio, 'stream', audio)
+        return stream.read()
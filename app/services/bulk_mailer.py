@@ -0,0 +1,149 @@
+from app.utils.metrics import metrics
+from contextlib import ExitStack
+from flask import current_app
+from flask_mail import Message
+from typing import Callable, Dict, Iterable, Optional, Union
+import logging
+import os
+import smtplib
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BulkMailer:
+    """Send many messages over one SMTP connection, reconnecting on failure and throttled to the provider limit"""
+
+    def __init__(self):
+        self.rate_per_second = float(os.environ.get('MAIL_RATE_PER_SECOND', 10))
+        self.max_per_connection = int(os.environ.get('MAIL_MAX_PER_CONNECTION', 100))
+        self.max_retries = int(os.environ.get('MAIL_SEND_RETRIES', 2))
+        self.retry_delay = 1.0
+
+    def send(self, message: Message) -> bool:
+        return self.send_many([message])['sent'] == 1
+
+    def send_many(self, messages: Iterable[Union[Message, Callable[[], Message]]],
+                  on_failure: Optional[Callable] = None, on_sent: Optional[Callable] = None) -> Dict:
+        """Send messages in order; returns counts and the recipients of messages that failed.
+
+        Items may be messages or callables that build one, so a message that cannot be
+        built fails alone. on_sent and on_failure are called with each item as its
+        outcome is known. If no connection can be opened (bad credentials, or the server
+        still unreachable after the retries) the rest of the batch fails without another try.
+        """
+        mail = current_app.extensions['mail']
+        interval = 1.0 / self.rate_per_second if self.rate_per_second > 0 else 0
+        next_send = time.monotonic()
+        result = {'sent': 0, 'failed': 0, 'connections': 0, 'failed_recipients': []}
+
+        stack, connection, on_connection = None, None, 0
+        items = iter(messages)
+        try:
+            for item in items:
+                try:
+                    message = item() if callable(item) else item
+                except Exception as e:
+                    self._failed(result, item, e, on_failure)
+                    continue
+
+                # Pace sends evenly instead of bursting into the provider's rate limit
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_send = max(next_send, time.monotonic()) + interval
+
+                delivered, connect_error = False, None
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        if connection is None or on_connection >= self.max_per_connection:
+                            self._close(stack)
+                            stack, connection = ExitStack(), None
+                            connection = stack.enter_context(mail.connect())
+                            on_connection = 0
+                            result['connections'] += 1
+
+                        connection.send(message)
+                        on_connection += 1
+                        delivered = True
+                        break
+
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+                        # The message is bad, not the connection; keep going on the same one
+                        self._failed(result, item, e, on_failure)
+                        break
+
+                    except (smtplib.SMTPException, OSError) as e:
+                        # Failing to connect or log in fails every message alike
+                        connecting = connection is None
+                        if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500:
+                            if connecting:
+                                connect_error = e
+                            else:
+                                self._failed(result, item, e, on_failure)
+                            break
+
+                        self._close(stack)
+                        stack, connection = None, None
+                        if attempt == self.max_retries:
+                            if connecting:
+                                connect_error = e
+                            else:
+                                self._failed(result, item, e, on_failure)
+                        else:
+                            logger.warning(f"SMTP error, reconnecting: {str(e)}")
+                            time.sleep(self.retry_delay * 2 ** attempt)
+
+                    except Exception as e:
+                        # Bad headers and the like are the message's fault; the connection is fine
+                        self._failed(result, item, e, on_failure)
+                        break
+
+                if connect_error is not None:
+                    self._abort(result, item, items, connect_error, on_failure)
+                    break
+
+                if delivered:
+                    result['sent'] += 1
+                    if on_sent:
+                        on_sent(item)
+        finally:
+            self._close(stack)
+
+        for status in ('sent', 'failed'):
+            if result[status]:
+                metrics.increment('email_sent_total', {'status': status}, result[status])
+        if result['connections']:
+            metrics.increment('smtp_connections_total', None, result['connections'])
+        return result
+
+    @staticmethod
+    def _failed(result: Dict, item, error: Exception, on_failure: Optional[Callable]):
+        recipients = getattr(item, 'recipients', None) or []
+        result['failed'] += 1
+        result['failed_recipients'].extend(recipients)
+        logger.error(f"Email to {', '.join(recipients) or 'unbuilt message'} failed: {str(error)}")
+        if on_failure:
+            on_failure(item)
+
+    @staticmethod
+    def _abort(result: Dict, item, remaining: Iterable, error: Exception, on_failure: Optional[Callable]):
+        """Fail item and everything after it without building or sending them"""
+        abandoned = 0
+        for pending in [item, *remaining]:
+            abandoned += 1
+            result['failed'] += 1
+            result['failed_recipients'].extend(getattr(pending, 'recipients', None) or [])
+            if on_failure:
+                on_failure(pending)
+        logger.error(f"SMTP connection failed, abandoning {abandoned} emails: {str(error)}")
+
+    @staticmethod
+    def _close(stack: ExitStack):
+        if stack is None:
+            return
+        try:
+            stack.close()
+        except (smtplib.SMTPException, OSError):
+            # QUIT on a connection the server already dropped
+            pass
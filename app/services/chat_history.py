@@ -0,0 +1,78 @@
+from app.redis_setup import redis_client
+from typing import Dict, List
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class ChatHistoryCache:
+    """The latest exchanges of each chat session as a trimmed Redis list.
+
+    Prompts only need the last few exchanges, but ChatSession keeps the whole
+    conversation in one JSON column; reading the window from here avoids decoding it.
+    """
+
+    def __init__(self):
+        self.redis = redis_client
+        self.size = int(os.environ.get('CHAT_HISTORY_WINDOW', 20))
+        self.ttl = int(os.environ.get('CHAT_HISTORY_TTL', 3600))
+
+    def recent(self, chat_session, limit: int) -> List[Dict]:
+        """Up to limit latest exchanges, oldest first"""
+        # LRANGE -0 -1 would return the whole list
+        if limit <= 0:
+            return []
+
+        key = self._key(chat_session)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.exists(key)
+            pipe.lrange(key, -limit, -1)
+            cached, items = pipe.execute()
+            if cached:
+                return [json.loads(item) for item in items]
+        except Exception as e:
+            logger.error(f"Chat history cache error: {str(e)}")
+            return chat_session.get_recent_messages(limit)
+
+        # Cold session: decode the stored conversation once and keep its tail
+        exchanges = chat_session.get_recent_messages(max(self.size, limit))
+        if exchanges:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.delete(key)
+                pipe.rpush(key, *[json.dumps(exchange) for exchange in exchanges[-self.size:]])
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Chat history cache error: {str(e)}")
+        return exchanges[-limit:]
+
+    def append(self, chat_session, exchange: Dict):
+        """Add a committed exchange to a cached window; uncached sessions load on their next read"""
+        key = self._key(chat_session)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.rpushx(key, json.dumps(exchange))
+            pipe.ltrim(key, -self.size, -1)
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Chat history cache error: {str(e)}")
+            self.forget(chat_session)
+
+    def forget(self, chat_session):
+        try:
+            self.redis.delete(self._key(chat_session))
+        except Exception as e:
+            logger.error(f"Chat history cache error: {str(e)}")
+
+    @staticmethod
+    def _key(chat_session) -> str:
+        return f"chat:recent:{chat_session.user_id}:{chat_session.session_id}"
+
+
+# Global chat history cache instance
+chat_history = ChatHistoryCache()
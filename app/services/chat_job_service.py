@@ -0,0 +1,110 @@
+from app.redis_setup import redis_client
+from datetime import datetime
+from typing import Dict, Optional
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+
+class ChatJobStore:
+    """Redis-backed state for asynchronous chat jobs, including partial stage results"""
+
+    def __init__(self):
+        self.redis = redis_client
+        self.ttl = int(os.environ.get('CHAT_JOB_TTL', 3600))
+        # A long-poll holds a sync/gthread worker for its whole wait, so keep it short and
+        # let clients come back after retry_after seconds instead
+        self.max_wait = float(os.environ.get('CHAT_JOB_MAX_WAIT', 2))
+        self.retry_after = int(os.environ.get('CHAT_JOB_RETRY_AFTER', 1))
+        self.poll_interval = 0.25
+
+    def create(self, user_id, kind: str, **fields) -> str:
+        """Register a new job and return its ID"""
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow().isoformat()
+
+        self._write(job_id, dict(
+            fields,
+            job_id=job_id,
+            user_id=user_id,
+            kind=kind,
+            status='queued',
+            stage='queued',
+            created_at=now,
+            updated_at=now
+        ))
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        """Record progress; every update bumps the version long-pollers wait on"""
+        fields['updated_at'] = datetime.utcnow().isoformat()
+        self._write(job_id, fields)
+
+    def fail(self, job_id: str, error: str):
+        self.update(job_id, status='failed', error=error)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return the job as a dict, or None when unknown or expired"""
+        raw = self.redis.hgetall(self._key(job_id))
+        if not raw:
+            return None
+
+        job = {key.decode(): json.loads(value) for key, value in raw.items()}
+        job['version'] = int(job.get('version', 0))
+        return job
+
+    def wait(self, job_id: str, since: Optional[int] = None, timeout: float = 0) -> Optional[Dict]:
+        """Long-poll until the job changes past `since`, finishes, or the timeout (at most max_wait) elapses"""
+        deadline = time.monotonic() + min(timeout, self.max_wait)
+        job = self.get(job_id)
+
+        if since is None and job:
+            since = job['version']
+
+        while job and job['status'] not in TERMINAL_STATUSES and job['version'] <= since:
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+            job = self.get(job_id)
+
+        return job
+
+    @staticmethod
+    def is_finished(job: Dict) -> bool:
+        return job['status'] in TERMINAL_STATUSES
+
+    def store_audio(self, job_id: str, audio_bytes: bytes):
+        """Keep uploaded audio next to the job until the pipeline consumes it"""
+        self.redis.setex(self._audio_key(job_id), self.ttl, audio_bytes)
+
+    def load_audio(self, job_id: str) -> Optional[bytes]:
+        return self.redis.get(self._audio_key(job_id))
+
+    def discard_audio(self, job_id: str):
+        self.redis.delete(self._audio_key(job_id))
+
+    def _write(self, job_id: str, fields: Dict):
+        key = self._key(job_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={name: json.dumps(value) for name, value in fields.items() if name != 'version'})
+        pipe.hincrby(key, 'version', 1)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"chatjob:{job_id}"
+
+    @staticmethod
+    def _audio_key(job_id: str) -> str:
+        return f"chatjob:{job_id}:audio"
+
+
+# Global job store instance
+chat_jobs = ChatJobStore()
@@ -0,0 +1,100 @@
+from jinja2 import Environment, FileSystemLoader, Template, TemplateNotFound
+from markupsafe import escape
+from typing import Dict, Optional
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates', 'email')
+SUPPORTED_LANGUAGES = ('en', 'ml', 'hi', 'ta', 'te')
+
+
+class EmailTemplates:
+    """Email templates localised once per language, then rendered per recipient from a cached compiled template"""
+
+    def __init__(self, template_dir: str = TEMPLATE_DIR):
+        self.template_dir = template_dir
+        # Stage 1 fills the static, translated text: [[ t('key') ]] and [% ... %]
+        self.static_env = Environment(
+            loader=FileSystemLoader(template_dir),
+            variable_start_string='[[', variable_end_string=']]',
+            block_start_string='[%', block_end_string='%]',
+            comment_start_string='[#', comment_end_string='#]',
+            keep_trailing_newline=True
+        )
+        # Stage 2 only sees per-recipient {{ fields }}
+        self.text_env = Environment(autoescape=False, keep_trailing_newline=True)
+        self.html_env = Environment(autoescape=True, keep_trailing_newline=True)
+        self._catalogs: Dict[str, Dict[str, str]] = {}
+        self._compiled: Dict[tuple, Optional[Template]] = {}
+        self._lock = threading.Lock()
+
+    def render(self, template: str, language: str = 'en', /, **fields) -> Dict[str, Optional[str]]:
+        """Subject, text body and HTML body (None if the email has no HTML variant)"""
+        language = language if language in SUPPORTED_LANGUAGES else 'en'
+        return {
+            'subject': self._get(template, 'subject', language).render(**fields).strip(),
+            'body': self._get(template, 'txt', language).render(**fields),
+            'html': self._render_optional(template, 'html', language, fields)
+        }
+
+    def translate(self, key: str, language: str = 'en') -> str:
+        """Catalog text for key, falling back to English"""
+        return self._catalog(language).get(key) or self._catalog('en').get(key, key)
+
+    def clear(self):
+        with self._lock:
+            self._catalogs.clear()
+            self._compiled.clear()
+
+    def _render_optional(self, name: str, kind: str, language: str, fields: Dict) -> Optional[str]:
+        template = self._get(name, kind, language)
+        return template.render(**fields) if template else None
+
+    def _get(self, name: str, kind: str, language: str) -> Optional[Template]:
+        key = (name, kind, language)
+        if key not in self._compiled:
+            with self._lock:
+                if key not in self._compiled:
+                    self._compiled[key] = self._compile(name, kind, language)
+        return self._compiled[key]
+
+    def _compile(self, name: str, kind: str, language: str) -> Optional[Template]:
+        if kind == 'subject':
+            return self.text_env.from_string(self.translate(f"{name}.subject", language))
+
+        try:
+            static = self.static_env.get_template(f"{name}.{kind}")
+        except TemplateNotFound:
+            if kind == 'txt':
+                raise
+            return None
+
+        def t(key: str) -> str:
+            text = self.translate(key, language)
+            # Catalog text lands in HTML markup, so escape it there (placeholders survive)
+            return str(escape(text)) if kind == 'html' else text
+
+        source = static.render(t=t, language=language)
+        env = self.html_env if kind == 'html' else self.text_env
+        return env.from_string(source)
+
+    def _catalog(self, language: str) -> Dict[str, str]:
+        catalog = self._catalogs.get(language)
+        if catalog is None:
+            path = os.path.join(self.template_dir, 'i18n', f"{language}.json")
+            try:
+                with open(path, encoding='utf-8') as catalog_file:
+                    catalog = json.load(catalog_file)
+            except FileNotFoundError:
+                logger.warning(f"No email catalog for language {language}")
+                catalog = {}
+            self._catalogs[language] = catalog
+        return catalog
+
+
+# Global email template instance
+email_templates = EmailTemplates()
@@ -0,0 +1,243 @@
+import os
+import re
+import logging
+from typing import Dict, List, Optional
+
+from app.services.registry import get_service
+
+logger = logging.getLogger(__name__)
+
+KERALA_DISTRICTS = [
+    'Thiruvananthapuram', 'Kollam', 'Pathanamthitta', 'Alappuzha', 'Kottayam', 'Idukki',
+    'Ernakulam', 'Thrissur', 'Palakkad', 'Malappuram', 'Kozhikode', 'Wayanad', 'Kannur',
+    'Kasaragod', 'Kochi', 'Kumily'
+]
+
+# Commodity aliases -> name used by PolicyService.get_market_prices
+COMMODITIES = {
+    'rice': 'Rice', 'paddy': 'Rice',
+    'coconut': 'Coconut', 'copra': 'Coconut',
+    'pepper': 'Black Pepper', 'black pepper': 'Black Pepper',
+    'cardamom': 'Cardamom'
+}
+
+# Scheme aliases -> name used by PolicyService
+SCHEMES = {
+    'pm kisan': 'PM-KISAN', 'pm-kisan': 'PM-KISAN', 'pmkisan': 'PM-KISAN', 'kisan samman': 'PM-KISAN',
+    'pmfby': 'Pradhan Mantri Fasal Bima Yojana', 'fasal bima': 'Pradhan Mantri Fasal Bima Yojana',
+    'crop insurance': 'Pradhan Mantri Fasal Bima Yojana',
+    'soil health card': 'Soil Health Card', 'micro irrigation': 'Micro Irrigation',
+    'drip subsidy': 'Micro Irrigation', 'organic farming scheme': 'Organic Farming Promotion',
+    'agricultural development scheme': 'Kerala Agricultural Development'
+}
+
+
+def _alternation(words) -> str:
+    # Longest first so 'black pepper' wins over 'pepper'
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+DISTRICT_PATTERN = re.compile(rf"\b({_alternation(d.lower() for d in KERALA_DISTRICTS)})\b")
+COMMODITY_PATTERN = re.compile(rf"\b({_alternation(COMMODITIES)})\b")
+SCHEME_PATTERN = re.compile(rf"({_alternation(SCHEMES)})")
+
+# Each intent needs an explicit question form, not just a topic word: "rain", "wind" or
+# "rate" also turn up in crop-advice questions, which belong to the LLM
+WEATHER_PATTERN = re.compile(
+    r"\bweather\s+(in|at|for|today|tomorrow|now|forecast|report|update|like)\b|"
+    r"\b(today'?s|tomorrow'?s|current)\s+weather\b|\bforecast\b|"
+    r"\b(is it|will it)\s+(be\s+)?(rain|raining|windy|humid|hot|cold)\b|"
+    r"\b(temperature|humidity|rainfall)\s+(today|tomorrow|now|in|at)\b"
+)
+PRICE_PATTERN = re.compile(
+    r"\b(price|prices|cost)\s+(of|for)\b|\b(price|prices)\s+(today|in|at)\b|"
+    r"\b(market|mandi)\s+(price|prices|rate|rates)\b|\bselling (for|at)\b"
+)
+PRICE_SUFFIX_PATTERN = re.compile(rf"\b({_alternation(COMMODITIES)})\s+(price|prices)\b")
+SCHEME_TOPIC_PATTERN = re.compile(
+    r"\b(what|which|list|any|available|latest)\b.*\b(schemes?|subsid(y|ies)|yojanas?)\b|"
+    r"\b(schemes?|subsid(y|ies)|yojanas?)\b.*\b(available|for farmers)\b"
+)
+TOMORROW_PATTERN = re.compile(r"\b(tomorrow|next day)\b")
+
+# Questions asking for judgement rather than a fact belong to the LLM
+OPEN_ENDED_PATTERN = re.compile(
+    r"^\s*(why|should|when|how (do|can|should|to|much water)|what should|which (crop|variety|is better))\b|"
+    r"\b(advice|advise|recommend\w*|suggest\w*|explain|compare|better|best|good for|bad for)\b|"
+    r"\bwhat (to|can i|do i|should i) do\b"
+)
+# Crop-care vocabulary: even with a weather or price word, these are agronomy questions
+AGRONOMY_PATTERN = re.compile(
+    r"\b(pests?|disease\w*|damage\w*|fertili[sz]\w*|urea|manure|spray\w*|seed rate|sowing|yield|"
+    r"infest\w*|fungus|wilt\w*|rot)\b"
+)
+
+
+class IntentRouter:
+    """Answers structured questions (weather, market prices, schemes) from internal data"""
+
+    def __init__(self):
+        self.enabled = os.environ.get('INTENT_ROUTER_ENABLED', 'true').lower() == 'true'
+
+    # Looked up per use so the router shares the registry's per-worker instances and their
+    # HTTP pools, and picks up fresh ones after fork
+    @property
+    def weather_service(self):
+        return get_service('weather')
+
+    @property
+    def policy_service(self):
+        return get_service('policy')
+
+    def classify(self, message: str) -> Optional[Dict]:
+        """Return the intent and entities of a message, or None for open-ended questions"""
+        text = (message or '').lower()
+        if not text.strip() or OPEN_ENDED_PATTERN.search(text) or AGRONOMY_PATTERN.search(text):
+            return None
+
+        district = DISTRICT_PATTERN.search(text)
+        entities = {'location': district.group(1).title() if district else None}
+
+        scheme = SCHEME_PATTERN.search(text)
+        if scheme:
+            return {'intent': 'scheme_info', 'entities': dict(entities, scheme=SCHEMES[scheme.group(1)])}
+
+        commodity = COMMODITY_PATTERN.search(text)
+        if commodity and (PRICE_PATTERN.search(text) or PRICE_SUFFIX_PATTERN.search(text)):
+            return {'intent': 'market_price', 'entities': dict(entities, commodity=COMMODITIES[commodity.group(1)])}
+
+        if WEATHER_PATTERN.search(text):
+            intent = 'weather_forecast' if TOMORROW_PATTERN.search(text) else 'weather_current'
+            return {'intent': intent, 'entities': entities}
+
+        if SCHEME_TOPIC_PATTERN.search(text):
+            return {'intent': 'scheme_list', 'entities': entities}
+
+        return None
+
+    def route(self, message: str, context: Dict = None) -> Optional[Dict]:
+        """Templated answer for structured intents; None means ask the LLM"""
+        if not self.enabled:
+            return None
+
+        try:
+            classified = self.classify(message)
+            if not classified:
+                return None
+
+            entities = classified['entities']
+            entities['location'] = entities['location'] or (context or {}).get('user_location')
+
+            handler = getattr(self, f"_answer_{classified['intent']}")
+            response = handler(entities)
+            if not response:
+                return None
+
+            return {'intent': classified['intent'], 'entities': entities, 'response': response}
+
+        except Exception as e:
+            logger.error(f"Intent routing error: {str(e)}")
+            return None
+
+    def _answer_weather_current(self, entities: Dict) -> Optional[str]:
+        if not entities['location']:
+            return None
+
+        weather = self.weather_service.get_current_weather(entities['location'])
+        if not weather:
+            return None
+
+        return (
+            f"Current weather in {weather['location']}: {weather['description']}, "
+            f"{weather['temperature']}°C (feels like {weather['feels_like']}°C), "
+            f"humidity {weather['humidity']}%, wind {weather['wind_speed']} m/s."
+        )
+
+    def _answer_weather_forecast(self, entities: Dict) -> Optional[str]:
+        if not entities['location']:
+            return None
+
+        forecast = self.weather_service.get_forecast(entities['location'], days=2)
+        if len(forecast) < 2:
+            return None
+
+        day = forecast[1]
+        return (
+            f"Forecast for {entities['location']} on {day['day_name']}: {day['description']}, "
+            f"{day['min_temp']}-{day['max_temp']}°C, expected rainfall {day['rainfall']} mm. "
+            f"Farming advice: {day['farming_advice']}."
+        )
+
+    def _answer_market_price(self, entities: Dict) -> Optional[str]:
+        prices = self.policy_service.get_market_prices(entities['commodity'])
+        if not prices:
+            return None
+
+        # Prefer the asked-for market, otherwise list every market we have
+        local = [p for p in prices if entities['location'] and p['market'].lower() == entities['location'].lower()]
+        lines = [self._format_price(p) for p in (local or prices)]
+
+        return f"Latest {entities['commodity'].lower()} prices:\n" + "\n".join(lines)
+
+    def _answer_scheme_info(self, entities: Dict) -> Optional[str]:
+        scheme = self._find_scheme(entities['scheme'])
+        if not scheme:
+            return None
+
+        parts = [f"{scheme['name']}: {scheme['description']}."]
+        if scheme.get('amount'):
+            parts.append(f"Benefit: {scheme['amount']}.")
+        if scheme.get('eligibility'):
+            parts.append(f"Eligibility: {scheme['eligibility']}.")
+        if scheme.get('application_process'):
+            parts.append(f"How to apply: {scheme['application_process']}.")
+        if scheme.get('documents_required'):
+            parts.append(f"Documents: {', '.join(scheme['documents_required'])}.")
+        if scheme.get('contact'):
+            parts.append(f"Contact: {scheme['contact']}.")
+
+        return " ".join(parts)
+
+    def _answer_scheme_list(self, entities: Dict) -> Optional[str]:
+        subsidies = self.policy_service.get_subsidies()
+        if not subsidies:
+            return None
+
+        lines = [f"- {s['name']}: {s['amount']}" for s in subsidies]
+        return "Schemes currently available to farmers in Kerala:\n" + "\n".join(lines) + \
+            "\nAsk about any scheme by name for eligibility and how to apply."
+
+    def _find_scheme(self, name: str) -> Optional[Dict]:
+        """Look a scheme up in subsidies first, then in the policy catalogue"""
+        key = name.lower()
+
+        for subsidy in self.policy_service.get_subsidies():
+            if key in subsidy['name'].lower():
+                return subsidy
+
+        for policy in self.policy_service.get_policies():
+            if key in policy['title'].lower():
+                return {
+                    'name': policy['title'],
+                    'description': policy['description'],
+                    'eligibility': policy.get('beneficiaries'),
+                    'application_process': policy.get('application_process'),
+                    'contact': (policy.get('contact') or {}).get('phone')
+                }
+
+        return None
+
+    @staticmethod
+    def _format_price(price: Dict) -> str:
+        for field, unit in (('price_per_quintal', 'quintal'), ('price_per_kg', 'kg'), ('price_per_piece', 'piece')):
+            if field in price:
+                amount = f"₹{price[field]:,} per {unit}"
+                break
+        else:
+            amount = 'price unavailable'
+
+        return f"- {price['market']} ({price['variety']}): {amount}, trend {price['price_trend']}"
+
+
+# Global router instance
+intent_router = IntentRouter()
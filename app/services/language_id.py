@@ -0,0 +1,82 @@
+import logging
+import threading
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Unicode blocks of the scripts we support; each maps to one language
+SCRIPT_RANGES = (
+    (0x0D00, 0x0D7F, 'ml'),  # Malayalam
+    (0x0900, 0x097F, 'hi'),  # Devanagari
+    (0x0B80, 0x0BFF, 'ta'),  # Tamil
+    (0x0C00, 0x0C7F, 'te'),  # Telugu
+)
+
+SUPPORTED_LANGUAGES = ('en', 'ml', 'hi', 'ta', 'te')
+
+# Share of letters a script needs before we trust it without a statistical model
+SCRIPT_CONFIDENCE = 0.6
+
+_langdetect_lock = threading.Lock()
+_langdetect_ready = False
+
+
+def _script_of(char: str) -> Optional[str]:
+    if char.isascii():
+        return 'en' if char.isalpha() else None
+
+    code = ord(char)
+    for start, end, language in SCRIPT_RANGES:
+        if start <= code <= end:
+            return language
+    return None
+
+
+def detect_language(text: str) -> Optional[str]:
+    """Identify en/ml/hi/ta/te from the dominant script, falling back to langdetect for mixed text"""
+    counts = {}
+    for char in text or '':
+        language = _script_of(char)
+        if language:
+            counts[language] = counts.get(language, 0) + 1
+
+    if not counts:
+        return None
+
+    language, count = max(counts.items(), key=lambda item: item[1])
+    if count / sum(counts.values()) >= SCRIPT_CONFIDENCE:
+        return language
+
+    return _langdetect(text) or language
+
+
+def resolve_languages(text: str, requested: str) -> Tuple[str, str]:
+    """Return (message language, reply language) for a chat message"""
+    # Indic-script messages are answered in that language; Latin text (English or
+    # romanized Malayalam) is answered in the language the user asked for
+    detected = detect_language(text)
+    message_language = detected or requested
+    reply_language = detected if detected and detected != 'en' else requested
+    return message_language, reply_language
+
+
+def _langdetect(text: str) -> Optional[str]:
+    global _langdetect_ready
+
+    try:
+        from langdetect import DetectorFactory, detect_langs
+
+        if not _langdetect_ready:
+            with _langdetect_lock:
+                # Deterministic results; profiles load once per process
+                DetectorFactory.seed = 0
+                _langdetect_ready = True
+
+        for guess in detect_langs(text):
+            if guess.lang in SUPPORTED_LANGUAGES:
+                return guess.lang
+        return None
+
+    except Exception as e:
+        logger.warning(f"langdetect failed: {str(e)}")
+        return None
@@ -0,0 +1,305 @@
+from app.extensions import db
+from app.models.grievance import Grievance
+from app.models.notification import NotificationOutbox
+from app.redis_setup import redis_client
+from app.services.registry import get_service
+from app.utils.metrics import metrics
+from datetime import datetime, timedelta
+from flask_mail import Message
+from sqlalchemy.orm import joinedload
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_KEY = 'outbox:dispatch:scheduled'
+EPOCH = datetime(1970, 1, 1)
+
+
+def grievance_data(grievance: Grievance) -> Dict:
+    """Fields the grievance notification template needs"""
+    user = grievance.user
+    return {
+        'id': grievance.id,
+        'subject': grievance.subject,
+        'description': grievance.description,
+        'category': grievance.category,
+        'priority': grievance.priority,
+        'created_at': grievance.created_at.isoformat(),
+        'user_name': user.name,
+        'user_email': user.email,
+        'user_phone': user.phone or 'Not provided',
+        'user_location': user.location
+    }
+
+
+class NotificationOutboxService:
+    """Notifications committed with the change that caused them and sent later in batches"""
+
+    def __init__(self):
+        self.redis = redis_client
+        self.batch_size = int(os.environ.get('OUTBOX_BATCH_SIZE', 200))
+        self.max_attempts = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+        self.retry_delay = int(os.environ.get('OUTBOX_RETRY_SECONDS', 60))
+        self.debounce = int(os.environ.get('OUTBOX_DEBOUNCE_SECONDS', 5))
+        # Longest a batch may take to send before its rows are claimed again
+        self.send_lease = int(os.environ.get('OUTBOX_SEND_LEASE_SECONDS', 600))
+        self.digest_enabled = os.environ.get('GRIEVANCE_DIGEST_ENABLED', 'false').lower() == 'true'
+        self.digest_window = int(os.environ.get('GRIEVANCE_DIGEST_WINDOW', 900))
+        self.max_batches = 50
+        self.builders = {
+            'grievance': self._grievance_messages,
+            'grievance_digest': self._digest_messages
+        }
+
+    def enqueue(self, kind: str, dedup_key: str, **payload) -> NotificationOutbox:
+        """Add a notification to the current session; nothing is sent unless that transaction commits"""
+        entry = NotificationOutbox(kind=kind, dedup_key=dedup_key, payload=json.dumps(payload))
+        db.session.add(entry)
+        return entry
+
+    def enqueue_grievance(self, grievance: Grievance, location: str) -> NotificationOutbox:
+        """Notify officials of a new grievance: urgent ones at once, the rest in the district digest"""
+        if not self.digest_enabled or grievance.priority == 'urgent':
+            return self.enqueue('grievance', f"grievance:{grievance.id}",
+                                grievance_id=grievance.id, location=location)
+
+        # Every grievance of a district and priority in the same window shares a dedup key,
+        # so the dispatcher coalesces them into one email once the window closes
+        window_start = self._window_start(datetime.utcnow())
+        entry = self.enqueue(
+            'grievance_digest',
+            self._digest_key(window_start, grievance.priority, location),
+            grievance_id=grievance.id,
+            location=location,
+            priority=grievance.priority,
+            window_start=window_start.isoformat()
+        )
+        entry.available_at = window_start + timedelta(seconds=self.digest_window)
+        return entry
+
+    def claim_trigger(self) -> bool:
+        """True for the first write of a burst, which should schedule a dispatch run"""
+        try:
+            return bool(self.redis.set(TRIGGER_KEY, 1, nx=True, ex=self.debounce * 2))
+        except Exception as e:
+            logger.error(f"Outbox trigger error, leaving it to the periodic dispatch: {str(e)}")
+            return False
+
+    def release_trigger(self):
+        try:
+            self.redis.delete(TRIGGER_KEY)
+        except Exception as e:
+            logger.error(f"Outbox trigger error: {str(e)}")
+
+    def dispatch_batch(self) -> Optional[Dict]:
+        """Send the notifications of up to batch_size due dedup keys; None when there is nothing to send"""
+        claim = self._claim()
+        if claim is None:
+            return None
+        groups, messages, rescheduled, row_count = claim
+
+        # No transaction or row lock is held while SMTP is paced, retried and reconnected
+        delivered, undelivered = set(), set()
+        try:
+            if messages:
+                get_service('notification').send_bulk(
+                    [message for message, _ in messages],
+                    on_failure=lambda message: undelivered.add(id(message)),
+                    on_sent=lambda message: delivered.add(id(message))
+                )
+        except Exception as e:
+            # Whatever was handed to the SMTP server already stays sent; only the rest is retried
+            logger.error(f"Outbox send error: {str(e)}")
+
+        rows = {
+            row.id: row for row in NotificationOutbox.query
+            .filter(NotificationOutbox.id.in_([row_id for row_ids in groups for row_id in row_ids]))
+        }
+        for message, row_ids in messages:
+            group = [rows[row_id] for row_id in row_ids]
+            if id(message) in delivered:
+                self._finish(group)
+            else:
+                self._finish(group, 'Delivery failed' if id(message) in undelivered else 'Not attempted')
+
+        result = {'sent': 0, 'failed': 0, 'retry': 0, 'rescheduled': rescheduled,
+                  'coalesced': row_count - rescheduled - len(groups)}
+        for row_ids in groups:
+            result['retry' if rows[row_ids[0]].status == 'pending' else rows[row_ids[0]].status] += 1
+
+        db.session.commit()
+
+        for status, count in result.items():
+            if count:
+                metrics.increment('outbox_notifications_total', {'status': status}, count)
+        return result
+
+    def _claim(self) -> Optional[Tuple[List[List[int]], List[Tuple[Message, List[int]]], int, int]]:
+        """Mark due rows 'sending' under a lease and build their messages, in one short transaction.
+
+        Returns (row ids per dedup key, (message, row ids) pairs, rescheduled rows, claimed rows).
+        Rows whose lease ran out, because their dispatcher died mid-send, are due again.
+        """
+        now = datetime.utcnow()
+        due = (NotificationOutbox.status.in_(('pending', 'sending')), NotificationOutbox.available_at <= now)
+        due_keys = [
+            key for key, in db.session.query(NotificationOutbox.dedup_key)
+            .filter(*due)
+            .group_by(NotificationOutbox.dedup_key)
+            .order_by(db.func.min(NotificationOutbox.id))
+            .limit(self.batch_size)
+        ]
+
+        # Every due row of those keys, however many, so a digest window is never split
+        # across emails; a concurrent dispatcher skips the rows locked here
+        rows = (NotificationOutbox.query
+                .filter(*due, NotificationOutbox.dedup_key.in_(due_keys))
+                .order_by(NotificationOutbox.id)
+                .with_for_update(skip_locked=True)
+                .all()) if due_keys else []
+        if not rows:
+            db.session.commit()
+            return None
+
+        # Rows sharing a dedup key are delivered by a single email
+        groups: Dict[Tuple[str, str], List[NotificationOutbox]] = {}
+        for row in rows:
+            groups.setdefault((row.kind, row.dedup_key), []).append(row)
+        rescheduled = self._reschedule_late_digest_rows(groups)
+
+        lease_until = now + timedelta(seconds=self.send_lease)
+        for group in groups.values():
+            for row in group:
+                row.status, row.available_at = 'sending', lease_until
+
+        by_kind: Dict[str, List[List[NotificationOutbox]]] = {}
+        for (kind, _), group in groups.items():
+            by_kind.setdefault(kind, []).append(group)
+
+        messages = []
+        for kind, kind_groups in by_kind.items():
+            builder = self.builders.get(kind)
+            if builder is None:
+                for group in kind_groups:
+                    self._finish(group, f"Unknown notification kind: {kind}", permanent=True)
+                continue
+            messages.extend(builder(kind_groups))
+
+        claimed = (
+            [[row.id for row in group] for group in groups.values()],
+            [(message, [row.id for row in group]) for message, group in messages],
+            rescheduled,
+            len(rows)
+        )
+        db.session.commit()
+        return claimed
+
+    def _grievance_messages(self, groups: List[List[NotificationOutbox]]) -> List[Tuple[Message, List]]:
+        """One email per grievance, with every grievance and its user loaded in a single query"""
+        payloads = [group[0].get_payload() for group in groups]
+        grievances = self._load_grievances({payload['grievance_id'] for payload in payloads})
+
+        notification_service = get_service('notification')
+        messages = []
+        for group, payload in zip(groups, payloads):
+            grievance = grievances.get(payload['grievance_id'])
+            if grievance is None:
+                self._finish(group, 'Grievance not found', permanent=True)
+                continue
+            messages.append((
+                notification_service.build_grievance_message(grievance_data(grievance), payload['location']),
+                group
+            ))
+        return messages
+
+    def _digest_messages(self, groups: List[List[NotificationOutbox]]) -> List[Tuple[Message, List]]:
+        """One summary per district, priority and window listing every grievance collected in it"""
+        payloads = {row.id: row.get_payload() for group in groups for row in group}
+        grievances = self._load_grievances({payload['grievance_id'] for payload in payloads.values()})
+
+        notification_service = get_service('notification')
+        messages = []
+        for group in groups:
+            ids = sorted({payloads[row.id]['grievance_id'] for row in group})
+            found = [grievance_data(grievances[i]) for i in ids if i in grievances]
+            if not found:
+                self._finish(group, 'Grievances not found', permanent=True)
+                continue
+
+            payload = payloads[group[0].id]
+            window_start = datetime.fromisoformat(payload['window_start'])
+            window_end = window_start + timedelta(seconds=self.digest_window)
+            messages.append((
+                notification_service.build_grievance_digest_message(
+                    found, payload['location'], payload['priority'],
+                    f"{window_start:%Y-%m-%d %H:%M}", f"{window_end:%H:%M}"
+                ),
+                group
+            ))
+        return messages
+
+    def _reschedule_late_digest_rows(self, groups: Dict[Tuple[str, str], List[NotificationOutbox]]) -> int:
+        """Move rows committed after their window's digest went out into the current window"""
+        digest_keys = [key for kind, key in groups if kind == 'grievance_digest']
+        if not digest_keys:
+            return 0
+
+        # Sent rows, and rows another dispatcher holds a live lease on, record which digests have gone out
+        now = datetime.utcnow()
+        sent_keys = {
+            key for key, in db.session.query(NotificationOutbox.dedup_key)
+            .filter(NotificationOutbox.dedup_key.in_(digest_keys),
+                    db.or_(NotificationOutbox.status == 'sent',
+                           db.and_(NotificationOutbox.status == 'sending', NotificationOutbox.available_at > now)))
+            .distinct()
+        }
+
+        window_start = self._window_start(now)
+        moved = 0
+        for key in sent_keys:
+            for row in groups.pop(('grievance_digest', key)):
+                payload = row.get_payload()
+                row.dedup_key = self._digest_key(window_start, payload['priority'], payload['location'])
+                row.payload = json.dumps(dict(payload, window_start=window_start.isoformat()))
+                row.available_at = window_start + timedelta(seconds=self.digest_window)
+                moved += 1
+        return moved
+
+    def _load_grievances(self, grievance_ids) -> Dict[int, Grievance]:
+        """Grievances with their users, in one query"""
+        return {
+            grievance.id: grievance
+            for grievance in Grievance.query.options(joinedload(Grievance.user))
+            .filter(Grievance.id.in_(grievance_ids))
+        }
+
+    @staticmethod
+    def _digest_key(window_start: datetime, priority: str, location: str) -> str:
+        return f"digest:{window_start:%Y%m%d%H%M}:{priority}:{location.lower()}"[:100]
+
+    def _window_start(self, moment: datetime) -> datetime:
+        seconds = int((moment - EPOCH).total_seconds())
+        return EPOCH + timedelta(seconds=seconds - seconds % self.digest_window)
+
+    def _finish(self, rows: List[NotificationOutbox], error: str = None, permanent: bool = False):
+        now = datetime.utcnow()
+        for row in rows:
+            if error is None:
+                row.status, row.sent_at = 'sent', now
+                continue
+
+            row.attempts = (row.attempts or 0) + 1
+            row.last_error = error
+            if permanent or row.attempts >= self.max_attempts:
+                row.status = 'failed'
+                logger.error(f"Giving up on notification {row.dedup_key}: {error}")
+            else:
+                row.status = 'pending'
+                row.available_at = now + timedelta(seconds=self.retry_delay * 2 ** (row.attempts - 1))
+
+
+# Global notification outbox instance
+notification_outbox = NotificationOutboxService()
@@ -1,72 +1,26 @@
 from flask_mail import Message
-import flask_mail as Mail
+from app.services.bulk_mailer import BulkMailer
+from app.services.email_templates import email_templates
 import logging
-from typing import List, Dict
+from typing import Callable, Iterable, List, Dict, Optional, Union
 
 logger = logging.getLogger(__name__)
 
 class NotificationService:
     def __init__(self):
         self.sender_email = "noreply@agricultural-advisory.com"
+        self.mailer = BulkMailer()
     
-    def send_welcome_email(self, recipient_email: str, user_name: str) -> bool:
+    def send_bulk(self, messages: Iterable[Union[Message, Callable[[], Message]]],
+                  on_failure: Optional[Callable] = None, on_sent: Optional[Callable] = None) -> Dict:
+        """Send many messages (or builders of them) over pooled SMTP connections"""
+        return self.mailer.send_many(messages, on_failure, on_sent)
+    
+    def send_welcome_email(self, recipient_email: str, user_name: str, language: str = 'en') -> bool:
         """Send welcome email to new users"""
         try:
-            msg = Message(
-                subject="Welcome to Agricultural Advisory System",
-                sender=self.sender_email,
-                recipients=[recipient_email]
-            )
-            
-            msg.body = f"""
-            Dear {user_name},
-            
-            Welcome to our Agricultural Advisory System!
-            
-            Your account has been created successfully. You can now access:
-            
-            🌤️ Real-time weather updates and forecasts
-            🤖 AI-powered agricultural advice in multiple languages
-            📋 Government policies and schemes information
-            💰 Current seed costs and market prices
-            📝 Grievance submission system
-            📚 Educational blog posts on farming techniques
-            
-            We're here to support your farming journey with the latest technology and expert advice.
-            
-            Happy farming!
-            
-            Best regards,
-            Agricultural Advisory Team
-            """
-            
-            msg.html = f"""
-            <html>
-            <body>
-                <h2>Welcome to Agricultural Advisory System!</h2>
-                <p>Dear {user_name},</p>
-                
-                <p>Your account has been created successfully. You now have access to:</p>
-                
-                <ul>
-                    <li>🌤️ Real-time weather updates and forecasts</li>
-                    <li>🤖 AI-powered agricultural advice in multiple languages</li>
-                    <li>📋 Government policies and schemes information</li>
-                    <li>💰 Current seed costs and market prices</li>
-                    <li>📝 Grievance submission system</li>
-                    <li>📚 Educational blog posts on farming techniques</li>
-                </ul>
-                
-                <p>We're here to support your farming journey with the latest technology and expert advice.</p>
-                
-                <p><strong>Happy farming!</strong></p>
-                
-                <p>Best regards,<br>Agricultural Advisory Team</p>
-            </body>
-            </html>
-            """
-            
-            mail.send(msg)
+            if not self.mailer.send(self.build_welcome_message(recipient_email, user_name, language)):
+                return False
             logger.info(f"Welcome email sent to {recipient_email}")
             return True
             
@@ -74,51 +28,66 @@ class NotificationService:
             logger.error(f"Welcome email error: {str(e)}")
             return False
     
+    def build_welcome_message(self, recipient_email: str, user_name: str, language: str = 'en') -> Message:
+        """Welcome email for a new user"""
+        return self._message('welcome', language, [recipient_email], name=user_name)
+    
     def send_grievance_notification(self, grievance_data: Dict, location: str) -> bool:
         """Send grievance notification to officials"""
         try:
-            # Kerala Agricultural Department emails (example)
-            official_emails = [
-                "agriculture.grievance@kerala.gov.in",
-                f"agriculture.{location.lower().replace(' ', '')}@kerala.gov.in"
-            ]
-            
-            msg = Message(
-                subject=f"New Agricultural Grievance: {grievance_data['subject']}",
-                sender=self.sender_email,
-                recipients=official_emails
-            )
-            
-            msg.body = f"""
-            New Agricultural Grievance Submitted
-            
-            Grievance ID: {grievance_data['id']}
-            Subject: {grievance_data['subject']}
-            Category: {grievance_data['category']}
-            Priority: {grievance_data['priority']}
-            Location: {location}
-            
-            Description:
-            {grievance_data['description']}
-            
-            Farmer Details:
-            Name: {grievance_data['user_name']}
-            Email: {grievance_data['user_email']}
-            Phone: {grievance_data['user_phone']}
-            Location: {grievance_data['user_location']}
-            
-            Submitted on: {grievance_data['created_at']}
-            
-            Please review and take appropriate action.
-            
-            Agricultural Advisory System
-            """
-            
-            mail.send(msg)
+            if not self.mailer.send(self.build_grievance_message(grievance_data, location)):
+                return False
             logger.info(f"Grievance notification sent for ID: {grievance_data['id']}")
             return True
             
         except Exception as e:
             logger.error(f"Grievance notification error: {str(e)}")
             return False
-
+    
+    def build_grievance_message(self, grievance_data: Dict, location: str) -> Message:
+        """Grievance notice for the state and district agriculture offices"""
+        return self._message('grievance', 'en', self._official_emails(location),
+                             grievance=grievance_data, location=location)
+    
+    def build_grievance_digest_message(self, grievances: List[Dict], location: str, priority: str,
+                                       window_start: str, window_end: str) -> Message:
+        """One summary of a district's grievances of one priority over a digest window"""
+        return self._message('grievance_digest', 'en', self._official_emails(location),
+                             grievances=grievances, location=location, priority=priority,
+                             window_start=window_start, window_end=window_end)
+    
+    def send_weather_alert(self, recipient_email: str, user_name: str, alerts: List[Dict], location: str,
+                           language: str = 'en') -> bool:
+        """Send weather alerts for the user's location"""
+        try:
+            return self.mailer.send(
+                self.build_weather_alert_message(recipient_email, user_name, alerts, location, language)
+            )
+        except Exception as e:
+            logger.error(f"Weather alert email error: {str(e)}")
+            return False
+    
+    def build_weather_alert_message(self, recipient_email: str, user_name: str, alerts: List[Dict],
+                                    location: str, language: str = 'en') -> Message:
+        """Weather alert email listing each alert with its farming advice"""
+        return self._message('weather_alert', language, [recipient_email],
+                             name=user_name, alerts=alerts, location=location)
+    
+    @staticmethod
+    def _official_emails(location: str) -> List[str]:
+        # Kerala Agricultural Department emails (example)
+        return [
+            "agriculture.grievance@kerala.gov.in",
+            f"agriculture.{location.lower().replace(' ', '')}@kerala.gov.in"
+        ]
+    
+    def _message(self, template: str, language: str, recipients: List[str], **fields) -> Message:
+        # Templates are localised and compiled once per language; only these fields are rendered per email
+        rendered = email_templates.render(template, language, **fields)
+        return Message(
+            subject=rendered['subject'],
+            sender=self.sender_email,
+            recipients=recipients,
+            body=rendered['body'],
+            html=rendered['html']
+        )
@@ -0,0 +1,145 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is listed in requirements.txt
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+BASE_SYSTEM_PROMPT = """You are an AI agricultural advisor specifically designed to help farmers in Kerala, India.
+        You provide expert advice on:
+        - Crop management and farming techniques
+        - Weather-based farming decisions
+        - Pest and disease control
+        - Soil health and fertilizer recommendations
+        - Government schemes and subsidies
+        - Market prices and trends
+        - Sustainable and organic farming practices
+
+        Always provide practical, actionable advice suitable for small to medium-scale farmers.
+        Keep responses concise but informative."""
+
+GROUNDING_HEADER = "Relevant excerpts from our own agricultural articles. Prefer them when they answer the question:"
+
+# Chat format overhead per message and for priming the assistant reply
+TOKENS_PER_MESSAGE = 3
+REPLY_PRIMING_TOKENS = 3
+
+
+@lru_cache(maxsize=512)
+def render_system_prompt(location: Optional[str] = None, language: Optional[str] = None) -> str:
+    """Render the system prompt for a (location, language) pair"""
+    prompt = BASE_SYSTEM_PROMPT
+
+    if location:
+        prompt += f"\n\nUser location: {location}"
+
+    if language == 'ml':
+        prompt += "\n\nNote: This response will be translated to Malayalam, so use simple, clear language."
+
+    return prompt
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    """Load the tokenizer for a model once per process"""
+    if tiktoken is None:
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable for {model}, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Count tokens in text using the local tokenizer"""
+    if not text:
+        return 0
+
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # Roughly 4 characters per token for English text
+        return len(text) // 4 + 1
+
+    return len(encoding.encode(text))
+
+
+@lru_cache(maxsize=512)
+def _system_prompt_tokens(model: str, location: Optional[str], language: Optional[str]) -> int:
+    return count_tokens(render_system_prompt(location, language), model) + TOKENS_PER_MESSAGE
+
+
+class PromptBuilder:
+    def __init__(self, model: str = "gpt-3.5-turbo", token_budget: int = None):
+        self.model = model
+        self.token_budget = token_budget or int(os.environ.get('AI_PROMPT_TOKEN_BUDGET', 3000))
+        self.max_history = int(os.environ.get('AI_MAX_HISTORY_EXCHANGES', 10))
+        self.max_excerpt_chars = 1200
+
+    def build(self, message: str, context: Dict = None) -> Dict:
+        """Assemble chat messages for a query, trimming history to the token budget"""
+        context = context or {}
+
+        location = context.get('user_location')
+        language = context.get('language')
+
+        system_tokens = _system_prompt_tokens(self.model, location, language)
+        system_message = {"role": "system", "content": render_system_prompt(location, language)}
+        user_message = {"role": "user", "content": message}
+
+        used_tokens = system_tokens + self._message_tokens(message) + REPLY_PRIMING_TOKENS
+
+        # Retrieved article passages take priority over older conversation
+        grounding_message = None
+        excerpts = []
+        header_tokens = count_tokens(GROUNDING_HEADER, self.model) + TOKENS_PER_MESSAGE
+        for passage in context.get('grounding') or []:
+            excerpt = f"- {passage['title']}: {passage['text'][:self.max_excerpt_chars]}"
+            excerpt_tokens = count_tokens(excerpt, self.model) + 1
+            if not excerpts:
+                excerpt_tokens += header_tokens
+            if used_tokens + excerpt_tokens > self.token_budget:
+                break
+            excerpts.append(excerpt)
+            used_tokens += excerpt_tokens
+
+        if excerpts:
+            grounding_message = {"role": "system", "content": GROUNDING_HEADER + "\n" + "\n".join(excerpts)}
+
+        # Walk history newest first and keep whole exchanges while they fit
+        history: List[Dict] = []
+        exchanges = (context.get('chat_history') or [])[-self.max_history:]
+        for exchange in reversed(exchanges):
+            exchange_tokens = (
+                self._message_tokens(exchange.get('user_message', '')) +
+                self._message_tokens(exchange.get('bot_response', ''))
+            )
+            if used_tokens + exchange_tokens > self.token_budget:
+                break
+
+            history.append(exchange)
+            used_tokens += exchange_tokens
+
+        messages = [system_message]
+        if grounding_message:
+            messages.append(grounding_message)
+        for exchange in reversed(history):
+            messages.append({"role": "user", "content": exchange.get('user_message', '')})
+            messages.append({"role": "assistant", "content": exchange.get('bot_response', '')})
+        messages.append(user_message)
+
+        return {
+            'messages': messages,
+            'prompt_tokens': used_tokens,
+            'history_used': len(history),
+            'grounding_used': len(excerpts)
+        }
+
+    def _message_tokens(self, content: str) -> int:
+        return count_tokens(content, self.model) + TOKENS_PER_MESSAGE
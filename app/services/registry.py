@@ -0,0 +1,64 @@
+from flask import current_app, has_app_context
+from importlib import import_module
+from typing import Any, Dict
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# name -> (module, class); imported on first use to keep app startup light
+SERVICE_FACTORIES = {
+    'ai': ('app.services.ai_services', 'AIService'),
+    'translation': ('app.services.translation_service', 'TranslationService'),
+    'weather': ('app.services.weather_service', 'WeatherService'),
+    'policy': ('app.services.policy_service', 'PolicyService'),
+    'audio': ('app.services.audio_service', 'AudioService'),
+    'notification': ('app.services.notification_service', 'NotificationService')
+}
+
+
+class ServiceRegistry:
+    """One instance of each service per worker process, built on first use after fork"""
+
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.extensions['services'] = self
+
+    def get(self, name: str):
+        """Return the process-wide instance of a service"""
+        # Instances (and their pooled sockets) must never cross a fork
+        if os.getpid() != self._pid:
+            self.reset()
+
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    module, class_name = SERVICE_FACTORIES[name]
+                    instance = getattr(import_module(module), class_name)()
+                    self._instances[name] = instance
+                    logger.info(f"Service '{name}' initialised in process {os.getpid()}")
+        return instance
+
+    def reset(self):
+        """Drop every instance; called after fork and from tests"""
+        with self._lock:
+            self._instances = {}
+            self._pid = os.getpid()
+
+
+# Global registry instance (Celery tasks use it without an app context)
+service_registry = ServiceRegistry()
+
+
+def get_service(name: str):
+    """Service from the current app's registry, or the global one outside a request"""
+    if has_app_context() and 'services' in current_app.extensions:
+        return current_app.extensions['services'].get(name)
+    return service_registry.get(name)
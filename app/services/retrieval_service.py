@@ -0,0 +1,292 @@
+import math
+import os
+import re
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from flask import has_app_context
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+
+from app.extensions import db
+from app.models.blog import BlogPost
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'best', 'by', 'can', 'do', 'does', 'for',
+    'from', 'get', 'good', 'how', 'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or',
+    'please', 'should', 'tell', 'that', 'the', 'this', 'to', 'use', 'what', 'when',
+    'where', 'which', 'why', 'will', 'with', 'you', 'your'
+])
+
+
+def stem(token: str) -> str:
+    """Light suffix stripping so 'controlled', 'controls' and 'control' match"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+
+    for suffix in ('ing', 'ed'):
+        if len(token) > len(suffix) + 3 and token.endswith(suffix):
+            token = token[:-len(suffix)]
+            # controlled -> controll -> control
+            if len(token) > 3 and token[-1] == token[-2] and token[-1] not in 'aeiousz':
+                token = token[:-1]
+            return token
+
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        token = token[:-1]
+
+    if len(token) > 4 and token.endswith('e'):
+        token = token[:-1]
+
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, stemmed word tokens without stop words"""
+    return [stem(token) for token in TOKEN_PATTERN.findall((text or '').lower()) if token not in STOP_WORDS]
+
+
+def split_passages(text: str, max_words: int = 120) -> List[str]:
+    """Split article text into paragraph-sized passages"""
+    passages = []
+    current = []
+    current_words = 0
+
+    for paragraph in re.split(r"\n\s*\n", text or ''):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        words = len(paragraph.split())
+        if current and current_words + words > max_words:
+            passages.append("\n\n".join(current))
+            current, current_words = [], 0
+
+        current.append(paragraph)
+        current_words += words
+
+    if current:
+        passages.append("\n\n".join(current))
+
+    return passages
+
+
+class BM25Index:
+    """In-memory BM25 index over article passages"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.passages: Dict[str, Dict] = {}
+        self.doc_passages: Dict[int, List[str]] = defaultdict(list)
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.passages)
+
+    def add_document(self, doc_id: int, title: str, text: str):
+        """Index a document, replacing any previous version of it"""
+        with self._lock:
+            self.remove_document(doc_id)
+
+            title_terms = tokenize(title)
+            for position, passage in enumerate(split_passages(text)):
+                passage_id = f"{doc_id}:{position}"
+                terms = Counter(title_terms + tokenize(passage))
+                length = sum(terms.values())
+
+                self.passages[passage_id] = {
+                    'doc_id': doc_id,
+                    'title': title,
+                    'text': passage,
+                    'length': length,
+                    'terms': list(terms)
+                }
+                self.doc_passages[doc_id].append(passage_id)
+                self.total_length += length
+
+                for term, frequency in terms.items():
+                    self.postings[term][passage_id] = frequency
+
+    def remove_document(self, doc_id: int):
+        """Drop all passages of a document from the index"""
+        with self._lock:
+            for passage_id in self.doc_passages.pop(doc_id, []):
+                passage = self.passages.pop(passage_id)
+                self.total_length -= passage['length']
+
+                for term in passage['terms']:
+                    del self.postings[term][passage_id]
+                    if not self.postings[term]:
+                        del self.postings[term]
+
+    def clear(self):
+        with self._lock:
+            self.passages.clear()
+            self.doc_passages.clear()
+            self.postings.clear()
+            self.total_length = 0
+
+    def search(self, query: str, limit: int = 3) -> List[Dict]:
+        """Return the best passages for a query with BM25 score and coverage"""
+        query_terms = set(tokenize(query))
+
+        with self._lock:
+            if not query_terms or not self.passages:
+                return []
+
+            passage_count = len(self.passages)
+            avg_length = self.total_length / passage_count
+            idf = {
+                term: math.log(1 + (passage_count - len(self.postings.get(term, {})) + 0.5) /
+                               (len(self.postings.get(term, {})) + 0.5))
+                for term in query_terms
+            }
+            total_idf = sum(idf.values())
+
+            scores = defaultdict(float)
+            matched_idf = defaultdict(float)
+            for term in query_terms:
+                for passage_id, frequency in self.postings.get(term, {}).items():
+                    length = self.passages[passage_id]['length']
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[passage_id] += idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+                    matched_idf[passage_id] += idf[term]
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+            return [
+                {
+                    'doc_id': self.passages[passage_id]['doc_id'],
+                    'title': self.passages[passage_id]['title'],
+                    'text': self.passages[passage_id]['text'],
+                    'score': round(score, 4),
+                    # Share of the query's information content found in the passage
+                    'coverage': round(matched_idf[passage_id] / total_idf, 4) if total_idf else 0.0
+                }
+                for passage_id, score in ranked
+            ]
+
+
+class KnowledgeBaseService:
+    def __init__(self):
+        self.index = BM25Index()
+        self.language = 'en'
+        self.answer_min_coverage = float(os.environ.get('KB_ANSWER_MIN_COVERAGE', 0.85))
+        self.answer_min_terms = int(os.environ.get('KB_ANSWER_MIN_TERMS', 2))
+        self.grounding_min_coverage = float(os.environ.get('KB_GROUNDING_MIN_COVERAGE', 0.3))
+        self.refresh_interval = int(os.environ.get('KB_REFRESH_SECONDS', 300))
+        self._snapshot = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def lookup(self, query: str, limit: int = 3) -> Dict:
+        """Answer from blog articles when confident, otherwise return grounding passages"""
+        try:
+            self.ensure_loaded()
+            results = self.index.search(query, limit=limit)
+        except Exception as e:
+            logger.error(f"Knowledge base lookup error: {str(e)}")
+            results = []
+
+        passages = [r for r in results if r['coverage'] >= self.grounding_min_coverage]
+        best = passages[0] if passages else None
+        confidence = best['coverage'] if best else 0.0
+
+        answer = None
+        if best and confidence >= self.answer_min_coverage and len(set(tokenize(query))) >= self.answer_min_terms:
+            answer = f"{best['text']}\n\n(Source: {best['title']})"
+
+        return {'answer': answer, 'passages': passages, 'confidence': confidence}
+
+    def ensure_loaded(self):
+        """Build the index on first use and rebuild when posts changed elsewhere"""
+        if not has_app_context():
+            return
+
+        now = datetime.utcnow()
+        if self._checked_at and (now - self._checked_at).total_seconds() < self.refresh_interval:
+            return
+
+        with self._lock:
+            if self._checked_at and (now - self._checked_at).total_seconds() < self.refresh_interval:
+                return
+
+            # Cheap change detection covering posts written by other processes
+            snapshot = db.session.query(
+                func.count(BlogPost.id), func.max(BlogPost.updated_at)
+            ).filter_by(language=self.language, is_published=True).one()
+
+            if snapshot != self._snapshot:
+                self.rebuild()
+                self._snapshot = snapshot
+
+            self._checked_at = now
+
+    def rebuild(self):
+        """Re-index all published articles"""
+        posts = BlogPost.query.filter_by(language=self.language, is_published=True).all()
+
+        # Build aside and swap so concurrent searches never see a partial index
+        index = BM25Index()
+        for post in posts:
+            index.add_document(post.id, post.title, post.content)
+        self.index = index
+
+        logger.info(f"Knowledge base indexed {len(posts)} posts ({len(self.index)} passages)")
+
+    def apply_change(self, post_id: int, data: Optional[Dict]):
+        """Incrementally update the index for one post"""
+        if data and data['is_published'] and data['language'] == self.language:
+            self.index.add_document(post_id, data['title'], data['content'])
+        else:
+            self.index.remove_document(post_id)
+
+
+# Global knowledge base instance
+knowledge_base = KnowledgeBaseService()
+
+
+def _snapshot_post(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('kb_changes', {})[target.id] = {
+            'title': target.title,
+            'content': target.content,
+            'language': target.language or 'en',
+            'is_published': target.is_published is not False
+        }
+
+
+def _snapshot_deleted_post(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('kb_changes', {})[target.id] = None
+
+
+event.listen(BlogPost, 'after_insert', _snapshot_post)
+event.listen(BlogPost, 'after_update', _snapshot_post)
+event.listen(BlogPost, 'after_delete', _snapshot_deleted_post)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_post_changes(session):
+    for post_id, data in session.info.pop('kb_changes', {}).items():
+        try:
+            knowledge_base.apply_change(post_id, data)
+        except Exception as e:
+            logger.error(f"Knowledge base update error for post {post_id}: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_post_changes(session):
+    session.info.pop('kb_changes', None)
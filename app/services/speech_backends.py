@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import speech_recognition as sr
+
+from app.utils.batching import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Google Speech API language codes
+GOOGLE_LANGUAGE_CODES = {
+    'en': 'en-US',
+    'ml': 'ml-IN',
+    'hi': 'hi-IN',
+    'ta': 'ta-IN',
+    'te': 'te-IN'
+}
+
+
+class SpeechBackend:
+    name = 'base'
+
+    def supports(self, language: str) -> bool:
+        return True
+
+    def recognize(self, audio: sr.AudioData, language: str) -> Optional[str]:
+        """Text for 16 kHz mono audio, or None if nothing intelligible was said"""
+        raise NotImplementedError
+
+
+class GoogleSpeechBackend(SpeechBackend):
+    """Google Web Speech API over the network"""
+    name = 'google'
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+        self.recognizer.operation_timeout = int(os.environ.get('STT_TIMEOUT', 15))
+
+    def recognize(self, audio: sr.AudioData, language: str) -> Optional[str]:
+        try:
+            return self.recognizer.recognize_google(
+                audio, language=GOOGLE_LANGUAGE_CODES.get(language, 'en-US')
+            ).strip()
+        except sr.UnknownValueError:
+            return None
+
+
+class VoskSpeechBackend(SpeechBackend):
+    """Offline Kaldi models from VOSK_MODEL_DIR/<language>, loaded once per worker"""
+    name = 'vosk'
+
+    def __init__(self):
+        self.model_dir = os.environ.get('VOSK_MODEL_DIR', 'models/vosk')
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def supports(self, language: str) -> bool:
+        return os.path.isdir(os.path.join(self.model_dir, language))
+
+    def recognize(self, audio: sr.AudioData, language: str) -> Optional[str]:
+        from vosk import KaldiRecognizer
+
+        # Models are shared between threads; recognizers are cheap and per call
+        recognizer = KaldiRecognizer(self._load(language), audio.sample_rate)
+        # Decoding is CPU-bound C code; under gevent it must not run on the hub
+        result = run_blocking(self._decode, recognizer, audio.get_raw_data(convert_width=2))
+        text = json.loads(result).get('text', '').strip()
+        return text or None
+
+    @staticmethod
+    def _decode(recognizer, raw: bytes) -> str:
+        recognizer.AcceptWaveform(raw)
+        return recognizer.FinalResult()
+
+    def _load(self, language: str):
+        model = self._models.get(language)
+        if model is None:
+            with self._lock:
+                model = self._models.get(language)
+                if model is None:
+                    from vosk import Model, SetLogLevel
+
+                    SetLogLevel(-1)
+                    model = run_blocking(Model, os.path.join(self.model_dir, language))
+                    self._models[language] = model
+                    logger.info(f"Loaded Vosk model for {language}")
+        return model
+
+
+class FallbackSpeechBackend(SpeechBackend):
+    """Use the primary backend for languages it has a model for, otherwise or on error the fallback"""
+
+    def __init__(self, primary: SpeechBackend, fallback: SpeechBackend):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = primary.name
+
+    def recognize(self, audio: sr.AudioData, language: str) -> Optional[str]:
+        if self.primary.supports(language):
+            try:
+                return self.primary.recognize(audio, language)
+            except Exception as e:
+                logger.error(f"{self.primary.name} recognition failed, using {self.fallback.name}: {str(e)}")
+
+        return self.fallback.recognize(audio, language)
+
+
+_backends: Dict[str, SpeechBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_speech_backend(name: str = None) -> SpeechBackend:
+    """Process-wide backend for STT_BACKEND (google or vosk)"""
+    name = name or os.environ.get('STT_BACKEND', 'google')
+
+    with _backends_lock:
+        if name not in _backends:
+            if name == 'vosk':
+                _backends[name] = FallbackSpeechBackend(VoskSpeechBackend(), GoogleSpeechBackend())
+            else:
+                _backends[name] = GoogleSpeechBackend()
+
+        return _backends[name]
@@ -0,0 +1,223 @@
+import os
+import re
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+# (source, target) -> (model, target language token for multilingual models)
+MARIAN_MODELS: Dict[Tuple[str, str], Tuple[str, Optional[str]]] = {
+    ('en', 'ml'): ('Helsinki-NLP/opus-mt-en-ml', None),
+    ('ml', 'en'): ('Helsinki-NLP/opus-mt-ml-en', None),
+    ('en', 'hi'): ('Helsinki-NLP/opus-mt-en-hi', None),
+    ('hi', 'en'): ('Helsinki-NLP/opus-mt-hi-en', None),
+    ('en', 'ta'): ('Helsinki-NLP/opus-mt-en-dra', '>>tam<<'),
+    ('en', 'te'): ('Helsinki-NLP/opus-mt-en-dra', '>>tel<<'),
+    ('ta', 'en'): ('Helsinki-NLP/opus-mt-dra-en', None),
+    ('te', 'en'): ('Helsinki-NLP/opus-mt-dra-en', None)
+}
+
+# Sentence ends in Latin text and the Devanagari danda; the separator is kept
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?।])(\s+)|(\n+)")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into alternating sentence and separator segments; ''.join() restores it"""
+    segments = []
+    position = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        segments.append(text[position:match.start()])
+        segments.append(match.group(0))
+        position = match.end()
+    segments.append(text[position:])
+    return segments
+
+
+class TranslationBackend:
+    name = 'base'
+
+    def supports(self, source_lang: str, target_lang: str) -> bool:
+        return True
+
+    def warm_up(self):
+        """Load whatever the first requests would otherwise wait for"""
+
+    def translate_batch(self, texts: List[str], target_lang: str, source_lang: str = 'auto') -> List[str]:
+        """Translate texts in one call, preserving order"""
+        raise NotImplementedError
+
+
+class GoogleTranslateBackend(TranslationBackend):
+    """googletrans over the network"""
+    name = 'google'
+
+    def __init__(self):
+        from googletrans import Translator
+        self.translator = Translator(timeout=int(os.environ.get('TRANSLATION_TIMEOUT', 10)))
+
+    def translate_batch(self, texts: List[str], target_lang: str, source_lang: str = 'auto') -> List[str]:
+        src = source_lang if source_lang != 'auto' else None
+
+        # One request for many single-line texts, split back on newlines
+        if len(texts) > 1 and not any('\n' in text for text in texts):
+            joined = self.translator.translate('\n'.join(texts), src=src, dest=target_lang).text
+            lines = joined.split('\n')
+            if len(lines) == len(texts):
+                return [line.strip() for line in lines]
+            logger.warning("Batched translation changed the line count, translating items separately")
+
+        return [result.text for result in self.translator.translate(texts, src=src, dest=target_lang)]
+
+
+class MarianTranslationBackend(TranslationBackend):
+    """Local MarianMT models on CPU, loaded once per worker and fed by micro-batches"""
+    name = 'marian'
+
+    def __init__(self):
+        self.model_dir = os.environ.get('MARIAN_MODEL_DIR')
+        self.quantize = os.environ.get('TRANSLATION_QUANTIZE', 'true').lower() == 'true'
+        self.torch_threads = int(os.environ.get('TRANSLATION_TORCH_THREADS', 2))
+        self.num_beams = int(os.environ.get('TRANSLATION_NUM_BEAMS', 2))
+        self.max_batch_size = int(os.environ.get('TRANSLATION_BATCH_SIZE', 16))
+        self.max_wait_ms = float(os.environ.get('TRANSLATION_BATCH_WAIT_MS', 10))
+        self.timeout = int(os.environ.get('TRANSLATION_TIMEOUT', 10))
+        self.warmup_languages = os.environ.get('TRANSLATION_WARMUP_LANGUAGES', 'ml,hi,ta,te').split(',')
+        self._models = {}
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def supports(self, source_lang: str, target_lang: str) -> bool:
+        return (source_lang, target_lang) in MARIAN_MODELS
+
+    def warm_up(self):
+        """Load the models of warmup_languages and run one sentence through each batcher;
+        loading takes longer than the request timeout, so cold calls would fall back to google"""
+        models = {
+            model_name: language_token
+            for (source, target), (model_name, language_token) in MARIAN_MODELS.items()
+            if source in self.warmup_languages or target in self.warmup_languages
+        }
+        for model_name, language_token in models.items():
+            sentence = f"{language_token} Hello." if language_token else 'Hello.'
+            # Through the batcher, so the model loads on the thread that serves it
+            self._get_batcher(model_name).map([sentence])
+        logger.info(f"Translation models ready: {sorted(models)}")
+
+    def translate_batch(self, texts: List[str], target_lang: str, source_lang: str = 'auto') -> List[str]:
+        model_name, language_token = MARIAN_MODELS[(source_lang, target_lang)]
+        batcher = self._get_batcher(model_name)
+
+        # Marian degrades on long inputs, so each sentence is its own batch item
+        segmented = [split_sentences(text) for text in texts]
+        sentences = [
+            f"{language_token} {segment}" if language_token else segment
+            for segments in segmented for segment in segments[::2] if segment.strip()
+        ]
+        translated = iter(batcher.map(sentences, timeout=self.timeout))
+
+        results = []
+        for segments in segmented:
+            for i in range(0, len(segments), 2):
+                if segments[i].strip():
+                    segments[i] = next(translated)
+            results.append(''.join(segments))
+        return results
+
+    def _get_batcher(self, model_name: str) -> MicroBatcher:
+        batcher = self._batchers.get(model_name)
+        if batcher is None:
+            with self._lock:
+                batcher = self._batchers.setdefault(model_name, MicroBatcher(
+                    lambda sentences: self._generate(model_name, sentences),
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_wait_ms,
+                    name=f"marian-{model_name.rsplit('/', 1)[-1]}"
+                ))
+        return batcher
+
+    def _generate(self, model_name: str, sentences: List[str]) -> List[str]:
+        import torch
+
+        tokenizer, model = self._load(model_name)
+        with torch.inference_mode():
+            inputs = tokenizer(sentences, return_tensors='pt', padding=True, truncation=True, max_length=512)
+            outputs = model.generate(**inputs, num_beams=self.num_beams, max_new_tokens=512)
+        return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def _load(self, model_name: str):
+        # Only a model's batcher calls this, one batch at a time, so no lock is needed around loading
+        if model_name not in self._models:
+            import torch
+            from transformers import MarianMTModel, MarianTokenizer
+
+            torch.set_num_threads(self.torch_threads)
+            path = self._resolve(model_name)
+
+            tokenizer = MarianTokenizer.from_pretrained(path)
+            model = MarianMTModel.from_pretrained(path).eval()
+            if self.quantize:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+            self._models[model_name] = (tokenizer, model)
+            logger.info(f"Loaded translation model {model_name} (int8: {self.quantize})")
+
+        return self._models[model_name]
+
+    def _resolve(self, model_name: str) -> str:
+        """Prefer a pre-downloaded copy under MARIAN_MODEL_DIR"""
+        if self.model_dir:
+            local_path = os.path.join(self.model_dir, model_name.rsplit('/', 1)[-1])
+            if os.path.isdir(local_path):
+                return local_path
+        return model_name
+
+
+class FallbackTranslationBackend(TranslationBackend):
+    """Use the primary backend where it supports the pair, otherwise or on error the fallback"""
+
+    def __init__(self, primary: TranslationBackend, fallback: TranslationBackend):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = primary.name
+
+    def warm_up(self):
+        self.primary.warm_up()
+
+    def translate_batch(self, texts: List[str], target_lang: str, source_lang: str = 'auto') -> List[str]:
+        if self.primary.supports(source_lang, target_lang):
+            try:
+                return self.primary.translate_batch(texts, target_lang, source_lang)
+            except Exception as e:
+                logger.error(f"{self.primary.name} translation failed, using {self.fallback.name}: {str(e)}")
+
+        return self.fallback.translate_batch(texts, target_lang, source_lang)
+
+
+_backends: Dict[str, TranslationBackend] = {}
+_backends_lock = threading.RLock()
+
+
+def get_translation_backend(name: str = None) -> TranslationBackend:
+    """Process-wide backend for TRANSLATION_BACKEND (google or marian)"""
+    name = name or os.environ.get('TRANSLATION_BACKEND', 'google')
+
+    with _backends_lock:
+        if name not in _backends:
+            if name == 'marian':
+                _backends[name] = FallbackTranslationBackend(
+                    MarianTranslationBackend(), get_google_backend()
+                )
+            else:
+                _backends[name] = get_google_backend()
+
+        return _backends[name]
+
+
+def get_google_backend() -> GoogleTranslateBackend:
+    with _backends_lock:
+        if 'google' not in _backends:
+            _backends['google'] = GoogleTranslateBackend()
+        return _backends['google']
@@ -0,0 +1,106 @@
+from app.redis_setup import redis_client
+from app.utils.metrics import metrics
+from collections import OrderedDict
+from typing import Dict, List
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TranslationMemory:
+    """Sentence translations cached in a per-process LRU backed by Redis"""
+
+    def __init__(self):
+        self.redis = redis_client
+        self.max_local = int(os.environ.get('TM_LOCAL_SIZE', 5000))
+        self.ttl = int(os.environ.get('TM_TTL', 30 * 24 * 3600))
+        self.retry_backoff = 30
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis_paused_until = 0.0
+
+    def get_many(self, texts: List[str], target_lang: str, source_lang: str = 'auto') -> Dict[str, str]:
+        """Cached translations for whichever of the texts have one"""
+        found = {}
+        remote = []
+
+        with self._lock:
+            for text in texts:
+                key = self._key(text, target_lang, source_lang)
+                if key in self._local:
+                    self._local.move_to_end(key)
+                    found[text] = self._local[key]
+                else:
+                    remote.append((text, key))
+
+        redis_hits = {}
+        if remote and self._redis_available():
+            try:
+                values = self.redis.mget([key for _, key in remote])
+                redis_hits = {
+                    text: value.decode('utf-8')
+                    for (text, _), value in zip(remote, values) if value is not None
+                }
+            except Exception as e:
+                self._pause_redis(e)
+
+        if redis_hits:
+            self._remember({self._key(t, target_lang, source_lang): v for t, v in redis_hits.items()})
+            found.update(redis_hits)
+
+        counts = {'local': len(texts) - len(remote), 'redis': len(redis_hits), 'miss': len(remote) - len(redis_hits)}
+        for tier, count in counts.items():
+            if count:
+                metrics.increment('translation_memory_total', {'tier': tier}, count)
+
+        return found
+
+    def set_many(self, translations: Dict[str, str], target_lang: str, source_lang: str = 'auto'):
+        """Store fresh translations in both tiers"""
+        if not translations:
+            return
+
+        entries = {self._key(text, target_lang, source_lang): value for text, value in translations.items()}
+        self._remember(entries)
+
+        if self._redis_available():
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, value in entries.items():
+                    pipe.setex(key, self.ttl, value)
+                pipe.execute()
+            except Exception as e:
+                self._pause_redis(e)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def _remember(self, entries: Dict[str, str]):
+        with self._lock:
+            for key, value in entries.items():
+                self._local[key] = value
+                self._local.move_to_end(key)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+    def _redis_available(self) -> bool:
+        return bool(self.redis) and time.monotonic() >= self._redis_paused_until
+
+    def _pause_redis(self, error: Exception):
+        # The local tier keeps working while Redis is unreachable
+        self._redis_paused_until = time.monotonic() + self.retry_backoff
+        logger.error(f"Translation memory Redis error: {str(error)}")
+
+    @staticmethod
+    def _key(text: str, target_lang: str, source_lang: str) -> str:
+        digest = hashlib.sha1(f"{source_lang}\x1f{target_lang}\x1f{text}".encode('utf-8')).hexdigest()
+        return f"tm:{digest}"
+
+
+# Global translation memory instance
+translation_memory = TranslationMemory()
@@ -1,12 +1,17 @@
-from googletrans import Translator
-from typing import Optional
+from typing import Dict, List, Optional
+from app.services.translation_backends import get_translation_backend, split_sentences
+from app.services.language_id import detect_language
+from app.services.translation_memory import translation_memory
+from app.utils.metrics import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
 class TranslationService:
     def __init__(self):
-        self.translator = Translator()
+        # Backends are shared per process so local models load once per worker
+        self.backend = get_translation_backend()
+        self.memory = translation_memory
         self.supported_languages = {
             'en': 'English',
             'ml': 'Malayalam',
@@ -17,31 +22,118 @@ class TranslationService:
     
     def translate(self, text: str, target_lang: str, source_lang: str = 'auto') -> str:
         """Translate text between languages"""
+        labels = {'backend': self.backend.name, 'source': source_lang, 'target': target_lang, 'status': 'ok'}
         try:
             if not text or not text.strip():
                 return text
             
-            # Skip translation if same language
-            if source_lang == target_lang:
+            # Skip translation if same language, or the text is already in the target language
+            if source_lang == target_lang or detect_language(text) == target_lang:
+                metrics.increment('translation_requests_total', dict(labels, status='skipped'))
                 return text
             
-            result = self.translator.translate(
-                text, 
-                src=source_lang if source_lang != 'auto' else None,
-                dest=target_lang
-            )
+            translated = self._translate_texts([text], target_lang, source_lang, labels)[0]
             
-            return result.text
+            metrics.increment('translation_requests_total', labels)
+            return translated
             
         except Exception as e:
             logger.error(f"Translation error: {str(e)}")
+            metrics.increment('translation_requests_total', dict(labels, status='error', error_type=type(e).__name__))
             return text  # Return original text if translation fails
     
+    def translate_many(self, texts: List[str], target_lang: str, source_lang: str = 'en') -> List[str]:
+        """Translate a list in one backend round trip, returning results in input order.
+        
+        Each string is judged on its own: blanks, and strings whose dominant script is already
+        the target language (detect_language), are returned unchanged."""
+        labels = {'backend': self.backend.name, 'source': source_lang, 'target': target_lang, 'status': 'ok'}
+        if source_lang == target_lang or not texts:
+            return list(texts)
+        
+        # Duplicates are translated once; blanks and text already in the target language pass through
+        unique = [
+            text for text in dict.fromkeys(texts)
+            if text and text.strip() and detect_language(text) != target_lang
+        ]
+        if not unique:
+            return list(texts)
+        
+        try:
+            translated = dict(zip(unique, self._translate_texts(unique, target_lang, source_lang, labels)))
+            metrics.increment('translation_requests_total', labels, len(unique))
+        except Exception as e:
+            logger.error(f"Batch translation error: {str(e)}")
+            metrics.increment('translation_requests_total', dict(labels, status='error', error_type=type(e).__name__), len(unique))
+            translated = {}
+        
+        return [translated.get(text, text) for text in texts]
+    
+    def translate_records(self, records: List[Dict], fields: List[str], target_lang: str, source_lang: str = 'en') -> List[Dict]:
+        """Copies of records with the given string (or list of strings) fields translated in one batch;
+        fields already in the target language are left as they are (see translate_many).
+        
+        The records themselves are not modified: callers pass lists shared by process-wide caches."""
+        # Fields are reassigned, never mutated, so a shallow copy keeps the originals intact
+        records = [dict(record) for record in records]
+        if source_lang == target_lang or not records:
+            return records
+        
+        texts = []
+        for record in records:
+            for field in fields:
+                value = record.get(field)
+                if isinstance(value, str):
+                    texts.append(value)
+                elif isinstance(value, list):
+                    texts.extend(item for item in value if isinstance(item, str))
+        
+        translated = iter(self.translate_many(texts, target_lang, source_lang))
+        
+        for record in records:
+            for field in fields:
+                value = record.get(field)
+                if isinstance(value, str):
+                    record[field] = next(translated)
+                elif isinstance(value, list):
+                    record[field] = [next(translated) if isinstance(item, str) else item for item in value]
+        
+        return records
+    
+    def _translate_texts(self, texts: List[str], target_lang: str, source_lang: str, labels: Dict) -> List[str]:
+        """Sentence-level translation through the translation memory; misses go to the backend in one batch"""
+        segmented = [split_sentences(text) for text in texts]
+        sentences = list(dict.fromkeys(
+            segment.strip() for segments in segmented for segment in segments[::2] if segment.strip()
+        ))
+        
+        translations = self.memory.get_many(sentences, target_lang, source_lang)
+        misses = [sentence for sentence in sentences if sentence not in translations]
+        
+        if misses:
+            with metrics.timer('translation_seconds', labels) as timed:
+                try:
+                    fresh = dict(zip(misses, self.backend.translate_batch(misses, target_lang, source_lang)))
+                except Exception as e:
+                    timed.update(status='error', error_type=type(e).__name__)
+                    raise
+            
+            self.memory.set_many(fresh, target_lang, source_lang)
+            translations.update(fresh)
+        
+        results = []
+        for segments in segmented:
+            for i in range(0, len(segments), 2):
+                sentence = segments[i].strip()
+                if sentence:
+                    segments[i] = segments[i].replace(sentence, translations[sentence])
+            results.append(''.join(segments))
+        return results
+    
     def detect_language(self, text: str) -> Optional[str]:
-        """Detect language of given text"""
+        """Detect language of given text locally, without a network call"""
         try:
-            detection = self.translator.detect(text)
-            return detection.lang
+            return detect_language(text)
             
         except Exception as e:
             logger.error(f"Language detection error: {str(e)}")
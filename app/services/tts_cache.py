@@ -0,0 +1,180 @@
+from app.utils.metrics import metrics
+from contextlib import contextmanager
+from typing import Dict, Optional
+import fcntl
+import hashlib
+import io
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# format -> (file extension, mimetype, pydub export options)
+AUDIO_FORMATS = {
+    'mp3': ('mp3', 'audio/mpeg', {'format': 'mp3', 'bitrate': '32k'}),
+    'opus': ('ogg', 'audio/ogg', {'format': 'ogg', 'codec': 'libopus', 'bitrate': '24k'}),
+    'wav': ('wav', 'audio/wav', None)
+}
+
+CLIP_KEY = re.compile(r'^[0-9a-f]{64}$')
+
+
+class TTSCache:
+    """Compressed TTS clips on disk, addressed by a hash of what was spoken and how"""
+
+    def __init__(self):
+        self.cache_dir = os.environ.get('TTS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'tts_cache'))
+        self.max_bytes = int(os.environ.get('TTS_CACHE_MAX_MB', 512)) * 1024 * 1024
+        self.format = os.environ.get('TTS_CACHE_FORMAT', 'mp3')
+        # Clips touched this recently may still be streaming to a client and are never evicted
+        self.evict_grace = int(os.environ.get('TTS_CACHE_EVICT_GRACE', 300))
+        self._lock = threading.Lock()
+
+    def check_encoder(self):
+        """Fall back to WAV up front, with one warning, when ffmpeg is missing"""
+        if AUDIO_FORMATS[self.format][2] is None or shutil.which('ffmpeg') or shutil.which('avconv'):
+            return
+        logger.warning(f"ffmpeg not found, caching TTS clips as WAV instead of {self.format}")
+        self.format = 'wav'
+
+    @staticmethod
+    def key(text: str, language: str, voice: Optional[str], rate: int) -> str:
+        return hashlib.sha256(f"{language}\x1f{voice}\x1f{rate}\x1f{text}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Clip for key, or None; a hit refreshes its position in the LRU"""
+        if not CLIP_KEY.match(key or ''):
+            return None
+
+        for audio_format in (self.format, 'wav'):
+            path = self._path(key, audio_format)
+            if os.path.exists(path):
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                metrics.increment('tts_cache_total', {'result': 'hit'})
+                return self._clip(key, path, audio_format)
+
+        metrics.increment('tts_cache_total', {'result': 'miss'})
+        return None
+
+    def put(self, key: str, wav_bytes: bytes) -> Dict:
+        """Compress a WAV clip and store it; WAV is kept as-is if the encoder is unavailable"""
+        audio_format = self.format
+        try:
+            data = self._encode(wav_bytes, audio_format)
+        except Exception as e:
+            logger.warning(f"TTS {audio_format} encoding failed, caching WAV: {str(e)}")
+            audio_format, data = 'wav', wav_bytes
+
+        path = self._path(key, audio_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write then rename so other workers never serve a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self._track(len(data))
+        return self._clip(key, path, audio_format)
+
+    def _encode(self, wav_bytes: bytes, audio_format: str) -> bytes:
+        options = AUDIO_FORMATS[audio_format][2]
+        if options is None:
+            return wav_bytes
+
+        from pydub import AudioSegment
+
+        buffer = io.BytesIO()
+        AudioSegment.from_file(io.BytesIO(wav_bytes), format='wav').export(buffer, **options)
+        return buffer.getvalue()
+
+    def _track(self, added: int):
+        """Add to the cache size shared by every worker on this host, evicting past the cap"""
+        with self._lock, self._file_lock():
+            size_path = os.path.join(self.cache_dir, '.size')
+            try:
+                with open(size_path) as size_file:
+                    size = int(size_file.read()) + added
+            except (OSError, ValueError):
+                size = sum(size for _, size, _ in self._entries())
+
+            if size > self.max_bytes:
+                size = self._evict()
+
+            with open(size_path, 'w') as size_file:
+                size_file.write(str(size))
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize size accounting and eviction across worker processes"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _evict(self) -> int:
+        """Delete least recently used clips until the cache is at 90% of its cap; returns the new size"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        cutoff = time.time() - self.evict_grace
+
+        for mtime, size, path in entries:
+            if total <= target:
+                break
+            if mtime > cutoff:
+                logger.warning(f"TTS cache over its cap, but the remaining clips were used in the last {self.evict_grace}s")
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"TTS cache eviction error: {str(e)}")
+                continue
+            total -= size
+
+        return total
+
+    def _entries(self):
+        """(mtime, size, path) for every cached clip"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.part'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def _path(self, key: str, audio_format: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{AUDIO_FORMATS[audio_format][0]}")
+
+    @staticmethod
+    def _clip(key: str, path: str, audio_format: str) -> Dict:
+        return {'key': key, 'path': path, 'format': audio_format, 'mimetype': AUDIO_FORMATS[audio_format][1]}
+
+
+# Global TTS cache instance
+tts_cache = TTSCache()
@@ -0,0 +1,123 @@
+from contextlib import contextmanager
+from typing import Dict, Optional
+import logging
+import os
+import queue
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Keywords matched against voice names and ids for each language
+VOICE_KEYWORDS = {
+    'ml': ['malayalam', 'ml'],
+    'hi': ['hindi', 'hi'],
+    'ta': ['tamil', 'ta'],
+    'te': ['telugu', 'te']
+}
+
+# Drivers whose synthesis state is process-global; engines on them cannot run side by side
+SINGLE_ENGINE_DRIVERS = {'espeak'}
+
+
+def default_driver() -> str:
+    """The driver pyttsx3 picks for this platform"""
+    if sys.platform == 'win32':
+        return 'sapi5'
+    if sys.platform == 'darwin':
+        return 'nsss'
+    return 'espeak'
+
+
+class TTSEnginePool:
+    """Configured pyttsx3 engines, checked out by one request at a time"""
+
+    def __init__(self, size: int = None, rate: int = 150, volume: float = 0.8):
+        self.driver = os.environ.get('TTS_DRIVER') or default_driver()
+        self.size = size or int(os.environ.get('TTS_POOL_SIZE', 1))
+        if self.driver in SINGLE_ENGINE_DRIVERS and self.size > 1:
+            # espeak keeps one synth callback and one output buffer per process, so a second
+            # engine synthesizing at the same time interleaves or truncates the other's audio
+            logger.warning(f"TTS_POOL_SIZE={self.size} is not supported by the {self.driver} driver, using 1")
+            self.size = 1
+        self.checkout_timeout = float(os.environ.get('TTS_CHECKOUT_TIMEOUT', 30))
+        self.rate = rate
+        self.volume = volume
+        self.voice_map: Dict[str, str] = {}
+        self.default_voice: Optional[str] = None
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Build every engine now instead of on the first audio requests"""
+        engines = []
+        with self._lock:
+            while self._created < self.size:
+                engines.append(self._create_engine())
+        for engine in engines:
+            self._idle.put(engine)
+        logger.info(f"TTS pool ready with {self.size} engine(s), voices for {sorted(self.voice_map)}")
+
+    def voice_for(self, language: str) -> Optional[str]:
+        """Voice id used for language; the first call builds an engine to read the voices"""
+        if self.default_voice is None:
+            with self.engine(language):
+                pass
+        return self.voice_map.get(language, self.default_voice)
+
+    @contextmanager
+    def engine(self, language: str = 'en'):
+        """Check out an engine set to the voice for language"""
+        engine = self._checkout()
+        try:
+            voice = self.voice_map.get(language, self.default_voice)
+            if voice:
+                engine.setProperty('voice', voice)
+            yield engine
+        except Exception:
+            # pyttsx3 can be left mid-loop after a failure; build a fresh engine next time
+            with self._lock:
+                self._created -= 1
+            raise
+        else:
+            self._idle.put(engine)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                return self._create_engine()
+
+        try:
+            return self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No TTS engine free after {self.checkout_timeout}s")
+
+    def _create_engine(self):
+        # pyttsx3.init() hands back one cached engine per driver, so build distinct ones
+        from pyttsx3.engine import Engine
+
+        engine = Engine(self.driver)
+        engine.setProperty('rate', self.rate)
+        engine.setProperty('volume', self.volume)
+        self._created += 1
+
+        if self.default_voice is None:
+            self._build_voice_map(engine.getProperty('voices'))
+        return engine
+
+    def _build_voice_map(self, voices):
+        """Resolve each language's voice once instead of scanning voices per request"""
+        for language, keywords in VOICE_KEYWORDS.items():
+            for voice in voices:
+                if any(keyword in voice.name.lower() or keyword in voice.id.lower() for keyword in keywords):
+                    self.voice_map[language] = voice.id
+                    break
+
+        if voices:
+            self.default_voice = voices[0].id
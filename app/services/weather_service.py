@@ -1,4 +1,4 @@
-import requests
+from app.utils.http import build_http_session
 import os
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
@@ -10,6 +10,7 @@ class WeatherService:
     def __init__(self):
         self.api_key = os.environ.get('WEATHER_API_KEY')
         self.base_url = "http://api.openweathermap.org/data/2.5"
+        self.session = build_http_session()
     
     def get_current_weather(self, location: str) -> Optional[Dict]:
         """Get current weather data for location"""
@@ -25,7 +26,7 @@ class WeatherService:
                 'units': 'metric'
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -65,7 +66,7 @@ class WeatherService:
                 'cnt': days * 8  # 8 forecasts per day (3-hour intervals)
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -169,7 +170,7 @@ class WeatherService:
                 'appid': self.api_key
             }
             
-            response = requests.get(url, params=params, timeout=5)
+            response = self.session.get(url, params=params, timeout=5)
             response.raise_for_status()
             
             data = response.json()
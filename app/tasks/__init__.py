@@ -1,9 +1,11 @@
 from app.tasks.email_tasks import send_welcome_email, send_grievance_notification
 from app.tasks.data_sync_tasks import sync_weather_data, sync_policy_data
+from app.tasks.chat_tasks import build_chat_pipeline
 
 __all__ = [
     'send_welcome_email', 
     'send_grievance_notification',
     'sync_weather_data', 
-    'sync_policy_data'
+    'sync_policy_data',
+    'build_chat_pipeline'
 ]
@@ -0,0 +1,185 @@
+from celery import chain
+from celery.exceptions import Ignore
+from app.celery_setup import celery
+from app.extensions import db
+from app.models.chat import ChatSession
+from app.services.chat_history import chat_history
+from app.services.chat_job_service import chat_jobs
+from app.services.language_id import resolve_languages
+from app.services.registry import get_service
+from app.utils.concurrency import LLMBusyError
+from typing import Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Each stage receives the payload returned by the previous one. Large blobs
+# (uploaded audio, synthesized speech) stay in the job store, not the chain.
+
+
+def build_chat_pipeline(payload: Dict):
+    """Celery chain for one chat job; audio jobs start with transcription"""
+    stages = [translate_chat_input, generate_chat_response, translate_chat_output]
+
+    if payload['kind'] == 'audio':
+        stages = [transcribe_chat_audio] + stages + [synthesize_chat_audio]
+
+    stages.append(save_chat_exchange)
+    return chain(stages[0].s(payload), *[stage.s() for stage in stages[1:]])
+
+
+def _fail(job_id: str, stage: str, error: Exception):
+    logger.error(f"Chat job {job_id} failed at {stage}: {str(error)}")
+    chat_jobs.fail(job_id, f"{stage} failed")
+    # Stop the chain without marking the Celery task for retry
+    raise Ignore()
+
+
+@celery.task
+def transcribe_chat_audio(payload: Dict) -> Dict:
+    """Speech to text; the transcription is published as soon as it is known"""
+    job_id = payload['job_id']
+    try:
+        chat_jobs.update(job_id, status='running', stage='transcribing')
+        audio_bytes = chat_jobs.load_audio(job_id)
+        if not audio_bytes:
+            raise ValueError("Uploaded audio expired")
+
+        # Long voice notes are recognized in parallel; pollers see the transcript grow
+        transcript = get_service('audio').transcribe(
+            audio_bytes, payload['language'], payload.get('noise_profile'),
+            on_partial=lambda text: chat_jobs.update(job_id, partial_transcription=text)
+        )
+        chat_jobs.discard_audio(job_id)
+
+        if not transcript:
+            chat_jobs.fail(job_id, 'Could not process audio')
+            raise Ignore()
+
+        chat_jobs.update(job_id, transcription=transcript['text'], transcript_segments=transcript['segments'])
+        return dict(payload, message=transcript['text'])
+
+    except Ignore:
+        raise
+    except Exception as e:
+        _fail(job_id, 'transcription', e)
+
+
+@celery.task
+def translate_chat_input(payload: Dict) -> Dict:
+    """Translate the user's message to English for the model"""
+    job_id = payload['job_id']
+    try:
+        message = payload['message']
+        message_language, language = resolve_languages(message, payload['language'])
+        chat_jobs.update(job_id, status='running', stage='translating_input', language=language)
+
+        if message_language != 'en':
+            message = get_service('translation').translate(message, 'en', message_language)
+
+        return dict(payload, english_message=message, language=language)
+
+    except Exception as e:
+        _fail(job_id, 'translation', e)
+
+
+@celery.task(bind=True, max_retries=3)
+def generate_chat_response(self, payload: Dict) -> Dict:
+    """Ask the AI service, waiting out LLM backpressure instead of failing the job"""
+    job_id = payload['job_id']
+    try:
+        chat_jobs.update(job_id, status='running', stage='generating')
+        ai_service = get_service('ai')
+
+        context = {
+            'user_id': payload['user_id'],
+            'user_location': payload.get('user_location'),
+            'language': payload['language'],
+            # Queued jobs retry on LLMBusyError, so they yield slots to requests a user is waiting on
+            'priority': 'background'
+        }
+        if payload['kind'] == 'text':
+            chat_session = ChatSession.query.filter_by(
+                user_id=payload['user_id'],
+                session_id=payload['session_id']
+            ).first()
+            if chat_session:
+                context['chat_history'] = chat_history.recent(chat_session, ai_service.prompt_builder.max_history)
+
+        ai_result = ai_service.get_response_with_usage(payload['english_message'], context=context)
+
+        chat_jobs.update(job_id, source=ai_result['source'], prompt_tokens=ai_result['prompt_tokens'])
+        return dict(payload, english_response=ai_result['response'])
+
+    except LLMBusyError as e:
+        if self.request.retries < self.max_retries:
+            chat_jobs.update(job_id, stage='waiting_for_capacity', queue_position=e.queue_position)
+            raise self.retry(countdown=e.retry_after, exc=e)
+        _fail(job_id, 'generation', e)
+    except Exception as e:
+        _fail(job_id, 'generation', e)
+
+
+@celery.task
+def translate_chat_output(payload: Dict) -> Dict:
+    """Translate the answer back; text is published before speech synthesis starts"""
+    job_id = payload['job_id']
+    try:
+        chat_jobs.update(job_id, stage='translating_output')
+        response = payload['english_response']
+        if payload['language'] != 'en':
+            response = get_service('translation').translate(response, payload['language'], 'en')
+
+        chat_jobs.update(job_id, response=response)
+        return dict(payload, response=response)
+
+    except Exception as e:
+        _fail(job_id, 'translation', e)
+
+
+@celery.task
+def synthesize_chat_audio(payload: Dict) -> Dict:
+    """Text to speech for audio jobs"""
+    job_id = payload['job_id']
+    try:
+        chat_jobs.update(job_id, stage='synthesizing')
+        clip = get_service('audio').synthesize_clip(payload['response'], payload['language'])
+
+        if clip:
+            chat_jobs.update(job_id, audio_url=f"/api/chat/audio/{clip['key']}", audio_format=clip['format'])
+        return payload
+
+    except Exception as e:
+        _fail(job_id, 'speech synthesis', e)
+
+
+@celery.task
+def save_chat_exchange(payload: Dict) -> Dict:
+    """Persist the exchange to the chat session and complete the job"""
+    job_id = payload['job_id']
+    try:
+        chat_jobs.update(job_id, stage='saving')
+
+        chat_session = ChatSession.query.filter_by(
+            user_id=payload['user_id'],
+            session_id=payload['session_id']
+        ).first()
+
+        if not chat_session:
+            chat_session = ChatSession(
+                user_id=payload['user_id'],
+                session_id=payload['session_id'],
+                language=payload['language']
+            )
+            db.session.add(chat_session)
+
+        exchange = chat_session.add_message(payload['message'], payload['response'])
+        db.session.commit()
+        chat_history.append(chat_session, exchange)
+
+        chat_jobs.update(job_id, status='completed', stage='completed')
+        return {'status': 'success', 'job_id': job_id}
+
+    except Exception as e:
+        db.session.rollback()
+        _fail(job_id, 'save', e)
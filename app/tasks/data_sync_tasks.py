@@ -1,6 +1,6 @@
 from app.celery_setup import celery
 from app.models.blog import BlogPost
-from app.services.weather_service import WeatherService
+from app.services.registry import get_service
 from app.utils.cache import cache
 import logging
 from datetime import datetime, timedelta
@@ -11,7 +11,7 @@ logger = logging.getLogger(__name__)
 def sync_weather_data():
     """Sync and cache weather data for major locations"""
     try:
-        weather_service = WeatherService()
+        weather_service = get_service('weather')
         
         # Major agricultural districts in Kerala
         locations = [
@@ -30,13 +30,14 @@ def sync_weather_data():
                 if current_weather:
                     # Cache weather data
                     cache_key = f"weather:{location}"
-                    cache.set(cache_key, current_weather, timeout=1800)  # 30 minutes
+                    district_tags = ['weather', f"district:{location.lower()}"]
+                    cache.set(cache_key, current_weather, timeout=1800, tags=district_tags)  # 30 minutes
                     
                     # Get forecast
                     forecast = weather_service.get_forecast(location)
                     if forecast:
                         forecast_key = f"forecast:{location}"
-                        cache.set(forecast_key, forecast, timeout=3600)  # 1 hour
+                        cache.set(forecast_key, forecast, timeout=3600, tags=district_tags)  # 1 hour
                     
                     synced_count += 1
                     
@@ -75,13 +76,14 @@ def sync_policy_data():
             }
         ]
         
-        # Cache policies
+        # Drop every cached policy response, then cache the fresh policies
+        invalidated = cache.invalidate_tags('policies')
         for lang in ['en', 'ml']:
             lang_policies = [p for p in policies if p['language'] == lang]
             cache_key = f"policies:{lang}"
-            cache.set(cache_key, lang_policies, timeout=3600)
+            cache.set(cache_key, lang_policies, timeout=3600, tags=['policies'])
         
-        logger.info("Policy data synced successfully")
+        logger.info(f"Policy data synced successfully ({invalidated} cached entries invalidated)")
         return {'status': 'success', 'policies_synced': len(policies)}
         
     except Exception as e:
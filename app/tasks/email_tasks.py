@@ -2,17 +2,20 @@ from celery import current_app
 from app.celery_setup import celery
 from app.models.user import User
 from app.models.grievance import Grievance
-from app.services.notification_service import NotificationService
+from app.extensions import db
+from app.services.notification_outbox import grievance_data, notification_outbox
+from app.services.registry import get_service
+from sqlalchemy.orm import joinedload
 import logging
 
 logger = logging.getLogger(__name__)
 
 @celery.task(bind=True, max_retries=3)
-def send_welcome_email(self, user_email: str, user_name: str):
+def send_welcome_email(self, user_email: str, user_name: str, language: str = 'en'):
     """Send welcome email to new user"""
     try:
-        notification_service = NotificationService()
-        success = notification_service.send_welcome_email(user_email, user_name)
+        notification_service = get_service('notification')
+        success = notification_service.send_welcome_email(user_email, user_name, language=language)
         
         if not success:
             raise Exception("Failed to send welcome email")
@@ -34,27 +37,13 @@ def send_welcome_email(self, user_email: str, user_name: str):
 def send_grievance_notification(self, grievance_id: int, location: str):
     """Send grievance notification to officials"""
     try:
-        grievance = Grievance.query.get(grievance_id)
+        grievance = Grievance.query.options(joinedload(Grievance.user)).filter_by(id=grievance_id).first()
         if not grievance:
             logger.error(f"Grievance not found: {grievance_id}")
             return {'status': 'failed', 'error': 'Grievance not found'}
         
-        user = grievance.user
-        grievance_data = {
-            'id': grievance.id,
-            'subject': grievance.subject,
-            'description': grievance.description,
-            'category': grievance.category,
-            'priority': grievance.priority,
-            'created_at': grievance.created_at.isoformat(),
-            'user_name': user.name,
-            'user_email': user.email,
-            'user_phone': user.phone or 'Not provided',
-            'user_location': user.location
-        }
-        
-        notification_service = NotificationService()
-        success = notification_service.send_grievance_notification(grievance_data, location)
+        notification_service = get_service('notification')
+        success = notification_service.send_grievance_notification(grievance_data(grievance), location)
         
         if not success:
             raise Exception("Failed to send grievance notification")
@@ -71,42 +60,85 @@ def send_grievance_notification(self, grievance_id: int, location: str):
         
         return {'status': 'failed', 'grievance_id': grievance_id, 'error': str(e)}
 
+def request_outbox_dispatch():
+    """Schedule one outbox run for a burst of writes; the periodic run covers a failed trigger"""
+    if notification_outbox.claim_trigger():
+        try:
+            dispatch_notification_outbox.apply_async(countdown=notification_outbox.debounce)
+        except Exception as e:
+            notification_outbox.release_trigger()
+            logger.error(f"Outbox dispatch scheduling error: {str(e)}")
+
+@celery.task
+def dispatch_notification_outbox():
+    """Send pending outbox notifications in batches"""
+    # Cleared before draining, so anything written from now on schedules the next run
+    notification_outbox.release_trigger()
+    totals = {'sent': 0, 'failed': 0, 'retry': 0, 'rescheduled': 0, 'coalesced': 0}
+    
+    try:
+        for _ in range(notification_outbox.max_batches):
+            result = notification_outbox.dispatch_batch()
+            if result is None:
+                break
+            for status, count in result.items():
+                totals[status] += count
+        
+        if any(totals.values()):
+            logger.info(f"Outbox dispatched: {totals}")
+        return {'status': 'success', **totals}
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Outbox dispatch task error: {str(e)}")
+        return {'status': 'failed', 'error': str(e), **totals}
+
 @celery.task
 def send_daily_weather_alerts():
     """Send daily weather alerts to users"""
     try:
-        from app.services.weather_service import WeatherService
-        
-        # Get all active users
-        users = User.query.filter_by(is_active=True).all()
-        weather_service = WeatherService()
-        notification_service = NotificationService()
-        
-        sent_count = 0
-        
-        for user in users:
-            try:
-                # Get weather alerts for user location
-                alerts = weather_service.get_weather_alerts(user.location)
-                
-                if alerts:
-                    # Send alert email
-                    success = notification_service.send_weather_alert(
-                        user.email, 
-                        user.name, 
-                        alerts, 
-                        user.location
-                    )
-                    
-                    if success:
-                        sent_count += 1
+        weather_service = get_service('weather')
+        translation_service = get_service('translation')
+        notification_service = get_service('notification')
+        
+        # Users share districts and languages, so each location's alerts are fetched
+        # once and translated once per language
+        alerts_by_location = {}
+        
+        def localized_alerts(location: str, language: str):
+            if location not in alerts_by_location:
+                alerts_by_location[location] = {'en': weather_service.get_weather_alerts(location)}
+            variants = alerts_by_location[location]
+            if language not in variants:
+                variants[language] = translation_service.translate_records(
+                    variants['en'], ['message', 'farming_advice'], language, 'en'
+                )
+            return variants[language]
+        
+        def alert_messages():
+            for user in User.query.filter_by(is_active=True).yield_per(500):
+                try:
+                    language = user.preferred_language or 'en'
+                    alerts = localized_alerts(user.location, language)
+                    if alerts:
+                        yield notification_service.build_weather_alert_message(
+                            user.email,
+                            user.name,
+                            alerts,
+                            user.location,
+                            language
+                        )
                         
-            except Exception as e:
-                logger.error(f"Weather alert error for user {user.id}: {str(e)}")
-                continue
+                except Exception as e:
+                    logger.error(f"Weather alert error for user {user.id}: {str(e)}")
+                    continue
+        
+        # Messages stream into a few long-lived SMTP connections as they are built
+        result = notification_service.send_bulk(alert_messages())
         
-        logger.info(f"Weather alerts sent to {sent_count} users")
-        return {'status': 'success', 'alerts_sent': sent_count}
+        logger.info(f"Weather alerts sent to {result['sent']} users ({result['failed']} failed, "
+                    f"{result['connections']} SMTP connections)")
+        return {'status': 'success', 'alerts_sent': result['sent'], 'alerts_failed': result['failed']}
         
     except Exception as e:
         logger.error(f"Daily weather alerts task error: {str(e)}")
@@ -0,0 +1,83 @@
+from typing import Dict, Iterator
+import json
+import logging
+import struct
+import wave
+
+logger = logging.getLogger(__name__)
+
+# Placeholder RIFF/data size for a WAV whose length is unknown while streaming
+STREAMING_WAV_SIZE = 0xFFFFFFFF
+
+# Clip formats whose per-sentence files can be concatenated into one playable stream
+BINARY_STREAM_FORMATS = ('mp3', 'wav')
+
+
+def wav_stream_header(channels: int, sample_width: int, frame_rate: int) -> bytes:
+    """44-byte PCM WAV header with open-ended sizes, for WAV sent as it is produced"""
+    byte_rate = frame_rate * channels * sample_width
+    return b''.join([
+        b'RIFF', struct.pack('<I', STREAMING_WAV_SIZE), b'WAVE',
+        b'fmt ', struct.pack('<IHHIIHH', 16, 1, channels, frame_rate, byte_rate,
+                             channels * sample_width, sample_width * 8),
+        b'data', struct.pack('<I', STREAMING_WAV_SIZE)
+    ])
+
+
+def iter_binary_audio(first_clip: Dict, clips: Iterator[Dict]) -> Iterator[bytes]:
+    """One continuous audio stream from per-sentence clips.
+    
+    Only MP3 and WAV can be joined this way (see BINARY_STREAM_FORMATS): each Opus clip is a
+    complete Ogg stream, and most players stop at the end of the first one when they are
+    chained, so Opus replies go out as multipart instead. Clips in another format than the
+    first (e.g. a WAV fallback after a failed encode) are skipped.
+    """
+    audio_format = first_clip['format']
+    if audio_format not in BINARY_STREAM_FORMATS:
+        raise ValueError(f"{audio_format} clips cannot be streamed as one binary response")
+    
+    # MP3 frames can simply be appended; WAV clips need a single header
+    if audio_format == 'mp3':
+        yield _read(first_clip)
+        for clip in clips:
+            if clip['format'] != audio_format:
+                logger.warning(f"Skipping {clip['format']} clip in {audio_format} audio stream")
+                continue
+            yield _read(clip)
+        return
+
+    with wave.open(first_clip['path'], 'rb') as wav:
+        params = (wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+        yield wav_stream_header(*params)
+        yield wav.readframes(wav.getnframes())
+
+    for clip in clips:
+        if clip['format'] != audio_format:
+            logger.warning(f"Skipping {clip['format']} clip in {audio_format} audio stream")
+            continue
+        with wave.open(clip['path'], 'rb') as wav:
+            if (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) != params:
+                logger.warning("Skipping WAV clip with mismatched format in audio stream")
+                continue
+            yield wav.readframes(wav.getnframes())
+
+
+def iter_multipart_audio(metadata: Dict, clips: Iterator[Dict], boundary: str, clip_url) -> Iterator[bytes]:
+    """multipart/mixed body: JSON metadata first, then one complete clip per sentence"""
+    yield _part(boundary, {'Content-Type': 'application/json'}, json.dumps(metadata).encode('utf-8'))
+
+    for clip in clips:
+        headers = {'Content-Type': clip['mimetype'], 'Content-Location': clip_url(clip)}
+        yield _part(boundary, headers, _read(clip))
+
+    yield f"--{boundary}--\r\n".encode('ascii')
+
+
+def _part(boundary: str, headers: Dict, body: bytes) -> bytes:
+    head = ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return f"--{boundary}\r\n{head}Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body + b'\r\n'
+
+
+def _read(clip: Dict) -> bytes:
+    with open(clip['path'], 'rb') as audio:
+        return audio.read()
@@ -0,0 +1,103 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _gevent_active() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _on_hub_thread() -> bool:
+    """True on the native main thread, where gevent workers run their hub"""
+    from gevent import monkey
+    get_ident = monkey.get_original('threading', 'get_ident')
+    return get_ident() == monkey.get_original('threading', 'main_thread')().ident
+
+
+def run_blocking(fn, *args):
+    """Call fn on a native thread when gevent has patched threading, so CPU-bound work
+    such as torch inference does not stall every other request on the hub"""
+    if not _gevent_active() or not _on_hub_thread():
+        return fn(*args)
+
+    from gevent import get_hub
+    return get_hub().threadpool.apply(fn, args)
+
+
+def thread_pool_executor(max_workers: int, thread_name_prefix: str = '') -> ThreadPoolExecutor:
+    """ThreadPoolExecutor backed by OS threads even under gevent, where the stdlib one
+    would run its work as greenlets on the hub, one at a time"""
+    if _gevent_active():
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+
+class MicroBatcher:
+    """Merges concurrent single-item calls into one batched call on a background thread"""
+
+    def __init__(self, batch_fn: Callable[[List], List], max_batch_size: int = 16,
+                 max_wait_ms: float = 10, name: str = 'batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item) -> Future:
+        """Queue one item; the future resolves with its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def map(self, items: List, timeout: float = None) -> List:
+        """Submit several items and wait for all results in order"""
+        futures = [self.submit(item) for item in items]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def _ensure_started(self):
+        # Started lazily so each forked worker gets its own thread
+        if self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            # Collect whatever else arrives within the wait window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = run_blocking(self.batch_fn, items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(items)} failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
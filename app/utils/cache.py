@@ -1,15 +1,24 @@
 from app.redis_setup import redis_client
+from itertools import islice
 import json
 import logging
-from typing import Any, Optional
+import os
+import uuid
+from redis.exceptions import ResponseError
+from typing import Any, Iterable, Iterator, List, Optional
 from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
+TAG_PREFIX = 'cache:tag:'
+
 class CacheManager:
     def __init__(self):
         self.redis = redis_client
         self.default_timeout = 300  # 5 minutes
+        # Tag sets must outlive the longest entry registered in them
+        self.tag_ttl = int(os.environ.get('CACHE_TAG_TTL', 86400))
+        self.chunk_size = int(os.environ.get('CACHE_DELETE_CHUNK', 500))
     
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
@@ -26,8 +35,8 @@ class CacheManager:
             logger.error(f"Cache get error: {str(e)}")
             return None
     
-    def set(self, key: str, value: Any, timeout: int = None) -> bool:
-        """Set value in cache"""
+    def set(self, key: str, value: Any, timeout: int = None, tags: Iterable[str] = None) -> bool:
+        """Set value in cache, registered under tags (e.g. 'policies', 'district:thrissur', 'user:42')"""
         try:
             if not self.redis:
                 return False
@@ -35,7 +44,15 @@ class CacheManager:
             timeout = timeout or self.default_timeout
             serialized_value = json.dumps(value)
             
-            return self.redis.setex(key, timeout, serialized_value)
+            if not tags:
+                return self.redis.setex(key, timeout, serialized_value)
+            
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.setex(key, timeout, serialized_value)
+            for tag in tags:
+                pipe.sadd(self._tag_key(tag), key)
+                pipe.expire(self._tag_key(tag), max(timeout, self.tag_ttl))
+            return bool(pipe.execute()[0])
             
         except Exception as e:
             logger.error(f"Cache set error: {str(e)}")
@@ -53,16 +70,37 @@ class CacheManager:
             logger.error(f"Cache delete error: {str(e)}")
             return False
     
+    def invalidate_tags(self, *tags: str) -> int:
+        """Delete every entry registered under any of the tags"""
+        if not self.redis:
+            return 0
+        
+        deleted = 0
+        for tag in tags:
+            try:
+                # Detach the set first, so entries cached from now on register in a fresh one
+                detached = f"{self._tag_key(tag)}:invalidating:{uuid.uuid4().hex}"
+                try:
+                    self.redis.rename(self._tag_key(tag), detached)
+                except ResponseError:
+                    continue  # nothing cached under this tag
+                
+                deleted += self._unlink(self.redis.sscan_iter(detached, count=self.chunk_size))
+                self.redis.unlink(detached)
+                
+            except Exception as e:
+                logger.error(f"Cache tag invalidation error for {tag}: {str(e)}")
+        
+        return deleted
+    
     def clear_pattern(self, pattern: str) -> int:
-        """Clear all keys matching pattern"""
+        """Clear all keys matching pattern; prefer invalidate_tags, this still walks the keyspace"""
         try:
             if not self.redis:
                 return 0
             
-            keys = self.redis.keys(pattern)
-            if keys:
-                return self.redis.delete(*keys)
-            return 0
+            # SCAN in steps instead of KEYS, which blocks Redis for every other client
+            return self._unlink(self.redis.scan_iter(match=pattern, count=self.chunk_size))
             
         except Exception as e:
             logger.error(f"Cache clear pattern error: {str(e)}")
@@ -80,5 +118,29 @@ class CacheManager:
             logger.error(f"Cache exists error: {str(e)}")
             return False
 
+    def _unlink(self, keys: Iterator) -> int:
+        """UNLINK keys in chunks, several chunks per pipeline round trip"""
+        deleted = 0
+        pipe = self.redis.pipeline(transaction=False)
+        for chunk in self._chunks(keys):
+            pipe.unlink(*chunk)
+            if len(pipe) >= 10:
+                deleted += sum(pipe.execute())
+        if len(pipe):
+            deleted += sum(pipe.execute())
+        return deleted
+    
+    def _chunks(self, keys: Iterator) -> Iterator[List]:
+        keys = iter(keys)
+        while True:
+            chunk = list(islice(keys, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+    
+    @staticmethod
+    def _tag_key(tag: str) -> str:
+        return f"{TAG_PREFIX}{tag}"
+
 # Global cache instance
 cache = CacheManager()
@@ -0,0 +1,269 @@
+from app.redis_setup import redis_client
+from contextlib import contextmanager
+from redis.exceptions import RedisError
+from typing import Optional
+import logging
+import math
+import os
+import random
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Lower value is served first
+PRIORITIES = {
+    'interactive': 0,
+    'background': 1
+}
+
+# KEYS: holders, deadlines, one queue per priority (highest first)
+# ARGV: ticket, concurrency limit, now (ms), lease (ms)
+# Returns 0 when the slot was granted, the 1-based queue position while
+# waiting, or -1 when the ticket is no longer queued.
+ACQUIRE_SCRIPT = """
+local holders = KEYS[1]
+local deadlines = KEYS[2]
+local ticket = ARGV[1]
+local limit = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local lease = tonumber(ARGV[4])
+
+redis.call('ZREMRANGEBYSCORE', holders, '-inf', now)
+local expired = redis.call('ZRANGEBYSCORE', deadlines, '-inf', now)
+for _, stale in ipairs(expired) do
+    for i = 3, #KEYS do
+        redis.call('ZREM', KEYS[i], stale)
+    end
+end
+redis.call('ZREMRANGEBYSCORE', deadlines, '-inf', now)
+
+local position = 0
+local queued = false
+for i = 3, #KEYS do
+    local rank = redis.call('ZRANK', KEYS[i], ticket)
+    if rank then
+        position = position + rank
+        queued = true
+        break
+    end
+    position = position + redis.call('ZCARD', KEYS[i])
+end
+
+if not queued then
+    return -1
+end
+
+if position < limit - redis.call('ZCARD', holders) then
+    for i = 3, #KEYS do
+        redis.call('ZREM', KEYS[i], ticket)
+    end
+    redis.call('ZREM', deadlines, ticket)
+    redis.call('ZADD', holders, now + lease, ticket)
+    return 0
+end
+
+return position + 1
+"""
+
+# KEYS: sorted sets the ticket may be in, then the user's outstanding-call counter when ARGV[2] is '1'
+# ARGV: ticket, whether a user counter is passed
+# The counter carries a TTL, so a call that outlived it finds it gone or already reset;
+# it is never decremented below zero and is deleted once nothing is outstanding.
+RELEASE_SCRIPT = """
+local ticket = ARGV[1]
+local has_user = ARGV[2] == '1'
+local sets = #KEYS
+if has_user then
+    sets = sets - 1
+end
+
+for i = 1, sets do
+    redis.call('ZREM', KEYS[i], ticket)
+end
+
+if has_user then
+    local user_key = KEYS[#KEYS]
+    if tonumber(redis.call('GET', user_key) or '0') <= 1 then
+        redis.call('DEL', user_key)
+    else
+        redis.call('DECR', user_key)
+    end
+end
+return 1
+"""
+
+
+class LLMBusyError(Exception):
+    """Raised when no LLM slot became free within the allowed wait"""
+
+    def __init__(self, retry_after: int, queue_position: Optional[int] = None):
+        self.retry_after = retry_after
+        self.queue_position = queue_position
+        super().__init__(f"LLM capacity exhausted, retry after {retry_after}s")
+
+
+class LLMConcurrencyLimiter:
+    """Cluster-wide semaphore with a priority queue in front of LLM calls"""
+
+    def __init__(self, name: str = 'openai'):
+        self.redis = redis_client
+        self.max_concurrent = int(os.environ.get('LLM_MAX_CONCURRENT', 8))
+        self.max_queue = int(os.environ.get('LLM_MAX_QUEUE', 200))
+        self.max_wait = float(os.environ.get('LLM_QUEUE_MAX_WAIT', 10))
+        self.lease_seconds = int(os.environ.get('LLM_LEASE_SECONDS', 60))
+        self.avg_call_seconds = float(os.environ.get('LLM_AVG_CALL_SECONDS', 3))
+        # Waiters back off from poll_interval up to max_poll_interval with jitter; the ones
+        # next in line also block on the wake list, so a release reaches them at once
+        self.poll_interval = 0.05
+        self.max_poll_interval = 0.5
+        self.retry_backoff = 30
+        self._bypass_until = 0.0
+
+        # Hash tag keeps every key in one slot for Redis Cluster
+        prefix = f"llm:{{{name}}}"
+        self.holders_key = f"{prefix}:holders"
+        self.deadlines_key = f"{prefix}:deadlines"
+        self.queue_keys = [f"{prefix}:queue:{p}" for p in sorted(PRIORITIES, key=PRIORITIES.get)]
+        self.user_key_prefix = f"{prefix}:user:"
+        self.wake_key = f"{prefix}:wake"
+        self._acquire_script = self.redis.register_script(ACQUIRE_SCRIPT) if self.redis else None
+        self._release_script = self.redis.register_script(RELEASE_SCRIPT) if self.redis else None
+
+    @contextmanager
+    def slot(self, user_id=None, priority: str = 'interactive'):
+        """Hold one LLM slot for the duration of the block"""
+        ticket = self.acquire(user_id, priority)
+        try:
+            yield
+        finally:
+            if ticket:
+                self.release(ticket, user_id)
+
+    def acquire(self, user_id=None, priority: str = 'interactive') -> Optional[str]:
+        """Wait in the queue for a slot; returns a ticket or None when Redis is unavailable"""
+        if not self.redis or time.monotonic() < self._bypass_until:
+            return None
+
+        try:
+            ticket = self._enqueue(user_id, priority)
+        except RedisError as e:
+            # Fail open, and skip Redis for a while instead of paying the connect timeout per call
+            self._bypass_until = time.monotonic() + self.retry_backoff
+            logger.error(f"LLM limiter unavailable, continuing without it: {str(e)}")
+            return None
+
+        deadline = time.monotonic() + self.max_wait
+        position = None
+        attempt = 0
+
+        try:
+            while True:
+                position = self._acquire_script(
+                    keys=[self.holders_key, self.deadlines_key] + self.queue_keys,
+                    args=[ticket, self.max_concurrent, self._now_ms(), self.lease_seconds * 1000]
+                )
+                if position == 0:
+                    return ticket
+                remaining = deadline - time.monotonic()
+                if position < 0 or remaining <= 0:
+                    break
+
+                self._wait(position, min(self._backoff(attempt), remaining))
+                attempt += 1
+
+        except RedisError as e:
+            logger.error(f"LLM limiter error, continuing without it: {str(e)}")
+            self._abandon(ticket, user_id)
+            return None
+
+        self._abandon(ticket, user_id)
+        position = position if position and position > 0 else None
+        raise LLMBusyError(self._retry_after(position or self.max_concurrent), position)
+
+    def release(self, ticket: str, user_id=None):
+        """Give the slot back"""
+        try:
+            self._remove(ticket, [self.holders_key], user_id)
+            self._wake()
+        except RedisError as e:
+            logger.error(f"LLM limiter release error: {str(e)}")
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter, so a burst of waiters does not re-run the script in step"""
+        delay = min(self.poll_interval * 2 ** attempt, self.max_poll_interval)
+        return random.uniform(delay / 2, delay)
+
+    def _wait(self, position: int, delay: float):
+        if position > self.max_concurrent:
+            # Too far back to get the next slot; no need to hold a blocking connection
+            time.sleep(delay)
+            return
+        # A zero BLPOP timeout blocks forever
+        self.redis.blpop([self.wake_key], timeout=max(delay, 0.01))
+
+    def _wake(self):
+        """Let the waiters next in line retry now instead of after their backoff"""
+        pipe = self.redis.pipeline()
+        pipe.lpush(self.wake_key, *[1] * self.max_concurrent)
+        pipe.ltrim(self.wake_key, 0, self.max_concurrent - 1)
+        # Unclaimed wake-ups only cost a spare script run, and not for long
+        pipe.pexpire(self.wake_key, int(self.max_poll_interval * 1000))
+        pipe.execute()
+
+    def queue_length(self) -> int:
+        """Number of calls currently waiting for a slot"""
+        pipe = self.redis.pipeline()
+        for key in self.queue_keys:
+            pipe.zcard(key)
+        return sum(pipe.execute())
+
+    def _enqueue(self, user_id, priority: str) -> str:
+        waiting = self.queue_length()
+        if waiting >= self.max_queue:
+            raise LLMBusyError(self._retry_after(waiting), waiting)
+
+        queue_key = self.queue_keys[PRIORITIES.get(priority, PRIORITIES['interactive'])]
+        ticket = f"{user_id or 'anonymous'}:{uuid.uuid4().hex}"
+        now = self._now_ms()
+
+        # Fairness: a user's n-th outstanding call queues behind everyone's first calls
+        outstanding = 1
+        if user_id is not None:
+            user_key = f"{self.user_key_prefix}{user_id}"
+            pipe = self.redis.pipeline()
+            pipe.incr(user_key)
+            pipe.expire(user_key, int(self.max_wait + self.lease_seconds))
+            outstanding = pipe.execute()[0]
+
+        score = min(max(outstanding - 1, 0), 99) * 10 ** 13 + now
+
+        pipe = self.redis.pipeline()
+        pipe.zadd(queue_key, {ticket: score})
+        pipe.zadd(self.deadlines_key, {ticket: now + int((self.max_wait + 5) * 1000)})
+        pipe.execute()
+
+        return ticket
+
+    def _abandon(self, ticket: str, user_id=None):
+        try:
+            self._remove(ticket, self.queue_keys + [self.deadlines_key], user_id)
+        except RedisError as e:
+            logger.error(f"LLM limiter cleanup error: {str(e)}")
+
+    def _remove(self, ticket: str, keys, user_id=None):
+        """Drop the ticket from keys and count down the user's outstanding calls"""
+        if user_id is not None:
+            keys = keys + [f"{self.user_key_prefix}{user_id}"]
+        self._release_script(keys=keys, args=[ticket, '1' if user_id is not None else '0'])
+
+    def _retry_after(self, position: int) -> int:
+        return max(1, math.ceil(position / self.max_concurrent * self.avg_call_seconds))
+
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.time() * 1000)
+
+
+# Global limiter instance
+llm_limiter = LLMConcurrencyLimiter()
@@ -5,7 +5,9 @@
 from functools import wraps
 from flask import request, jsonify, current_app
 
+from flask_jwt_extended import get_jwt_identity
 from app.redis_setup import redis_client
+from app.utils.cache import cache
 import json
 import hashlib
 from datetime import datetime, timedelta
@@ -59,8 +61,12 @@ def rate_limit(max_requests: int = 100, window_seconds: int = 3600, per_ip: bool
         return decorated_function
     return decorator
 
-def cache_response(timeout: int = 300, key_func=None):
-    """Response caching decorator"""
+def cache_response(timeout: int = 300, key_func=None, tags=None):
+    """Response caching decorator
+
+    tags are tag names, or a callable returning them from the view arguments; responses
+    to authenticated requests are also tagged user:<id> so profile changes can drop them.
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
@@ -68,46 +74,61 @@ def cache_response(timeout: int = 300, key_func=None):
                 return f(*args, **kwargs)
             
             try:
+                user_id = _current_user_id()
+                
                 # Generate cache key
                 if key_func:
                     cache_key = key_func(*args, **kwargs)
                 else:
-                    # Default key generation
+                    # Default key generation; views fall back to the user's language and location
                     key_parts = [
                         f.__name__,
                         request.endpoint,
                         request.args.to_dict(flat=False),
-                        getattr(request, 'view_args', {})
+                        getattr(request, 'view_args', {}),
+                        user_id
                     ]
                     key_string = json.dumps(key_parts, sort_keys=True)
                     cache_key = f"cache:{hashlib.md5(key_string.encode()).hexdigest()}"
                 
                 # Try to get from cache
-                cached_result = redis_client.get(cache_key)
+                cached_result = cache.get(cache_key)
                 
                 if cached_result:
                     logger.debug(f"Cache hit for key: {cache_key}")
-                    return json.loads(cached_result)
-                
-                # Execute function and cache result
-                result = f(*args, **kwargs)
-                
-                # Only cache successful responses
-                if isinstance(result, tuple) and len(result) == 2:
-                    response_data, status_code = result
-                    if status_code == 200:
-                        redis_client.setex(cache_key, timeout, json.dumps(result))
-                        logger.debug(f"Cached result for key: {cache_key}")
-                
-                return result
+                    response_data, status_code = cached_result
+                    return jsonify(response_data), status_code
                 
             except Exception as e:
                 logger.error(f"Caching error: {str(e)}")
                 return f(*args, **kwargs)
+            
+            # Execute function and cache result (outside the try, so a cache error never runs it twice)
+            result = f(*args, **kwargs)
+            
+            # Only cache successful responses
+            if isinstance(result, tuple) and len(result) == 2 and result[1] == 200:
+                response = result[0]
+                response_data = response.get_json() if hasattr(response, 'get_json') else response
+                response_tags = list(tags(*args, **kwargs) if callable(tags) else tags or [])
+                if user_id is not None:
+                    response_tags.append(f"user:{user_id}")
+                
+                if cache.set(cache_key, [response_data, 200], timeout, tags=response_tags):
+                    logger.debug(f"Cached result for key: {cache_key}")
+            
+            return result
         
         return decorated_function
     return decorator
 
+def _current_user_id():
+    """JWT identity of the request, or None when the view does not require one"""
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
 def log_api_call(include_response: bool = False):
     """API call logging decorator"""
     def decorator(f):
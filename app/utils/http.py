@@ -0,0 +1,22 @@
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import os
+import requests
+
+
+def build_http_session(retries: int = 2, pool_size: int = None) -> requests.Session:
+    """Keep-alive session with a connection pool sized for one worker's concurrency"""
+    pool_size = pool_size or int(os.environ.get('HTTP_POOL_SIZE', 20))
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET'])
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
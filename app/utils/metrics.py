@@ -0,0 +1,206 @@
+from app.redis_setup import redis_client
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import atexit
+import bisect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; +Inf is implied
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000)
+
+# USD per 1K tokens: (prompt, completion)
+MODEL_PRICING = {
+    'gpt-3.5-turbo': (0.0015, 0.002),
+    'gpt-4': (0.03, 0.06),
+    'gpt-4o-mini': (0.00015, 0.0006)
+}
+
+METRIC_HELP = {
+    'llm_request_seconds': ('histogram', 'LLM call latency'),
+    'llm_prompt_tokens': ('histogram', 'Prompt tokens per LLM call'),
+    'llm_completion_tokens': ('histogram', 'Completion tokens per LLM call'),
+    'llm_requests_total': ('counter', 'Chat answers by source, model and outcome'),
+    'llm_cost_usd_total': ('counter', 'Estimated LLM spend'),
+    'translation_seconds': ('histogram', 'Translation call latency'),
+    'translation_requests_total': ('counter', 'Translations by outcome'),
+    'translation_memory_total': ('counter', 'Translation memory lookups by tier (local, redis, miss)'),
+    'tts_cache_total': ('counter', 'Synthesized audio cache lookups by result (hit, miss)'),
+    'stt_seconds': ('histogram', 'Speech recognition latency per recording'),
+    'email_sent_total': ('counter', 'Emails by outcome (sent, failed)'),
+    'smtp_connections_total': ('counter', 'SMTP connections opened for sending'),
+    'outbox_notifications_total': ('counter', 'Outbox notifications by outcome (sent, failed, retry, rescheduled, coalesced)')
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of one call"""
+    prompt_price, completion_price = MODEL_PRICING.get(model, MODEL_PRICING['gpt-3.5-turbo'])
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def _label_key(labels: Dict) -> str:
+    escaped = {name: str(value).replace('\\', '\\\\').replace('"', '\\"') for name, value in labels.items()}
+    return ','.join(f'{name}="{value}"' for name, value in sorted(escaped.items()))
+
+
+class MetricsRecorder:
+    """Buffers observations per process and flushes them to Redis so every worker reports into one place"""
+
+    def __init__(self):
+        self.redis = redis_client
+        self.prefix = 'metrics'
+        self.flush_interval = float(os.environ.get('METRICS_FLUSH_SECONDS', 2))
+        self.max_buffer = 500
+        self.retry_backoff = 30
+        self._paused_until = 0.0
+        self._counters: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._rollups: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, labels: Dict = None, amount: float = 1):
+        """Add to a counter"""
+        with self._lock:
+            self._counters[(f"counter:{name}", _label_key(labels or {}))] += amount
+        self._maybe_flush()
+
+    def observe(self, name: str, value: float, labels: Dict = None, buckets=LATENCY_BUCKETS):
+        """Record one histogram observation"""
+        label_key = _label_key(labels or {})
+        bucket = buckets[bisect.bisect_left(buckets, value)] if value <= buckets[-1] else '+Inf'
+
+        with self._lock:
+            # Buckets are stored non-cumulatively and summed at export time
+            self._counters[(f"hist:{name}", f"{label_key}|{bucket}")] += 1
+            self._counters[(f"hist:{name}", f"{label_key}|sum")] += value
+            self._counters[(f"hist:{name}", f"{label_key}|count")] += 1
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, name: str, labels: Dict = None):
+        """Observe the duration of a block; labels may be updated inside it"""
+        labels = dict(labels or {})
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def record_llm_call(self, model: str, source: str, latency: float = None, prompt_tokens: int = 0,
+                        completion_tokens: int = 0, error_type: str = None, user_id=None,
+                        district: str = None) -> float:
+        """Record one chat answer; returns its estimated cost"""
+        status = 'error' if error_type else 'ok'
+        labels = {'model': model, 'source': source, 'status': status}
+        if error_type:
+            labels['error_type'] = error_type
+
+        self.increment('llm_requests_total', labels)
+        if latency is not None:
+            self.observe('llm_request_seconds', latency, {'model': model, 'status': status})
+
+        cost = 0.0
+        if source == 'llm' and not error_type:
+            self.observe('llm_prompt_tokens', prompt_tokens, {'model': model}, TOKEN_BUCKETS)
+            self.observe('llm_completion_tokens', completion_tokens, {'model': model}, TOKEN_BUCKETS)
+
+            cost = estimate_cost(model, prompt_tokens, completion_tokens)
+            self.increment('llm_cost_usd_total', {'model': model}, cost)
+            with self._lock:
+                if user_id is not None:
+                    self._rollups[('user', str(user_id))] += cost
+                if district:
+                    self._rollups[('district', district.strip().title())] += cost
+
+        return cost
+
+    def flush(self):
+        """Push buffered observations to Redis in one round trip"""
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(float)
+            rollups, self._rollups = self._rollups, defaultdict(float)
+            self._buffered = 0
+            self._last_flush = time.monotonic()
+
+        if not self.redis or not (counters or rollups):
+            return
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for (key, field), amount in counters.items():
+                pipe.hincrbyfloat(f"{self.prefix}:{key}", field, amount)
+            for (group, member), cost in rollups.items():
+                pipe.zincrby(f"{self.prefix}:cost:{group}", cost, member)
+            pipe.execute()
+        except Exception as e:
+            # Drop the batch and back off rather than stall requests on a dead Redis
+            self._paused_until = time.monotonic() + self.retry_backoff
+            logger.error(f"Metrics flush error: {str(e)}")
+
+    def cost_rollup(self, group: str = 'user', limit: int = 20) -> List[Dict]:
+        """Highest-spending users or districts"""
+        self.flush()
+        rows = self.redis.zrevrange(f"{self.prefix}:cost:{group}", 0, limit - 1, withscores=True)
+        return [{group: member.decode(), 'cost_usd': round(score, 6)} for member, score in rows]
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition of everything recorded across workers"""
+        self.flush()
+        lines = []
+
+        for name, (kind, help_text) in METRIC_HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            if kind == 'counter':
+                values = self.redis.hgetall(f"{self.prefix}:counter:{name}")
+                for label_key, value in sorted(values.items()):
+                    lines.append(f"{name}{self._format_labels(label_key.decode())} {float(value)}")
+            else:
+                lines.extend(self._render_histogram(name))
+
+        return '\n'.join(lines) + '\n'
+
+    def _render_histogram(self, name: str) -> List[str]:
+        series = defaultdict(dict)
+        for field, value in self.redis.hgetall(f"{self.prefix}:hist:{name}").items():
+            label_key, part = field.decode().rsplit('|', 1)
+            series[label_key][part] = float(value)
+
+        buckets = TOKEN_BUCKETS if name.endswith('_tokens') else LATENCY_BUCKETS
+        lines = []
+        for label_key, parts in sorted(series.items()):
+            cumulative = 0
+            for bound in list(buckets) + ['+Inf']:
+                cumulative += parts.get(str(bound), 0)
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{self._format_labels(label_key, le)} {cumulative}")
+            lines.append(f"{name}_sum{self._format_labels(label_key)} {parts.get('sum', 0)}")
+            lines.append(f"{name}_count{self._format_labels(label_key)} {parts.get('count', 0)}")
+        return lines
+
+    @staticmethod
+    def _format_labels(label_key: str, extra: Optional[str] = None) -> str:
+        parts = [part for part in (label_key, extra) if part]
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def _maybe_flush(self):
+        with self._lock:
+            self._buffered += 1
+            now = time.monotonic()
+            due = self._buffered >= self.max_buffer or now - self._last_flush >= self.flush_interval
+        if due and now >= self._paused_until:
+            self.flush()
+
+
+# Global metrics instance
+metrics = MetricsRecorder()
+atexit.register(metrics.flush)
@@ -0,0 +1,161 @@
+"""Measure email throughput of the notification paths against a local SMTP sink.
+
+Each scenario sends the same number of emails through a real SMTP conversation:
+
+    welcome    send_welcome_email task, one per user
+    grievance  send_grievance_notification task, one per grievance
+    outbox     grievances written to the outbox and sent by dispatch_notification_outbox
+    bulk       welcome messages through NotificationService.send_bulk (the daily alert path)
+
+Tasks run in-process with Celery's apply(), against an in-memory SQLite
+database, so neither a broker nor Postgres is needed.
+
+    python -m benchmarks.email_benchmark --count 500 --connect-latency 0.2 --latency 0.02
+    python -m benchmarks.email_benchmark --smtp localhost:1025 --scenarios bulk
+"""
+import argparse
+import time
+
+from flask import Flask
+from flask_mail import Mail
+
+from app.extensions import db
+from app.models import Grievance, NotificationOutbox, User
+from app.services.notification_outbox import notification_outbox
+from app.services.registry import get_service, service_registry
+from app.tasks.email_tasks import dispatch_notification_outbox, send_grievance_notification, send_welcome_email
+from benchmarks.smtp_sink import SMTPSink, add_behaviour_arguments, behaviour
+
+DISTRICTS = ['Thrissur', 'Wayanad', 'Idukki', 'Palakkad', 'Alappuzha']
+PRIORITIES = ['low', 'medium', 'high', 'urgent']
+
+
+def make_app(host: str, port: int) -> Flask:
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        MAIL_SERVER=host,
+        MAIL_PORT=port,
+        MAIL_USE_TLS=False,
+        MAIL_USE_SSL=False
+    )
+    db.init_app(app)
+    Mail(app)
+    service_registry.init_app(app)
+    return app
+
+
+def seed(count: int):
+    """count users, each with one grievance"""
+    users = [
+        User(name=f"Farmer {i}", email=f"farmer{i}@example.com", password_hash='x',
+             location=DISTRICTS[i % len(DISTRICTS)])
+        for i in range(count)
+    ]
+    grievances = [
+        Grievance(user=user, subject=f"Flooded paddy field {i}", description='Water has stood in the field for a week.',
+                  category='crop_insurance', priority=PRIORITIES[i % len(PRIORITIES)])
+        for i, user in enumerate(users)
+    ]
+    db.session.add_all(grievances)
+    db.session.commit()
+    return users, grievances
+
+
+def task_ok(result) -> bool:
+    # A task that exhausted its retries returns a dict with status 'failed'
+    return isinstance(result.result, dict) and result.result.get('status') == 'success'
+
+
+def run_welcome(users, grievances) -> int:
+    return sum(not task_ok(send_welcome_email.apply(args=[user.email, user.name])) for user in users)
+
+
+def run_grievance(users, grievances) -> int:
+    return sum(
+        not task_ok(send_grievance_notification.apply(args=[grievance.id, grievance.user.location]))
+        for grievance in grievances
+    )
+
+
+def run_outbox(users, grievances) -> int:
+    NotificationOutbox.query.delete()
+    for grievance in grievances:
+        notification_outbox.enqueue_grievance(grievance, grievance.user.location)
+    db.session.commit()
+
+    failed = 0
+    while NotificationOutbox.query.filter_by(status='pending').count():
+        result = dispatch_notification_outbox.apply().result
+        failed += result.get('failed', 0) + result.get('retry', 0)
+        if not result.get('sent'):
+            break
+    return failed
+
+
+def run_bulk(users, grievances) -> int:
+    notification_service = get_service('notification')
+    messages = (notification_service.build_welcome_message(user.email, user.name) for user in users)
+    return notification_service.send_bulk(messages)['failed']
+
+
+SCENARIOS = {'welcome': run_welcome, 'grievance': run_grievance, 'outbox': run_outbox, 'bulk': run_bulk}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=200, help='emails per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--smtp', help='host:port of a running sink instead of starting one')
+    parser.add_argument('--port', type=int, default=8025, help='port for the in-process sink')
+    parser.add_argument('--rate', type=float, default=0, help='MAIL_RATE_PER_SECOND (0 = unthrottled)')
+    parser.add_argument('--per-connection', type=int, default=100, help='MAIL_MAX_PER_CONNECTION')
+    parser.add_argument('--digest', action='store_true', help='grievance digest mode for the outbox scenario')
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    sink = None
+    if args.smtp:
+        host, port = args.smtp.rsplit(':', 1)
+        port = int(port)
+    else:
+        host, port = '127.0.0.1', args.port
+        sink = SMTPSink(host, port, **behaviour(args))
+        sink.start()
+
+    app = make_app(host, port)
+    try:
+        with app.app_context():
+            db.create_all()
+            users, grievances = seed(args.count)
+
+            mailer = get_service('notification').mailer
+            mailer.rate_per_second = args.rate
+            mailer.max_per_connection = args.per_connection
+            notification_outbox.digest_enabled = args.digest
+
+            print(f"{args.count} emails per scenario via {host}:{port}\n")
+            print(f"{'scenario':<10} {'seconds':>8} {'msg/s':>8} {'conns':>6} {'accepted':>9} "
+                  f"{'deferred':>9} {'dropped':>8} {'failed':>7}")
+
+            for name in args.scenarios.split(','):
+                if sink:
+                    sink.reset()
+                start = time.perf_counter()
+                failed = SCENARIOS[name](users, grievances)
+                elapsed = time.perf_counter() - start
+
+                if sink:
+                    stats = sink.stats
+                    print(f"{name:<10} {elapsed:>8.2f} {stats['messages'] / elapsed:>8.1f} {stats['connections']:>6} "
+                          f"{stats['messages']:>9} {stats['deferred']:>9} {stats['dropped']:>8} {failed:>7}")
+                else:
+                    print(f"{name:<10} {elapsed:>8.2f} {args.count / elapsed:>8.1f} {'-':>6} {'-':>9} "
+                          f"{'-':>9} {'-':>8} {failed:>7}")
+    finally:
+        if sink:
+            sink.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Local SMTP server that accepts and discards mail, for measuring the mailers offline.
+
+Counts connections, messages and recipients, and can behave like a slow or
+unreliable provider: per-connection handshake latency, per-message latency,
+temporary failures (451), rejected recipients (550) and dropped connections
+(421). Run it standalone and point MAIL_SERVER/MAIL_PORT at it:
+
+    python -m benchmarks.smtp_sink --port 8025 --latency 0.05 --fail-rate 0.01
+
+or start SMTPSink in-process, as benchmarks.email_benchmark does.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP
+
+
+class SinkHandler:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, connect_latency: float = 0.0,
+                 fail_rate: float = 0.0, reject_rate: float = 0.0, drop_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.connect_latency = connect_latency
+        self.fail_rate = fail_rate
+        self.reject_rate = reject_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.stats = Counter()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        # Stands in for the TCP and TLS handshake a real provider costs per connection
+        if self.connect_latency:
+            await asyncio.sleep(self.connect_latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if self.random.random() < self.reject_rate:
+            self.stats['rejected'] += 1
+            return '550 5.1.1 Mailbox unavailable (injected)'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        roll = self.random.random()
+        if roll < self.drop_rate:
+            self.stats['dropped'] += 1
+            asyncio.get_running_loop().call_soon(server.transport.close)
+            return '421 4.4.2 Closing connection (injected)'
+        if roll < self.drop_rate + self.fail_rate:
+            self.stats['deferred'] += 1
+            return '451 4.3.0 Temporary failure (injected)'
+
+        self.stats['messages'] += 1
+        self.stats['recipients'] += len(envelope.rcpt_tos)
+        return '250 Message accepted'
+
+
+class CountingSMTP(SMTP):
+    def connection_made(self, transport):
+        self.event_handler.stats['connections'] += 1
+        super().connection_made(transport)
+
+
+class SMTPSink(Controller):
+    """SMTP sink served from a background thread; use as a context manager"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8025, **behaviour):
+        super().__init__(SinkHandler(**behaviour), hostname=host, port=port)
+
+    def factory(self):
+        return CountingSMTP(self.handler, **self.SMTP_kwargs)
+
+    @property
+    def stats(self) -> Counter:
+        return self.handler.stats
+
+    def reset(self):
+        self.handler.stats.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def add_behaviour_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per message')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random seconds per message')
+    parser.add_argument('--connect-latency', type=float, default=0.0, help='seconds per connection')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of messages deferred with 451')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='share of recipients refused with 550')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='share of messages that drop the connection')
+    parser.add_argument('--seed', type=int)
+
+
+def behaviour(args) -> dict:
+    return {
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'connect_latency': args.connect_latency,
+        'fail_rate': args.fail_rate,
+        'reject_rate': args.reject_rate,
+        'drop_rate': args.drop_rate,
+        'seed': args.seed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--report-every', type=float, default=5.0)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    with SMTPSink(args.host, args.port, **behaviour(args)) as sink:
+        print(f"SMTP sink listening on {args.host}:{args.port} (Ctrl-C to stop)")
+        try:
+            while True:
+                time.sleep(args.report_every)
+                print(dict(sink.stats))
+        except KeyboardInterrupt:
+            pass
+    print(dict(sink.stats))
+
+
+if __name__ == '__main__':
+    main()
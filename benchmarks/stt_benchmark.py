@@ -0,0 +1,98 @@
+"""Compare speech recognition backends on the same recordings.
+
+Fixtures are WAV/AIFF/FLAC files named <anything>.<language>.wav (e.g.
+pest_question.ml.wav), each optionally next to a reference transcript with
+the same name and a .txt extension. Every backend sees the same preprocessed
+segments, so the numbers compare recognition only.
+
+    python -m benchmarks.stt_benchmark tests/fixtures/audio --backends google,vosk
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+
+from app.services.audio_preprocessing import audio_preprocessor
+from app.services.speech_backends import GoogleSpeechBackend, VoskSpeechBackend
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length"""
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / max(len(ref), 1)
+
+
+def load_fixtures(directory: str):
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.*.*'))):
+        stem, extension = os.path.splitext(path)
+        if extension.lower() not in ('.wav', '.aiff', '.flac'):
+            continue
+
+        language = os.path.splitext(stem)[1].lstrip('.')
+        reference_path = f"{stem}.txt"
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding='utf-8') as reference_file:
+                reference = reference_file.read().strip()
+
+        with open(path, 'rb') as audio_file:
+            segments = audio_preprocessor.process(audio_file.read())
+        fixtures.append({'name': os.path.basename(path), 'language': language,
+                         'segments': segments, 'reference': reference})
+    return fixtures
+
+
+def run(backend, fixtures, repeat: int):
+    latencies, errors, failures = [], [], 0
+    for fixture in fixtures:
+        if not backend.supports(fixture['language']):
+            continue
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                texts = [backend.recognize(segment['audio'], fixture['language']) for segment in fixture['segments']]
+            except Exception as e:
+                failures += 1
+                print(f"  {backend.name} failed on {fixture['name']}: {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+
+            if fixture['reference'] is not None:
+                errors.append(word_error_rate(fixture['reference'], ' '.join(t for t in texts if t)))
+    return latencies, errors, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('fixtures', help='directory of <name>.<language>.wav recordings')
+    parser.add_argument('--backends', default='google,vosk')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    backends = {'google': GoogleSpeechBackend, 'vosk': VoskSpeechBackend}
+    fixtures = load_fixtures(args.fixtures)
+    speech = sum(s['end'] - s['start'] for f in fixtures for s in f['segments'])
+    print(f"{len(fixtures)} recordings, {speech:.1f}s of speech\n")
+    print(f"{'backend':<8} {'runs':>5} {'p50 s':>8} {'p95 s':>8} {'WER':>6} {'fails':>6}")
+
+    for name in args.backends.split(','):
+        latencies, errors, failures = run(backends[name](), fixtures, args.repeat)
+        if not latencies:
+            print(f"{name:<8} {'-':>5} {'-':>8} {'-':>8} {'-':>6} {failures:>6}")
+            continue
+        latencies.sort()
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        wer = f"{statistics.mean(errors):.2f}" if errors else '-'
+        print(f"{name:<8} {len(latencies):>5} {statistics.median(latencies):>8.3f} {p95:>8.3f} {wer:>6} {failures:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,18 +5,80 @@ bind = "0.0.0.0:5000"
 backlog = 2048
 
 # Worker processes
+# GUNICORN_WORKER_CLASS selects the serving mode:
+#   sync    - one request per worker (default, CPU-bound work)
+#   gthread - GUNICORN_THREADS requests per worker
+#   gevent  - up to GUNICORN_WORKER_CONNECTIONS concurrent I/O-bound requests per worker;
+#             CPU-bound and blocking C work (TTS, VAD, Vosk, Marian) must go through
+#             app.utils.batching.run_blocking so it runs on native threads, not the hub
 workers = int(os.environ.get('GUNICORN_WORKERS', 4))
-worker_class = "sync"
-worker_connections = 1000
-timeout = 30
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', 1 if worker_class == 'sync' else 8))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
 keepalive = 2
 
+# The app is preloaded below, so gevent must patch sockets before any module
+# (requests, redis, openai, googletrans) is imported by the master process.
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+    # psycopg2 is a C extension and needs its own wait callback to yield to the hub
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+
 # Restart workers after this many requests, to help prevent memory leaks
 max_requests = 1000
 max_requests_jitter = 100
 
-# Load application code before forking worker processes
-preload_app = True
+# Load application code before forking worker processes. Preloaded code lives in the
+# master, so reloading workers cannot pick up changes; GUNICORN_RELOAD=true turns
+# preloading off for local development
+reload = os.environ.get('GUNICORN_RELOAD', 'false').lower() == 'true'
+preload_app = not reload
+
+
+def when_ready(server):
+    """Settle the TTS cache format once in the master, before workers inherit it"""
+    from app.services.tts_cache import tts_cache
+    tts_cache.check_encoder()
+
+
+def post_fork(server, worker):
+    """Drop connections inherited from the preloaded master; each worker opens its own"""
+    from app.redis_setup import redis_client
+    from app.services.registry import service_registry
+
+    service_registry.reset()
+    redis_client.connection_pool.reset()
+
+
+def post_worker_init(worker):
+    """Build the TTS engines and translation models before the worker accepts requests"""
+    from app.services.registry import service_registry
+
+    if not preload_app:
+        # Each worker imported the app itself, so when_ready's check never reached it
+        from app.services.tts_cache import tts_cache
+        tts_cache.check_encoder()
+
+    if os.environ.get('TTS_WARMUP', 'true').lower() == 'true':
+        try:
+            service_registry.get('audio').tts_pool.warm_up()
+        except Exception as e:
+            worker.log.warning(f"TTS warm-up failed, engines will be built on demand: {str(e)}")
+
+    if os.environ.get('TRANSLATION_WARMUP', 'true').lower() == 'true':
+        from app.services.translation_backends import get_translation_backend
+        try:
+            get_translation_backend().warm_up()
+        except Exception as e:
+            worker.log.warning(f"Translation warm-up failed, models will load on demand: {str(e)}")
+
 
 # Logging
 accesslog = "-"
@@ -36,4 +98,4 @@ tmp_upload_dir = None
 
 # SSL
 keyfile = None
-certfile = None
\ No newline at end of file
+certfile = None
@@ -15,7 +15,7 @@ class TestEmailTasks:
             result = send_welcome_email.apply(args=['test@example.com', 'Test User'])
             
             assert result.result['status'] == 'success'
-            mock_send_email.assert_called_once_with('test@example.com', 'Test User')
+            mock_send_email.assert_called_once_with('test@example.com', 'Test User', language='en')
 
     @patch('app.services.notification_service.NotificationService.send_grievance_notification')
     def test_send_grievance_notification_task(self, mock_send_notification, app, sample_user):
@@ -1,8 +1,39 @@
+import fakeredis
+import io
+import os
 import pytest
-from unittest.mock import Mock, patch
-from app.services.ai_service import AIService
+import smtplib
+import time
+import wave
+from datetime import datetime, timedelta
+from flask import Flask
+from flask_mail import Message
+from app.extensions import db
+from app.models import Grievance, NotificationOutbox, User
+from unittest.mock import MagicMock, Mock, patch
+from app.services.ai_services import AIService
+from app.services.audio_service import AudioService
+from app.services.bulk_mailer import BulkMailer
+from app.services.chat_history import ChatHistoryCache
+from app.services.chat_job_service import ChatJobStore
+from app.services.email_templates import EmailTemplates
+from app.services.intent_router import IntentRouter
+from app.services.notification_outbox import NotificationOutboxService
+from app.services.language_id import detect_language, resolve_languages
+from app.services.prompt_builder import PromptBuilder, render_system_prompt
+from app.services.registry import ServiceRegistry
+from app.services.retrieval_service import BM25Index, KnowledgeBaseService
+from app.services.speech_backends import FallbackSpeechBackend, VoskSpeechBackend
+from app.services.translation_backends import FallbackTranslationBackend, MarianTranslationBackend
+from app.services.translation_memory import TranslationMemory
 from app.services.translation_service import TranslationService
+from app.services.tts_cache import TTSCache
+from app.services.tts_pool import TTSEnginePool
 from app.services.weather_service import WeatherService
+from app.utils.audio_stream import iter_binary_audio
+from app.utils.batching import MicroBatcher
+from app.utils.cache import CacheManager
+from app.utils.concurrency import LLMBusyError, LLMConcurrencyLimiter
 
 class TestAIService:
     def test_ai_service_initialization(self):
@@ -32,6 +63,411 @@ class TestAIService:
         assert "fertilizer" in response.lower()
         assert "soil testing" in response.lower()
 
+class TestPromptBuilder:
+    def test_system_prompt_cached_per_location_and_language(self):
+        """Test system prompt rendering is cached."""
+        first = render_system_prompt('Thrissur', 'ml')
+        second = render_system_prompt('Thrissur', 'ml')
+        
+        assert first is second
+        assert 'Thrissur' in first
+        assert 'Malayalam' in first
+
+    def test_history_order_and_token_count(self):
+        """Test history is placed oldest first before the user message."""
+        builder = PromptBuilder(token_budget=3000)
+        history = [
+            {'user_message': 'first question', 'bot_response': 'first answer'},
+            {'user_message': 'second question', 'bot_response': 'second answer'}
+        ]
+        
+        prompt = builder.build("new question", {'chat_history': history})
+        contents = [m['content'] for m in prompt['messages']]
+        
+        assert prompt['messages'][0]['role'] == 'system'
+        assert contents[1:] == ['first question', 'first answer', 'second question', 'second answer', 'new question']
+        assert prompt['history_used'] == 2
+        assert prompt['prompt_tokens'] > 0
+
+    def test_history_trimmed_to_budget(self):
+        """Test older exchanges are dropped when over the token budget."""
+        base_tokens = PromptBuilder(token_budget=100000).build("question")['prompt_tokens']
+        builder = PromptBuilder(token_budget=base_tokens + 60)
+        history = [
+            {'user_message': 'old ' * 200, 'bot_response': 'old answer'},
+            {'user_message': 'recent question', 'bot_response': 'recent answer'}
+        ]
+        
+        prompt = builder.build("question", {'chat_history': history})
+        
+        assert prompt['history_used'] == 1
+        assert prompt['messages'][1]['content'] == 'recent question'
+        assert prompt['prompt_tokens'] <= builder.token_budget
+
+class TestKnowledgeBase:
+    def _knowledge_base(self):
+        kb = KnowledgeBaseService()
+        kb.index.add_document(1, 'Banana Wilt Control', 'Panama wilt in banana is caused by Fusarium. Remove infected plants and apply lime to the pits.')
+        kb.index.add_document(2, 'Coconut Fertilizer Schedule', 'Apply NPK fertilizer to coconut palms twice a year, before and after the monsoon.')
+        return kb
+
+    def test_bm25_ranks_relevant_passage_first(self):
+        """Test BM25 search returns the matching article first."""
+        results = self._knowledge_base().index.search("banana wilt")
+        
+        assert results[0]['doc_id'] == 1
+        assert results[0]['coverage'] == 1.0
+
+    def test_remove_document(self):
+        """Test removed articles are no longer returned."""
+        index = BM25Index()
+        index.add_document(1, 'Soil Testing', 'Test soil pH every season.')
+        index.remove_document(1)
+        
+        assert len(index) == 0
+        assert index.search("soil pH") == []
+
+    def test_confident_lookup_answers_directly(self):
+        """Test a well-covered question is answered from the articles."""
+        result = self._knowledge_base().lookup("How to control banana wilt?")
+        
+        assert result['answer'] is not None
+        assert 'Banana Wilt Control' in result['answer']
+
+    def test_partial_match_returns_grounding_only(self):
+        """Test a partially covered question yields grounding passages but no answer."""
+        result = self._knowledge_base().lookup("coconut fertilizer schedule for pests")
+        
+        assert result['answer'] is None
+        assert result['passages'][0]['doc_id'] == 2
+
+class TestBulkMailer:
+    def test_messages_share_a_connection_and_reconnect_on_failure(self):
+        """Test bulk sends reuse one SMTP connection and recover from a dropped one."""
+        app = Flask(__name__)
+        connections = [MagicMock(), MagicMock()]
+        connections[0].__enter__.return_value.send.side_effect = [None, smtplib.SMTPServerDisconnected()]
+        app.extensions['mail'] = Mock()
+        app.extensions['mail'].connect.side_effect = connections
+        
+        mailer = BulkMailer()
+        mailer.rate_per_second = 0
+        mailer.retry_delay = 0
+        messages = [Message(subject='Alert', sender='a@b.c', recipients=[f"farmer{i}@example.com"]) for i in range(4)]
+        
+        with app.app_context():
+            result = mailer.send_many(messages)
+        
+        assert result == {'sent': 4, 'failed': 0, 'connections': 2, 'failed_recipients': []}
+        assert connections[1].__enter__.return_value.send.call_count == 3
+    
+    def test_bad_message_fails_alone(self):
+        """Test a message that cannot be built or sent does not abort the rest of the batch."""
+        app = Flask(__name__)
+        connection = MagicMock()
+        connection.__enter__.return_value.send.side_effect = [ValueError('Bad header'), None, None]
+        app.extensions['mail'] = Mock()
+        app.extensions['mail'].connect.return_value = connection
+        
+        mailer = BulkMailer()
+        mailer.rate_per_second = 0
+        messages = [Message(subject='Alert', sender='a@b.c', recipients=[f"farmer{i}@example.com"]) for i in range(3)]
+        
+        def broken_builder():
+            raise KeyError('name')
+        
+        failed = []
+        with app.app_context():
+            result = mailer.send_many([messages[0], broken_builder, messages[1], lambda: messages[2]], on_failure=failed.append)
+        
+        assert result['sent'] == 2 and result['failed'] == 2 and result['connections'] == 1
+        assert failed == [messages[0], broken_builder]
+
+    def test_login_failure_aborts_the_batch(self):
+        """Test rejected credentials fail the whole batch after one connection attempt."""
+        app = Flask(__name__)
+        connection = MagicMock()
+        connection.__enter__.side_effect = smtplib.SMTPAuthenticationError(535, b'Authentication failed')
+        app.extensions['mail'] = Mock()
+        app.extensions['mail'].connect.return_value = connection
+        
+        mailer = BulkMailer()
+        mailer.rate_per_second = 0
+        mailer.retry_delay = 0
+        messages = [Message(subject='Alert', sender='a@b.c', recipients=[f"farmer{i}@example.com"]) for i in range(3)]
+        built = []
+        
+        def builder():
+            built.append(messages[2])
+            return messages[2]
+        
+        failed = []
+        with app.app_context():
+            result = mailer.send_many([messages[0], messages[1], builder], on_failure=failed.append)
+        
+        assert app.extensions['mail'].connect.call_count == 1
+        assert result['sent'] == 0 and result['failed'] == 3
+        assert failed == [messages[0], messages[1], builder]
+        assert built == []
+
+class TestEmailTemplates:
+    def test_renders_localised_template_from_cache(self):
+        """Test emails are translated once per language and escape recipient fields in HTML."""
+        templates = EmailTemplates()
+        
+        email = templates.render('welcome', 'ml', name='<Ravi>')
+        
+        assert email['subject'] == templates.translate('welcome.subject', 'ml')
+        assert templates.translate('welcome.title', 'ml') in email['body']
+        assert '&lt;Ravi&gt;' in email['html'] and '<Ravi>' in email['body']
+        
+        with patch.object(templates, '_compile') as mock_compile:
+            templates.render('welcome', 'ml', name='Asha')
+            mock_compile.assert_not_called()
+
+class TestNotificationOutbox:
+    @staticmethod
+    def _app(count):
+        """In-memory app with count grievances queued in the outbox"""
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(app)
+        outbox = NotificationOutboxService()
+        
+        with app.app_context():
+            db.create_all()
+            user = User(name='Ravi', email='ravi@example.com', password_hash='x', location='Thrissur')
+            grievances = [Grievance(user=user, subject='Canal', description='Dry', category='water_supply') for _ in range(count)]
+            db.session.add_all(grievances)
+            db.session.flush()
+            for grievance in grievances:
+                outbox.enqueue('grievance', f"grievance:{grievance.id}", grievance_id=grievance.id, location='Thrissur')
+            db.session.commit()
+        return app, outbox
+    
+    @staticmethod
+    def _notification_service(send_bulk):
+        notification_service = Mock()
+        notification_service.build_grievance_message.side_effect = lambda data, location: Mock(grievance_id=data['id'])
+        notification_service.send_bulk.side_effect = send_bulk
+        return notification_service
+    
+    def test_batch_coalesces_duplicates_and_retries_failures(self):
+        """Test one email per dedup key and a later retry for undelivered ones."""
+        app, outbox = self._app(2)
+        
+        def send_bulk(messages, on_failure, on_sent):
+            on_sent(messages[0])
+            on_failure(messages[1])
+        
+        with app.app_context(), patch('app.services.notification_outbox.get_service',
+                                      return_value=self._notification_service(send_bulk)) as get_service:
+            outbox.enqueue('grievance', 'grievance:1', grievance_id=1, location='Thrissur')
+            db.session.commit()
+            
+            result = outbox.dispatch_batch()
+            
+            assert result == {'sent': 1, 'failed': 0, 'retry': 1, 'rescheduled': 0, 'coalesced': 1}
+            assert len(get_service.return_value.send_bulk.call_args[0][0]) == 2
+            assert [row.status for row in NotificationOutbox.query.order_by(NotificationOutbox.id)] == ['sent', 'pending', 'sent']
+            assert outbox.dispatch_batch() is None
+    
+    def test_send_runs_outside_the_claim_transaction(self):
+        """Test rows are committed as 'sending' before SMTP starts, and a dead dispatcher's lease expires."""
+        app, outbox = self._app(2)
+        seen = {}
+        
+        def send_bulk(messages, on_failure, on_sent):
+            seen['in_transaction'] = db.session().in_transaction()
+            seen['statuses'] = [row.status for row in NotificationOutbox.query]
+            for message in messages:
+                on_sent(message)
+        
+        with app.app_context(), patch('app.services.notification_outbox.get_service',
+                                      return_value=self._notification_service(send_bulk)):
+            stale = NotificationOutbox.query.first()
+            stale.status, stale.available_at = 'sending', datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+            
+            assert outbox.dispatch_batch()['sent'] == 2
+            assert seen == {'in_transaction': False, 'statuses': ['sending', 'sending']}
+            assert {row.status for row in NotificationOutbox.query} == {'sent'}
+    
+    def test_disconnect_mid_batch_keeps_delivered_rows_sent(self):
+        """Test rows delivered before the SMTP connection died are not sent again."""
+        app, outbox = self._app(3)
+        
+        def send_bulk(messages, on_failure, on_sent):
+            on_sent(messages[0])
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        
+        with app.app_context(), patch('app.services.notification_outbox.get_service',
+                                      return_value=self._notification_service(send_bulk)):
+            result = outbox.dispatch_batch()
+            rows = NotificationOutbox.query.order_by(NotificationOutbox.id).all()
+            
+            assert result == {'sent': 1, 'failed': 0, 'retry': 2, 'rescheduled': 0, 'coalesced': 0}
+            assert [(row.status, row.attempts) for row in rows] == [('sent', 0), ('pending', 1), ('pending', 1)]
+            assert rows[1].available_at > datetime.utcnow()
+    
+    def test_failed_rows_back_off_then_give_up(self):
+        """Test retries wait exponentially longer and stop after the last attempt."""
+        app, outbox = self._app(1)
+        outbox.max_attempts = 3
+        
+        def send_bulk(messages, on_failure, on_sent):
+            on_failure(messages[0])
+        
+        with app.app_context(), patch('app.services.notification_outbox.get_service',
+                                      return_value=self._notification_service(send_bulk)):
+            delays = []
+            for _ in range(3):
+                before = datetime.utcnow()
+                outbox.dispatch_batch()
+                row = NotificationOutbox.query.one()
+                delays.append(round((row.available_at - before).total_seconds() / outbox.retry_delay))
+                row.available_at = before
+                db.session.commit()
+            
+            assert delays[:2] == [1, 2]
+            assert (row.status, row.attempts) == ('failed', 3)
+            assert outbox.dispatch_batch() is None
+    
+    def test_digest_larger_than_batch_is_sent_once(self):
+        """Test a window holding more grievances than batch_size becomes one digest, and late rows move on."""
+        app, outbox = self._app(0)
+        outbox.digest_enabled = True
+        outbox.batch_size = 2
+        
+        def send_bulk(messages, on_failure, on_sent):
+            for message in messages:
+                on_sent(message)
+        
+        notification_service = self._notification_service(send_bulk)
+        notification_service.build_grievance_digest_message.side_effect = lambda grievances, *args: Mock(count=len(grievances))
+        
+        with app.app_context(), patch('app.services.notification_outbox.get_service', return_value=notification_service):
+            user = User(name='Ravi', email='ravi@example.com', password_hash='x', location='Thrissur')
+            grievances = [Grievance(user=user, subject='Flood', description='Field under water', category='crop_insurance')
+                          for _ in range(6)]
+            db.session.add_all(grievances)
+            db.session.flush()
+            for grievance in grievances[:5]:
+                outbox.enqueue_grievance(grievance, 'Thrissur')
+            NotificationOutbox.query.update({'available_at': datetime.utcnow() - timedelta(seconds=1)})
+            db.session.commit()
+            
+            result = outbox.dispatch_batch()
+            
+            assert result['sent'] == 1 and result['coalesced'] == 4
+            assert notification_service.send_bulk.call_args[0][0][0].count == 5
+            
+            # Committed after its window's digest went out
+            late = outbox.enqueue_grievance(grievances[5], 'Thrissur')
+            late.dedup_key = NotificationOutbox.query.first().dedup_key
+            late.available_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+            
+            assert outbox.dispatch_batch()['rescheduled'] == 1
+            assert notification_service.send_bulk.call_count == 1
+            assert late.status == 'pending' and late.available_at > datetime.utcnow()
+    
+    def test_non_urgent_grievances_share_a_district_digest(self):
+        """Test digest mode holds routine grievances for the window and sends urgent ones at once."""
+        outbox = NotificationOutboxService()
+        outbox.digest_enabled = True
+        
+        with patch('app.services.notification_outbox.db'):
+            routine = [outbox.enqueue_grievance(Mock(id=i, priority='medium'), 'Thrissur') for i in range(2)]
+            urgent = outbox.enqueue_grievance(Mock(id=3, priority='urgent'), 'Thrissur')
+        
+        assert routine[0].kind == 'grievance_digest' and routine[0].dedup_key == routine[1].dedup_key
+        assert routine[0].available_at > datetime.utcnow()
+        assert urgent.kind == 'grievance' and urgent.available_at is None
+
+class TestIntentRouter:
+    def test_classifies_structured_questions(self):
+        """Test weather, price and scheme questions are recognised."""
+        router = IntentRouter()
+        
+        assert router.classify("What's the weather tomorrow?")['intent'] == 'weather_forecast'
+        assert router.classify("rice price in Kochi")['entities'] == {'location': 'Kochi', 'commodity': 'Rice'}
+        assert router.classify("PM-KISAN eligibility")['entities']['scheme'] == 'PM-KISAN'
+
+    def test_open_ended_questions_go_to_llm(self):
+        """Test advisory questions are not routed."""
+        router = IntentRouter()
+        
+        assert router.classify("Should I spray pesticide if it rains tomorrow?") is None
+        assert router.classify("How to control coconut pests") is None
+    
+    def test_agronomy_questions_with_topic_words_go_to_llm(self):
+        """Test crop-advice questions mentioning rain, wind, rates or applying are not routed."""
+        router = IntentRouter()
+        
+        for question in [
+            "When do I apply urea to paddy?",
+            "Pests appeared on my rice after heavy rain, what to do?",
+            "Wind damaged my banana plants",
+            "Is rain good for pepper?",
+            "What is the seed rate for rice?",
+            "What documents do I need to apply for a crop loan?"
+        ]:
+            assert router.classify(question) is None, question
+        
+        assert router.classify("price of pepper in Kochi mandi")['intent'] == 'market_price'
+        assert router.classify("weather in Thrissur today")['intent'] == 'weather_current'
+        assert router.classify("Which schemes are available for farmers?")['intent'] == 'scheme_list'
+
+    def test_weather_answer_uses_user_location(self):
+        """Test weather answers fall back to the user's location."""
+        router = IntentRouter()
+        weather_service = Mock()
+        weather_service.get_current_weather.return_value = {
+            'location': 'Thrissur', 'description': 'Light Rain', 'temperature': 27.5,
+            'feels_like': 30.1, 'humidity': 88, 'wind_speed': 3.2
+        }
+        
+        with patch('app.services.intent_router.get_service', return_value=weather_service) as get_service:
+            result = router.route("Is it raining now?", {'user_location': 'Thrissur'})
+        
+        get_service.assert_called_with('weather')
+        weather_service.get_current_weather.assert_called_once_with('Thrissur')
+        assert result['intent'] == 'weather_current'
+        assert 'Light Rain' in result['response']
+
+    @patch('openai.ChatCompletion.create')
+    def test_routed_intent_skips_llm(self, mock_openai):
+        """Test scheme questions are answered without calling the model."""
+        result = AIService().get_response_with_usage("PM-KISAN eligibility")
+        
+        assert result['source'] == 'intent'
+        assert 'pmkisan.gov.in' in result['response']
+        mock_openai.assert_not_called()
+
+class TestLanguageId:
+    def test_detects_language_from_script(self):
+        """Test each supported script maps to its language."""
+        assert detect_language("How do I grow rice?") == 'en'
+        assert detect_language("നെല്ല് എങ്ങനെ കൃഷി ചെയ്യാം?") == 'ml'
+        assert detect_language("धान की खेती कैसे करें") == 'hi'
+        assert detect_language("நெல் சாகுபடி") == 'ta'
+        assert detect_language("వరి సాగు") == 'te'
+        assert detect_language("12345") is None
+
+    def test_resolve_languages_prefers_message_script(self):
+        """Test Indic-script messages override the requested reply language."""
+        assert resolve_languages("നെല്ല് കൃഷി", 'en') == ('ml', 'ml')
+        assert resolve_languages("rice farming", 'ml') == ('en', 'ml')
+
+    def test_translation_skipped_when_already_in_target(self):
+        """Test text already in the target language is not sent to the backend."""
+        translation_service = TranslationService()
+        translation_service.backend = Mock()
+        
+        assert translation_service.translate("നെല്ല് കൃഷി", 'ml', 'en') == "നെല്ല് കൃഷി"
+        translation_service.backend.translate_batch.assert_not_called()
+
 class TestTranslationService:
     def test_translation_service_initialization(self):
         """Test translation service initialization."""
@@ -45,6 +481,94 @@ class TestTranslationService:
         result = translation_service.translate("Hello", 'en', 'en')
         assert result == "Hello"
 
+    def test_sentences_reused_from_translation_memory(self):
+        """Test only sentences missing from the translation memory reach the backend."""
+        translation_service = TranslationService()
+        translation_service.memory = TranslationMemory()
+        translation_service.memory.redis = None
+        translation_service.backend = Mock()
+        translation_service.backend.translate_batch.side_effect = lambda texts, target, source: [f"[{t}]" for t in texts]
+        
+        translation_service.translate("Water daily. Add compost.", 'ml', 'en')
+        result = translation_service.translate("Add compost.\nHarvest in May.", 'ml', 'en')
+        
+        assert result == "[Add compost.]\n[Harvest in May.]"
+        translation_service.backend.translate_batch.assert_called_with(['Harvest in May.'], 'ml', 'en')
+
+    def test_translate_many_dedupes_and_keeps_order(self):
+        """Test list translation makes one backend call and returns results in order."""
+        translation_service = TranslationService()
+        translation_service.memory = TranslationMemory()
+        translation_service.memory.redis = None
+        translation_service.backend = Mock()
+        translation_service.backend.translate_batch.side_effect = lambda texts, target, source: [f"[{t}]" for t in texts]
+        
+        result = translation_service.translate_many(["Rice", "", "Pepper", "Rice", "നെല്ല്"], 'ml')
+        
+        assert result == ["[Rice]", "", "[Pepper]", "[Rice]", "നെല്ല്"]
+        translation_service.backend.translate_batch.assert_called_once_with(['Rice', 'Pepper'], 'ml', 'en')
+
+    def test_translate_records_skips_fields_already_in_target(self):
+        """Test each field is judged by its own script, not by its record."""
+        translation_service = TranslationService()
+        translation_service.memory = TranslationMemory()
+        translation_service.memory.redis = None
+        translation_service.backend = Mock()
+        translation_service.backend.translate_batch.side_effect = lambda texts, target, source: [f"[{t}]" for t in texts]
+        records = [{'title': 'PM-KISAN പദ്ധതി വഴി ധനസഹായം', 'steps': ['Visit Krishi Bhavan', 'അപേക്ഷ നൽകുക']}]
+        
+        translated = translation_service.translate_records(records, ['title', 'steps'], 'ml')
+        
+        assert translated == [{'title': 'PM-KISAN പദ്ധതി വഴി ധനസഹായം', 'steps': ['[Visit Krishi Bhavan]', 'അപേക്ഷ നൽകുക']}]
+        # Callers hand in lists shared by service caches, which must stay in English
+        assert records[0]['steps'] == ['Visit Krishi Bhavan', 'അപേക്ഷ നൽകുക']
+
+    def test_concurrent_sentences_share_one_batch(self):
+        """Test items submitted within the wait window reach the model as one batch."""
+        batches = []
+        batcher = MicroBatcher(lambda items: batches.append(items) or [i.upper() for i in items],
+                               max_batch_size=8, max_wait_ms=200)
+        
+        futures = [batcher.submit(text) for text in ('rice', 'pepper', 'banana')]
+        
+        assert [future.result(timeout=2) for future in futures] == ['RICE', 'PEPPER', 'BANANA']
+        assert batches == [['rice', 'pepper', 'banana']]
+
+    def test_marian_keeps_separators_and_adds_language_token(self):
+        """Test sentences are translated individually and reassembled around their separators."""
+        marian = MarianTranslationBackend()
+        with patch.object(marian, '_generate', side_effect=lambda model, sentences: [f"<{s}>" for s in sentences]) as generate:
+            result = marian.translate_batch(["Sow now. Water daily.", "Harvest."], 'ta', 'en')
+        
+        assert result == ["<>>tam<< Sow now.> <>>tam<< Water daily.>", "<>>tam<< Harvest.>"]
+        assert generate.call_args.args[0] == 'Helsinki-NLP/opus-mt-en-dra'
+
+    def test_slow_marian_falls_back_to_google(self):
+        """Test a model call that exceeds the timeout is answered by the fallback backend."""
+        marian = MarianTranslationBackend()
+        marian.timeout = 0.05
+        google = Mock()
+        google.translate_batch.return_value = ['നമസ്കാരം']
+        backend = FallbackTranslationBackend(marian, google)
+        
+        with patch.object(marian, '_generate', side_effect=lambda model, sentences: time.sleep(0.5) or sentences):
+            assert backend.translate_batch(['Hello'], 'ml', 'en') == ['നമസ്കാരം']
+        
+        google.translate_batch.assert_called_once_with(['Hello'], 'ml', 'en')
+
+    def test_warm_up_loads_models_through_their_batchers(self):
+        """Test warm-up runs each model for the configured languages once before traffic."""
+        marian = MarianTranslationBackend()
+        marian.warmup_languages = ['ml']
+        
+        with patch.object(marian, '_generate', side_effect=lambda model, sentences: sentences) as generate:
+            FallbackTranslationBackend(marian, Mock()).warm_up()
+        
+        assert sorted(call.args[0] for call in generate.call_args_list) == [
+            'Helsinki-NLP/opus-mt-en-ml', 'Helsinki-NLP/opus-mt-ml-en'
+        ]
+        assert set(marian._batchers) == {'Helsinki-NLP/opus-mt-en-ml', 'Helsinki-NLP/opus-mt-ml-en'}
+
 class TestWeatherService:
     def test_weather_service_initialization(self):
         """Test weather service initialization."""
@@ -64,4 +588,594 @@ class TestWeatherService:
         advice = weather_service._get_farming_advice(20, 30, 25)
         assert "drainage" in advice.lower()
 
+    def test_weather_service_reuses_pooled_session(self):
+        """Test weather requests go through one keep-alive session."""
+        weather_service = WeatherService()
+        adapter = weather_service.session.get_adapter(weather_service.base_url)
+        assert adapter._pool_maxsize == 20
+
+class TestAudioService:
+    @patch('speech_recognition.Recognizer.recognize_google', return_value=' hello ')
+    def test_speech_to_text_from_bytes(self, mock_recognize):
+        """Test uploads are decoded from memory, downsampled and trimmed to speech."""
+        silence = b'\x00\x00\x00\x00' * 44100
+        tone = (b'\x00\x20\x00\x20' * 50 + b'\x00\xe0\x00\xe0' * 50) * 441
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(2)
+            wav.setsampwidth(2)
+            wav.setframerate(44100)
+            wav.writeframes(silence + tone + silence)
+        
+        assert AudioService().speech_to_text(buffer.getvalue(), 'ml') == 'hello'
+        
+        audio = mock_recognize.call_args.args[0]
+        assert (audio.sample_rate, audio.sample_width) == (16000, 2)
+        assert len(audio.frame_data) < 16000 * 2 * 1.5
+        assert mock_recognize.call_args.kwargs['language'] == 'ml-IN'
+
+    def test_silent_audio_skips_recognition(self):
+        """Test uploads without speech never reach the recognizer."""
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(b'\x00\x00' * 16000)
+        
+        with patch('speech_recognition.Recognizer.recognize_google') as mock_recognize:
+            assert AudioService().speech_to_text(buffer.getvalue()) is None
+        mock_recognize.assert_not_called()
+
+    def test_segments_are_recognized_in_parallel_and_kept_in_order(self):
+        """Test long recordings are transcribed concurrently with ordered partials."""
+        segments = [{'start': i * 10.0, 'end': i * 10.0 + 8, 'audio': f"segment {i}"} for i in range(3)]
+        delays = {'segment 0': 0.1, 'segment 1': 0.3, 'segment 2': 0.2}
+        
+        def recognize(audio, language):
+            time.sleep(delays[audio])
+            return audio.replace('segment', 'part')
+        
+        partials = []
+        audio_service = AudioService()
+        with patch('app.services.audio_service.audio_preprocessor.process', return_value=segments), \
+             patch.object(audio_service.speech_backend, 'recognize', side_effect=recognize):
+            started = time.monotonic()
+            transcript = audio_service.transcribe(b'voice note', 'ml', on_partial=partials.append)
+            elapsed = time.monotonic() - started
+        
+        assert transcript['text'] == 'part 0 part 1 part 2'
+        assert transcript['segments'][1] == {'start': 10.0, 'end': 18.0, 'text': 'part 1'}
+        assert partials == ['part 0']
+        assert elapsed < 0.5
+
+    def test_failed_segment_is_marked_and_the_rest_kept(self):
+        """Test a recognizer error on one segment does not lose the whole transcript."""
+        import speech_recognition as sr
+        
+        segments = [{'start': i * 10.0, 'end': i * 10.0 + 8, 'audio': f"segment {i}"} for i in range(3)]
+        
+        def recognize(audio, language):
+            if audio == 'segment 1':
+                raise sr.RequestError('quota exceeded')
+            return audio.replace('segment', 'part')
+        
+        audio_service = AudioService()
+        with patch('app.services.audio_service.audio_preprocessor.process', return_value=segments), \
+             patch.object(audio_service.speech_backend, 'recognize', side_effect=recognize):
+            transcript = audio_service.transcribe(b'voice note', 'ml')
+        
+        assert transcript['text'] == 'part 0 part 2'
+        assert transcript['segments'][1] == {'start': 10.0, 'end': 18.0, 'text': '', 'failed': True}
+
+    def test_synthesis_failure_leaves_no_spool_files(self, tmp_path):
+        """Test the TTS spool file is removed when synthesis fails."""
+        audio_service = AudioService()
+        audio_service.tts_pool = Mock()
+        audio_service.tts_pool.engine.side_effect = RuntimeError("no engine")
+        
+        with patch.dict(os.environ, {'AUDIO_SPOOL_DIR': str(tmp_path)}):
+            assert audio_service.text_to_speech("Water the paddy", 'en') is None
+        assert os.listdir(tmp_path) == []
+
+    def test_synthesis_runs_off_the_hub(self, tmp_path):
+        """Test the blocking pyttsx3 run goes through run_blocking on the checked-out engine."""
+        audio_service = AudioService()
+        engine = Mock()
+        engine.save_to_file.side_effect = lambda text, path: open(path, 'wb').write(b'RIFF')
+        audio_service.tts_pool = MagicMock()
+        audio_service.tts_pool.engine.return_value.__enter__.return_value = engine
+        
+        with patch.dict(os.environ, {'AUDIO_SPOOL_DIR': str(tmp_path)}), \
+             patch('app.services.audio_service.run_blocking', side_effect=lambda fn, *args: fn(*args)) as offload:
+            assert audio_service.synthesize("Water the paddy", 'en') == b'RIFF'
+        
+        assert offload.call_args.args[:3] == (AudioService._speak, engine, "Water the paddy")
+        engine.runAndWait.assert_called_once()
+
+class TestSpeechBackends:
+    def test_offline_backend_falls_back_without_a_model(self, tmp_path):
+        """Test languages without a local Vosk model use the fallback backend."""
+        vosk = VoskSpeechBackend()
+        vosk.model_dir = str(tmp_path)
+        (tmp_path / 'hi').mkdir()
+        fallback = Mock()
+        fallback.recognize.return_value = 'online'
+        backend = FallbackSpeechBackend(vosk, fallback)
+        
+        with patch.object(vosk, 'recognize', return_value='offline'):
+            assert backend.recognize('audio', 'hi') == 'offline'
+            assert backend.recognize('audio', 'ml') == 'online'
+    
+    def test_vosk_decode_runs_off_the_hub(self):
+        """Test the CPU-bound Vosk decode is handed to run_blocking."""
+        vosk_module = MagicMock()
+        vosk_module.KaldiRecognizer.return_value.FinalResult.return_value = '{"text": " nellu "}'
+        vosk = VoskSpeechBackend()
+        vosk._models['ml'] = Mock()
+        audio = Mock(sample_rate=16000)
+        
+        with patch.dict('sys.modules', {'vosk': vosk_module}), \
+             patch('app.services.speech_backends.run_blocking', side_effect=lambda fn, *args: fn(*args)) as offload:
+            assert vosk.recognize(audio, 'ml') == 'nellu'
+        
+        assert offload.call_args.args[0] == VoskSpeechBackend._decode
+        vosk_module.KaldiRecognizer.return_value.AcceptWaveform.assert_called_once()
+
+class TestTTSCache:
+    def test_clips_are_cached_and_evicted_oldest_first(self, tmp_path):
+        """Test clips are stored by content key and the size cap evicts LRU clips."""
+        tts_cache = TTSCache()
+        tts_cache.cache_dir = str(tmp_path)
+        tts_cache.format = 'wav'
+        tts_cache.max_bytes = 2500
+        
+        keys = [TTSCache.key(f"alert {i}", 'ml', 'malayalam', 150) for i in range(3)]
+        tts_cache.put(keys[0], b'0' * 1000)
+        tts_cache.put(keys[1], b'1' * 1000)
+        os.utime(tts_cache.get(keys[1])['path'], (1, 1))
+        tts_cache.put(keys[2], b'2' * 1000)
+        
+        assert tts_cache.get(keys[1]) is None
+        assert tts_cache.get(keys[0])['mimetype'] == 'audio/wav'
+        assert tts_cache.get('../etc/passwd') is None
+    
+    def test_size_is_shared_between_workers_and_recent_clips_survive(self, tmp_path):
+        """Test the cap holds across worker processes and eviction spares clips still in use."""
+        workers = [TTSCache(), TTSCache()]
+        for worker in workers:
+            worker.cache_dir = str(tmp_path)
+            worker.format = 'wav'
+            worker.max_bytes = 2500
+        
+        old = TTSCache.key('old', 'ml', 'malayalam', 150)
+        workers[0].put(old, b'0' * 1000)
+        os.utime(workers[0].get(old)['path'], (1, 1))
+        workers[1].put(TTSCache.key('new 1', 'ml', 'malayalam', 150), b'1' * 1000)
+        workers[0].put(TTSCache.key('new 2', 'ml', 'malayalam', 150), b'2' * 1000)
+        
+        # Over the cap from the second worker's writes: only the stale clip may go
+        assert workers[0].get(old) is None
+        
+        workers[1].put(TTSCache.key('new 3', 'ml', 'malayalam', 150), b'3' * 1000)
+        assert len([p for p in tmp_path.rglob('*.wav')]) == 3
+        assert (tmp_path / '.size').read_text() == '3000'
+    
+    @patch('app.services.tts_cache.shutil.which', return_value=None)
+    def test_missing_ffmpeg_switches_to_wav_once(self, mock_which):
+        """Test the cache format falls back to WAV at startup when ffmpeg is absent."""
+        tts_cache = TTSCache()
+        tts_cache.format = 'mp3'
+        
+        with patch('app.services.tts_cache.logger') as mock_logger:
+            tts_cache.check_encoder()
+            tts_cache.check_encoder()
+        
+        assert tts_cache.format == 'wav'
+        assert mock_logger.warning.call_count == 1
+
+class TestAudioStream:
+    def test_wav_clips_stream_as_one_wav(self, tmp_path):
+        """Test per-sentence WAV clips are joined under a single streaming header."""
+        clips = []
+        for i in range(2):
+            path = str(tmp_path / f"{i}.wav")
+            with wave.open(path, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(16000)
+                wav.writeframes(b'\x01\x00' * 100)
+            clips.append({'path': path, 'format': 'wav'})
+        
+        stream = b''.join(iter_binary_audio(clips[0], iter(clips[1:])))
+        
+        with wave.open(io.BytesIO(stream), 'rb') as wav:
+            assert wav.getframerate() == 16000
+            assert len(wav.readframes(1000)) == 400
+
+    def test_mp3_stream_skips_clips_in_another_format(self, tmp_path):
+        """Test a WAV fallback clip is not spliced into an MP3 stream and Opus is refused."""
+        clips = []
+        for name, audio_format in [('0.mp3', 'mp3'), ('1.wav', 'wav'), ('2.mp3', 'mp3')]:
+            (tmp_path / name).write_bytes(name.encode('ascii'))
+            clips.append({'path': str(tmp_path / name), 'format': audio_format})
+        
+        assert b''.join(iter_binary_audio(clips[0], iter(clips[1:]))) == b'0.mp32.mp3'
+        with pytest.raises(ValueError):
+            list(iter_binary_audio({'path': clips[0]['path'], 'format': 'opus'}, iter([])))
+
+    def test_binary_opus_reply_falls_back_to_multipart(self, tmp_path):
+        """Test Opus clips, which cannot be chained into one stream, are sent as separate parts."""
+        from app.api.chat import _stream_audio
+        
+        clips = []
+        for i in range(2):
+            (tmp_path / f"{i}.ogg").write_bytes(b'OggS' + bytes([i]))
+            clips.append({'key': str(i), 'path': str(tmp_path / f"{i}.ogg"), 'format': 'opus', 'mimetype': 'audio/ogg'})
+        metadata = {'text_message': 'വളം?', 'text_response': 'ഇടാം.', 'session_id': 's1',
+                    'language': 'ml', 'source': 'llm'}
+        
+        with patch('app.api.chat._clip_url', side_effect=lambda clip: f"/clips/{clip['key']}"):
+            with Flask(__name__).app_context():
+                response = _stream_audio(7, metadata, iter(clips), 'binary')
+                body = b''.join(response.response)
+        
+        assert response.mimetype == 'multipart/mixed'
+        assert body.count(b'Content-Type: audio/ogg') == 2
+        assert b'OggS\x00' in body and b'OggS\x01' in body
+
+    @patch('app.api.chat.chat_jobs')
+    def test_binary_reply_keeps_long_text_out_of_headers(self, mock_jobs):
+        """Test binary mode sends a bounded preview and stores the full text under a reply ID."""
+        from app.api.chat import HEADER_TEXT_LIMIT, _stream_audio
+        
+        mock_jobs.create.return_value = 'reply-1'
+        reply = 'നെല്ലിന് ഇപ്പോൾ വളം ഇടാം. ' * 100
+        metadata = {'text_message': 'വളം?', 'text_response': reply, 'session_id': 's1',
+                    'language': 'ml', 'source': 'llm'}
+        clip = {'path': '/dev/null', 'format': 'mp3', 'mimetype': 'audio/mpeg'}
+        
+        with Flask(__name__).app_context():
+            response = _stream_audio(7, metadata, iter([clip]), 'binary')
+        
+        assert len(response.headers['X-Text-Response']) <= HEADER_TEXT_LIMIT
+        assert response.headers['X-Reply-Id'] == 'reply-1'
+        assert mock_jobs.create.call_args.args == (7, 'audio_reply')
+        assert mock_jobs.create.call_args.kwargs['text_response'] == reply
+
+class TestTTSEnginePool:
+    @patch('pyttsx3.engine.Engine')
+    def test_engines_are_reused_with_precomputed_voices(self, mock_engine):
+        """Test engines are built once and voices resolved without rescanning."""
+        english, malayalam = Mock(id='en-us'), Mock(id='malayalam')
+        english.name, malayalam.name = 'English', 'Malayalam'
+        mock_engine.return_value.getProperty.return_value = [english, malayalam]
+        pool = TTSEnginePool(size=1)
+        
+        with pool.engine('ml') as engine:
+            engine.setProperty.assert_called_with('voice', 'malayalam')
+        with pool.engine('en') as engine:
+            engine.setProperty.assert_called_with('voice', 'en-us')
+        
+        assert mock_engine.call_count == 1
+        assert engine.getProperty.call_count == 1
+    
+    @patch.dict(os.environ, {'TTS_DRIVER': 'espeak'})
+    def test_espeak_pool_is_limited_to_one_engine(self):
+        """Test the espeak driver never runs engines side by side."""
+        assert TTSEnginePool(size=4).size == 1
+    
+    @patch.dict(os.environ, {'TTS_DRIVER': 'sapi5'})
+    def test_other_drivers_keep_pool_size(self):
+        """Test drivers without process-global state keep the configured pool size."""
+        assert TTSEnginePool(size=4).size == 4
+
+class TestCacheManager:
+    def test_invalidates_tag_members_in_chunks_without_keys(self):
+        """Test tag invalidation and pattern clearing delete in chunks and never call KEYS."""
+        cache = CacheManager()
+        cache.redis = MagicMock()
+        cache.chunk_size = 2
+        cache.redis.sscan_iter.return_value = iter([b'cache:1', b'cache:2', b'cache:3'])
+        cache.redis.scan_iter.return_value = iter([b'tmp:1'])
+        pipe = cache.redis.pipeline.return_value
+        pipe.__len__.return_value = 1
+        pipe.execute.side_effect = [[2, 1], [1]]
+        
+        assert cache.invalidate_tags('policies') == 3
+        assert cache.clear_pattern('tmp:*') == 1
+        
+        cache.redis.rename.assert_called_once()
+        assert cache.redis.rename.call_args[0][0] == 'cache:tag:policies'
+        pipe.unlink.assert_any_call(b'cache:1', b'cache:2')
+        pipe.unlink.assert_any_call(b'cache:3')
+        cache.redis.keys.assert_not_called()
+
+class TestChatHistory:
+    def test_recent_window_is_read_without_decoding_the_session(self):
+        """Test the session blob is decoded once, then windows come from the trimmed Redis list."""
+        with patch('app.services.chat_history.redis_client', fakeredis.FakeRedis()):
+            history = ChatHistoryCache()
+        history.size = 3
+        exchanges = [{'user_message': f"q{i}", 'bot_response': f"a{i}"} for i in range(5)]
+        chat_session = Mock(user_id=7, session_id='s1')
+        chat_session.get_recent_messages.side_effect = lambda limit: exchanges[-limit:]
+        
+        assert history.recent(chat_session, 2) == exchanges[3:]
+        history.append(chat_session, {'user_message': 'q5', 'bot_response': 'a5'})
+        
+        assert [e['user_message'] for e in history.recent(chat_session, 10)] == ['q3', 'q4', 'q5']
+        assert chat_session.get_recent_messages.call_count == 1
+    
+    def test_zero_limit_returns_nothing(self):
+        """Test a zero history window is empty rather than the whole cached list."""
+        with patch('app.services.chat_history.redis_client', fakeredis.FakeRedis()):
+            history = ChatHistoryCache()
+        chat_session = Mock(user_id=7, session_id='s3')
+        chat_session.get_recent_messages.return_value = [{'user_message': 'q0'}]
+        history.recent(chat_session, 5)
+        
+        assert history.recent(chat_session, 0) == []
+    
+    def test_add_message_appends_without_decoding(self):
+        """Test new exchanges are spliced into the stored JSON array without parsing it."""
+        from app.models.chat import ChatSession
+        
+        chat_session = ChatSession(session_id='s1', user_id=7)
+        with patch('app.models.chat.json.loads', side_effect=AssertionError('decoded')):
+            for i in range(3):
+                chat_session.add_message(f"q{i}", f"a{i}")
+        
+        assert [m['user_message'] for m in chat_session.get_messages()] == ['q0', 'q1', 'q2']
+        assert chat_session.get_recent_messages(1)[0]['bot_response'] == 'a2'
+    
+    def test_append_to_uncached_session_waits_for_next_read(self):
+        """Test appends never start a partial window for a session that is not cached."""
+        with patch('app.services.chat_history.redis_client', fakeredis.FakeRedis()):
+            history = ChatHistoryCache()
+        chat_session = Mock(user_id=7, session_id='s2')
+        chat_session.get_recent_messages.return_value = [{'user_message': 'q0'}, {'user_message': 'q1'}]
+        
+        history.append(chat_session, {'user_message': 'q1'})
+        
+        assert history.recent(chat_session, 10) == [{'user_message': 'q0'}, {'user_message': 'q1'}]
+
+class TestChatJobs:
+    @pytest.fixture
+    def store(self):
+        with patch('app.services.chat_job_service.redis_client', fakeredis.FakeRedis()):
+            store = ChatJobStore()
+        store.poll_interval = 0.01
+        return store
+    
+    def test_updates_bump_the_version(self, store):
+        """Test jobs keep their fields across updates and every write bumps the version."""
+        job_id = store.create(7, 'text', session_id='s1')
+        store.update(job_id, status='running', stage='generating')
+        
+        job = store.get(job_id)
+        assert (job['user_id'], job['session_id'], job['stage'], job['version']) == (7, 's1', 'generating', 2)
+        assert store.get('missing') is None
+    
+    def test_wait_is_capped(self, store):
+        """Test a long-poll never holds the caller longer than max_wait."""
+        store.max_wait = 0.1
+        job_id = store.create(7, 'text')
+        
+        started = time.monotonic()
+        job = store.wait(job_id, timeout=25)
+        
+        assert time.monotonic() - started < 1
+        assert job['status'] == 'queued'
+    
+    def test_wait_returns_finished_jobs_at_once(self, store):
+        """Test a finished job is returned without waiting."""
+        job_id = store.create(7, 'text')
+        store.update(job_id, status='completed', stage='completed')
+        
+        started = time.monotonic()
+        assert store.wait(job_id, since=99, timeout=2)['status'] == 'completed'
+        assert time.monotonic() - started < 0.5
+    
+    def test_audio_jobs_run_every_stage_in_order(self):
+        """Test audio jobs are transcribed first and synthesized before being saved."""
+        from app.tasks.chat_tasks import build_chat_pipeline
+        
+        stages = [task.task.rsplit('.', 1)[1] for task in build_chat_pipeline({'kind': 'audio'}).tasks]
+        assert stages == ['transcribe_chat_audio', 'translate_chat_input', 'generate_chat_response',
+                          'translate_chat_output', 'synthesize_chat_audio', 'save_chat_exchange']
+        assert 'synthesize_chat_audio' not in str(build_chat_pipeline({'kind': 'text'}))
+    
+    @patch('app.tasks.chat_tasks.chat_jobs')
+    @patch('app.tasks.chat_tasks.get_service')
+    def test_output_stage_publishes_translation(self, mock_get_service, mock_jobs):
+        """Test the translated answer is published before the next stage runs."""
+        from app.tasks.chat_tasks import translate_chat_output
+        
+        mock_get_service.return_value.translate.return_value = 'മറുപടി'
+        payload = translate_chat_output({'job_id': 'j1', 'language': 'ml', 'english_response': 'Reply'})
+        
+        assert payload['response'] == 'മറുപടി'
+        mock_jobs.update.assert_called_with('j1', response='മറുപടി')
+    
+    @patch('app.tasks.chat_tasks.chat_jobs')
+    @patch('app.tasks.chat_tasks.get_service')
+    def test_failed_stage_fails_the_job_and_stops_the_chain(self, mock_get_service, mock_jobs):
+        """Test a stage error marks the job failed and ends the chain without a retry."""
+        from celery.exceptions import Ignore
+        from app.tasks.chat_tasks import translate_chat_output
+        
+        mock_get_service.return_value.translate.side_effect = RuntimeError('quota')
+        with pytest.raises(Ignore):
+            translate_chat_output({'job_id': 'j1', 'language': 'ml', 'english_response': 'Reply'})
+        
+        mock_jobs.fail.assert_called_once_with('j1', 'translation failed')
+    
+    def test_poll_endpoint(self, store):
+        """Test unfinished jobs carry Retry-After and other users' jobs are hidden."""
+        from flask_jwt_extended import JWTManager, create_access_token
+        from app.api.chat import chat_bp
+        
+        app = Flask(__name__)
+        app.config['JWT_SECRET_KEY'] = 'test'
+        JWTManager(app)
+        app.register_blueprint(chat_bp, url_prefix='/api/chat')
+        store.max_wait = 0.05
+        job_id = store.create('7', 'text')
+        
+        with app.app_context():
+            owner = {'Authorization': f"Bearer {create_access_token(identity='7')}"}
+            other = {'Authorization': f"Bearer {create_access_token(identity='8')}"}
+        
+        with patch('app.api.chat.chat_jobs', store):
+            client = app.test_client()
+            running = client.get(f"/api/chat/jobs/{job_id}?wait=25", headers=owner)
+            hidden = client.get(f"/api/chat/jobs/{job_id}", headers=other)
+            store.update(job_id, status='completed', stage='completed')
+            done = client.get(f"/api/chat/jobs/{job_id}", headers=owner)
+        
+        assert running.status_code == 200 and running.headers['Retry-After'] == '1'
+        assert hidden.status_code == 404
+        assert done.get_json()['status'] == 'completed' and 'Retry-After' not in done.headers
+
+class TestLLMConcurrencyLimiter:
+    @pytest.fixture
+    def limiter(self):
+        with patch('app.utils.concurrency.redis_client', fakeredis.FakeRedis()):
+            limiter = LLMConcurrencyLimiter('test')
+        limiter.max_concurrent = 1
+        limiter.max_wait = 0
+        return limiter
+    
+    def _position(self, limiter, ticket):
+        return limiter._acquire_script(
+            keys=[limiter.holders_key, limiter.deadlines_key] + limiter.queue_keys,
+            args=[ticket, limiter.max_concurrent, limiter._now_ms(), limiter.lease_seconds * 1000]
+        )
+    
+    def test_global_cap(self, limiter):
+        """Test calls beyond the cap are refused until a slot is released."""
+        ticket = limiter.acquire(user_id=1)
+        assert ticket
+        
+        with pytest.raises(LLMBusyError):
+            limiter.acquire(user_id=2)
+        
+        limiter.release(ticket, user_id=1)
+        assert limiter.acquire(user_id=2)
+        assert limiter.queue_length() == 0
+    
+    def test_interactive_calls_go_before_background(self, limiter):
+        """Test an interactive call queued later is served before a background one."""
+        limiter.acquire(user_id=1)
+        background = limiter._enqueue(2, 'background')
+        interactive = limiter._enqueue(3, 'interactive')
+        
+        assert self._position(limiter, interactive) == 1
+        assert self._position(limiter, background) == 2
+    
+    def test_users_second_call_queues_behind_others(self, limiter):
+        """Test a user's extra outstanding calls wait behind other users' first calls."""
+        limiter.acquire(user_id=1)
+        second = limiter._enqueue(2, 'interactive')
+        third = limiter._enqueue(2, 'interactive')
+        other = limiter._enqueue(3, 'interactive')
+        
+        assert [self._position(limiter, t) for t in (second, other, third)] == [1, 2, 3]
+    
+    def test_slot_is_released_on_exception(self, limiter):
+        """Test a failing call gives its slot and its per-user count back."""
+        with pytest.raises(ValueError):
+            with limiter.slot(user_id=1):
+                raise ValueError('provider error')
+        
+        assert limiter.redis.zcard(limiter.holders_key) == 0
+        assert limiter.redis.get(f"{limiter.user_key_prefix}1") is None
+        assert limiter.acquire(user_id=2)
+    
+    def test_late_release_never_goes_negative(self, limiter):
+        """Test releasing after the per-user counter expired leaves no negative count."""
+        ticket = limiter.acquire(user_id=1)
+        limiter.redis.delete(f"{limiter.user_key_prefix}1")
+        
+        limiter.release(ticket, user_id=1)
+        limiter.release(ticket, user_id=1)
+        
+        assert limiter.redis.get(f"{limiter.user_key_prefix}1") is None
+        
+        limiter.acquire(user_id=1)
+        assert int(limiter.redis.get(f"{limiter.user_key_prefix}1")) == 1
+
+    def test_release_wakes_the_next_waiter(self, limiter):
+        """Test a waiter next in line gets a released slot without sitting out its backoff."""
+        import threading
+        
+        limiter.max_wait = 3
+        limiter.poll_interval = limiter.max_poll_interval = 2
+        ticket = limiter.acquire(user_id=1)
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append((limiter.acquire(user_id=2), time.monotonic())))
+        waiter.start()
+        
+        time.sleep(0.2)
+        released = time.monotonic()
+        limiter.release(ticket, user_id=1)
+        waiter.join(timeout=5)
+        
+        assert acquired and acquired[0][0]
+        assert acquired[0][1] - released < 0.5
+    
+    def test_waiters_back_off(self, limiter):
+        """Test queued waiters re-run the acquire script a handful of times, not every 50 ms."""
+        limiter.acquire(user_id=1)
+        limiter.max_wait = 1
+        script = limiter._acquire_script
+        limiter._acquire_script = Mock(side_effect=script)
+        
+        with pytest.raises(LLMBusyError):
+            limiter.acquire(user_id=2)
+        
+        assert limiter._acquire_script.call_count <= 10
+
+class TestMetricsEndpoints:
+    def _client(self):
+        from app.api.metrics import metrics_bp
+        
+        app = Flask(__name__)
+        app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+        return app.test_client()
+    
+    @patch.dict(os.environ, {'METRICS_TOKEN': ''})
+    def test_endpoints_are_closed_without_a_token(self):
+        """Test metrics and cost rollups are not served when no token is configured."""
+        client = self._client()
+        
+        assert client.get('/api/metrics').status_code == 404
+        assert client.get('/api/metrics/costs').status_code == 404
+    
+    @patch.dict(os.environ, {'METRICS_TOKEN': 'secret'})
+    @patch('app.api.metrics.metrics')
+    def test_endpoints_require_the_token(self, mock_metrics):
+        """Test the bearer token is checked before any metrics are returned."""
+        mock_metrics.cost_rollup.return_value = [{'user_id': 1, 'cost_usd': 0.5}]
+        client = self._client()
+        
+        assert client.get('/api/metrics/costs').status_code == 401
+        assert client.get('/api/metrics/costs', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        
+        response = client.get('/api/metrics/costs', headers={'Authorization': 'Bearer secret'})
+        assert response.status_code == 200
+        assert response.get_json()['costs'] == [{'user_id': 1, 'cost_usd': 0.5}]
+
+class TestServiceRegistry:
+    def test_returns_one_instance_per_process(self):
+        """Test services are built once and rebuilt after a fork."""
+        registry = ServiceRegistry()
+        weather_service = registry.get('weather')
+        
+        assert registry.get('weather') is weather_service
+        
+        with patch('app.services.registry.os.getpid', return_value=-1):
+            assert registry.get('weather') is not weather_service
+
 # ========================================
\ No newline at end of file